@@ -0,0 +1,249 @@
+import asyncio
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def normalize_question(question: str) -> str:
+    """
+    Cache key for a question: case-folded, punctuation removed,
+    whitespace collapsed. "What is Java?" and "what is  java" share a key.
+    """
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = "".join(
+        " " if unicodedata.category(ch).startswith("P") else ch
+        for ch in text
+    )
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache for LLM generations.
+
+    - Memory tier: LRU bounded by `max_entries`, entries expire after `ttl`
+      seconds.
+    - Optional persistent tier: any object with get(key) -> str | None and
+      set(key, answer, ttl) (e.g. database.answer_store.MongoAnswerStore).
+      Persistent hits are promoted to memory.
+
+    get_or_compute(_async) coalesces concurrent misses for the same key
+    (single-flight): one caller computes, the others wait for its result.
+    Both variants share one in-flight map, so a sync and an async caller
+    asking the same question also compute it once. Failed computations are
+    not cached and are re-raised to every waiter.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 7 * 24 * 3600, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> concurrent.futures.Future of the computation in progress
+        self._inflight = {}
+
+        self.stats = {
+            "hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    # -------------------------------------------------
+    # Memory tier
+    # -------------------------------------------------
+    def _get_memory(self, key: str) -> str | None:
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _put_memory(self, key: str, answer: str):
+        # Caller holds self._lock
+        self._entries[key] = (answer, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str) -> str | None:
+        """
+        Memory-tier lookup only (never blocks on the persistent tier).
+        """
+        with self._lock:
+            return self._get_memory(normalize_question(question))
+
+    async def get_async(self, question: str) -> str | None:
+        """
+        Two-tier lookup without computing: the memory tier, then the
+        persistent tier in a worker thread. Persistent hits are promoted
+        to memory.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            answer = self._get_memory(key)
+            if answer is not None:
+                self.stats["hits"] += 1
+                return answer
+
+        if self.store is None:
+            return None
+        answer = await asyncio.to_thread(self._load_persistent, key)
+        if answer is not None:
+            self._count("persistent_hits")
+            self._remember(key, answer)
+        return answer
+
+    # -------------------------------------------------
+    # Lookup + compute
+    # -------------------------------------------------
+    def put(self, question: str, answer: str):
+        """
+        Store an answer computed outside get_or_compute (e.g. a streamed
+        generation) in both tiers.
+        """
+        key = normalize_question(question)
+        self._remember(key, answer)
+        self._persist(key, answer)
+
+    def _load_persistent(self, key: str) -> str | None:
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            print("Answer cache store read failed:", e)
+            return None
+
+    def _remember(self, key: str, answer: str):
+        with self._lock:
+            self._put_memory(key, answer)
+
+    def _persist(self, key: str, answer: str):
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, answer, self.ttl)
+        except Exception as e:
+            print("Answer cache store write failed:", e)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_or_compute(self, question: str, compute) -> str:
+        """
+        Cached answer for `question`, or compute() it once for all
+        concurrent callers asking the same question.
+        """
+        key = normalize_question(question)
+
+        with self._lock:
+            answer = self._get_memory(key)
+            if answer is not None:
+                self.stats["hits"] += 1
+                return answer
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            return flight.result()
+
+        try:
+            answer = self._load_persistent(key)
+            computed = answer is None
+            if computed:
+                self._count("misses")
+                answer = compute()
+            else:
+                self._count("persistent_hits")
+            self._remember(key, answer)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+        # Release waiters before the persistent write
+        flight.set_result(answer)
+        if computed:
+            self._persist(key, answer)
+        return answer
+
+    async def get_or_compute_async(self, question: str, compute) -> str:
+        """
+        Async variant of get_or_compute; `compute` is an async callable.
+        Persistent-tier I/O runs in a worker thread.
+        """
+        key = normalize_question(question)
+
+        with self._lock:
+            answer = self._get_memory(key)
+            if answer is not None:
+                self.stats["hits"] += 1
+                return answer
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            # Cancelling this waiter must not cancel the shared flight
+            return await asyncio.shield(asyncio.wrap_future(flight))
+
+        try:
+            answer = None
+            if self.store is not None:
+                answer = await asyncio.to_thread(self._load_persistent, key)
+            computed = answer is None
+            if computed:
+                self._count("misses")
+                answer = await compute()
+            else:
+                self._count("persistent_hits")
+            self._remember(key, answer)
+        except asyncio.CancelledError:
+            flight.set_exception(RuntimeError("Answer computation was cancelled"))
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+        # Release waiters before the persistent write
+        flight.set_result(answer)
+        if computed and self.store is not None:
+            await asyncio.to_thread(self._persist, key, answer)
+        return answer
+
+    def snapshot(self) -> dict:
+        """
+        Counters plus the current memory-tier size.
+        """
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
@@ -1,52 +1,198 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from agents.pair_store import PairStore, ShardedPairStore
+from agents.state_log import load_array, read_json, save_array, write_json
+from metrics import timed
+
+
+def _factorize(values) -> tuple:
+    """
+    Map ids to dense integer codes in first-seen order.
+    Returns (unique ids as an object array, int64 code per value).
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in np.asarray(values).tolist()),
+        dtype=np.int64,
+        count=len(values)
+    )
+    uniques = np.empty(len(index), dtype=object)
+    uniques[:] = list(index)
+    return uniques, codes
+
+
 class BKTEngine:
     """
     Bayesian Knowledge Tracing (BKT) engine for tracking
     student mastery of individual skills.
+
+    Safe to share between threads: state is sharded by student id and
+    each shard has its own lock, so updates for students in different
+    shards do not serialize.
+
+    `params` maps skill_id -> {"p_init", "p_learn", "p_guess", "p_slip"}
+    (e.g. fitted by agents.bkt_fit); skills without an entry use the
+    default parameters below.
+
+    With a `log` (agents.state_log.StateLog), every change is appended as
+    ("bkt", student_id, skill_id, is_correct, mastery), is_correct being
+    None for initialize_skill; save_state / load_state / replay restore
+    the state from it.
+
+    With `shared` (an agents.shared_state.SharedRegion), the mastery
+    arrays live in that region, shared with other processes, and the
+    shard locks exclude those processes too.
+
+    `on_change(student_id, skill_id, mastery)` is called with the
+    unrounded state after every initialize_skill / update_skill, under
+    the student's shard lock, so a pair's changes arrive in the order
+    they were applied (e.g. to queue them for persistence).
     """
 
-    def __init__(self):
+    log_kind = "bkt"
+
+    def __init__(
+        self,
+        dtype=np.float64,
+        loader=None,
+        max_students: int | None = None,
+        n_shards: int = 16,
+        params: dict | None = None,
+        log=None,
+        shared=None,
+        on_change=None
+    ):
         # BKT parameters
         self.p_init = 0.2
         self.p_learn = 0.1
         self.p_guess = 0.2
         self.p_slip = 0.1
 
-        # In-memory knowledge state
-        self.knowledge_state = {}
+        # Per-skill overrides
+        self.skill_params = params or {}
 
+        # In-memory knowledge state: (student_id, skill_id) -> mastery,
+        # backed by dense float arrays (float64 or float32), one per shard
+        self.shared = shared
+        if shared is None:
+            self.knowledge_state = ShardedPairStore(n_shards=n_shards, dtype=dtype)
+            self._locks = [threading.RLock() for _ in range(n_shards)]
+        else:
+            self.knowledge_state = shared.sharded_store("bkt", n_shards, dtype)
+            self._locks = [shared.lock(f"bkt-{i:03d}") for i in range(n_shards)]
+
+        # Lazy paging: `loader(student_id)` returns the persisted
+        # {skill_id: mastery} rows of a student and is called the first time
+        # the student is touched. About `max_students` students stay
+        # resident (the bound is split evenly across shards); the least
+        # recently used ones are evicted.
+        self.loader = loader
+        self.max_students = max_students
+        self._resident = [OrderedDict() for _ in range(n_shards)]
+
+        # Write-ahead log, appended to under the shard lock
+        self.log = log
+        self.on_change = on_change
+
+    def _touch(self, student_id: str, evict: bool = True):
+        """
+        Mark a student as recently used, paging its state in if needed.
+        Caller must hold the student's shard lock.
+        """
+        if self.loader is None and self.max_students is None:
+            return
+
+        shard = self.knowledge_state.shard_index(student_id)
+        resident = self._resident[shard]
+
+        if student_id in resident:
+            resident.move_to_end(student_id)
+        else:
+            resident[student_id] = True
+            if self.loader is not None:
+                for skill_id, mastery in self.loader(student_id).items():
+                    key = (student_id, skill_id)
+                    if key not in self.knowledge_state:
+                        self.knowledge_state[key] = mastery
+
+        if evict:
+            self._evict(shard)
+
+    def _evict(self, shard: int):
+        if self.max_students is None:
+            return
+        resident = self._resident[shard]
+        limit = -(-self.max_students // len(self._resident))
+        while len(resident) > limit:
+            student_id, _ = resident.popitem(last=False)
+            self.knowledge_state.shards[shard].drop_student(student_id)
+
+    def params_for(self, skill_id: str) -> tuple:
+        """
+        (p_init, p_learn, p_guess, p_slip) of a skill.
+        """
+        params = self.skill_params.get(skill_id)
+        if params is None:
+            return self.p_init, self.p_learn, self.p_guess, self.p_slip
+        return params["p_init"], params["p_learn"], params["p_guess"], params["p_slip"]
+
+    @timed("bkt", "initialize_skill")
     def initialize_skill(self, student_id: str, skill_id: str) -> dict:
         """
         Initialize BKT state for a student-skill pair.
         """
-        self.knowledge_state[(student_id, skill_id)] = self.p_init
+        p_init = self.params_for(skill_id)[0]
+        shard = self.knowledge_state.shard_index(student_id)
+        with self._locks[shard]:
+            self._touch(student_id)
+            self.knowledge_state.shards[shard][(student_id, skill_id)] = p_init
+            if self.log is not None:
+                self.log.append((self.log_kind, student_id, skill_id, None, p_init))
+            if self.on_change is not None:
+                self.on_change(student_id, skill_id, p_init)
         return {
             "student_id": student_id,
             "skill_id": skill_id,
-            "mastery": self.p_init
+            "mastery": p_init
         }
 
+    @timed("bkt", "update_skill")
     def update_skill(self, student_id: str, skill_id: str, is_correct: bool) -> dict:
         """
         Update mastery probability using BKT equations.
         """
         key = (student_id, skill_id)
+        shard = self.knowledge_state.shard_index(student_id)
+        store = self.knowledge_state.shards[shard]
+        p_init, p_learn, p_guess, p_slip = self.params_for(skill_id)
 
-        if key not in self.knowledge_state:
-            self.initialize_skill(student_id, skill_id)
+        with self._locks[shard]:
+            self._touch(student_id)
 
-        p_know = self.knowledge_state[key]
+            if key not in store:
+                store[key] = p_init
 
-        if is_correct:
-            numerator = p_know * (1 - self.p_slip)
-            denominator = numerator + (1 - p_know) * self.p_guess
-            p_obs = numerator / denominator
-        else:
-            numerator = p_know * self.p_slip
-            denominator = numerator + (1 - p_know) * (1 - self.p_guess)
-            p_obs = numerator / denominator
+            p_know = store[key]
+
+            if is_correct:
+                numerator = p_know * (1 - p_slip)
+                denominator = numerator + (1 - p_know) * p_guess
+                p_obs = numerator / denominator
+            else:
+                numerator = p_know * p_slip
+                denominator = numerator + (1 - p_know) * (1 - p_guess)
+                p_obs = numerator / denominator
 
-        p_updated = p_obs + (1 - p_obs) * self.p_learn
-        self.knowledge_state[key] = p_updated
+            p_updated = p_obs + (1 - p_obs) * p_learn
+            store[key] = p_updated
+            if self.log is not None:
+                self.log.append((self.log_kind, student_id, skill_id, bool(is_correct), p_updated))
+            if self.on_change is not None:
+                self.on_change(student_id, skill_id, p_updated)
 
         return {
             "student_id": student_id,
@@ -55,8 +201,255 @@ class BKTEngine:
             "mastery": round(p_updated, 4)
         }
 
+    @timed("bkt", "get_mastery")
     def get_mastery(self, student_id: str, skill_id: str) -> float:
         """
         Get current mastery probability.
         """
-        return self.knowledge_state.get((student_id, skill_id), 0.0)
+        shard = self.knowledge_state.shard_index(student_id)
+        if self.max_students is None and (self.loader is None or student_id in self._resident[shard]):
+            # Nothing to page in or to reorder: read without the lock
+            return self.knowledge_state.shards[shard].get((student_id, skill_id), 0.0)
+        with self._locks[shard]:
+            self._touch(student_id)
+            return self.knowledge_state.shards[shard].get((student_id, skill_id), 0.0)
+
+    def step(
+        self,
+        p_know: np.ndarray,
+        is_correct: np.ndarray,
+        p_learn=None,
+        p_guess=None,
+        p_slip=None
+    ) -> np.ndarray:
+        """
+        One BKT update of an array of mastery estimates given the observed
+        answers (the vectorized form of update_skill's equations).
+        Parameters default to the engine's and may be per-element arrays.
+        """
+        p_learn = self.p_learn if p_learn is None else p_learn
+        p_guess = self.p_guess if p_guess is None else p_guess
+        p_slip = self.p_slip if p_slip is None else p_slip
+
+        numerator = np.where(is_correct, p_know * (1 - p_slip), p_know * p_slip)
+        denominator = numerator + np.where(
+            is_correct, (1 - p_know) * p_guess, (1 - p_know) * (1 - p_guess)
+        )
+        p_obs = numerator / denominator
+
+        return p_obs + (1 - p_obs) * p_learn
+
+    @timed("bkt", "update_batch")
+    def update_batch(self, student_ids, skill_ids, is_correct, order=None, evict: bool = True) -> np.ndarray:
+        """
+        Replay a stream of attempts given as columnar arrays.
+
+        Attempts are applied in `order` (input position if omitted) within
+        each (student, skill) pair, so the result matches calling
+        `update_skill` once per attempt. Returns the updated mastery for
+        every attempt, aligned with the input arrays.
+
+        With evict=False, students over the residency bound stay until the
+        next eviction (e.g. an explicit `evict()`), so the caller can
+        persist the new states first.
+        """
+        students = np.asarray(student_ids)
+        skills = np.asarray(skill_ids)
+        correct = np.asarray(is_correct, dtype=bool)
+        n = len(correct)
+        order = np.arange(n) if order is None else np.asarray(order)
+        result = np.empty(n, dtype=np.float64)
+
+        if n == 0:
+            return result
+
+        # Factorize ids into dense integer codes, then route every attempt
+        # to its student's shard
+        student_values, student_codes = _factorize(students)
+        skill_values, skill_codes = _factorize(skills)
+        student_shards = np.array(
+            [self.knowledge_state.shard_index(s) for s in student_values.tolist()],
+            dtype=np.int64
+        )
+        attempt_shards = student_shards[student_codes]
+
+        for shard in np.unique(attempt_shards).tolist():
+            sel = np.flatnonzero(attempt_shards == shard)
+            with self._locks[shard]:
+                result[sel] = self._replay_shard(
+                    shard,
+                    student_values,
+                    skill_values,
+                    student_codes[sel],
+                    skill_codes[sel],
+                    correct[sel],
+                    order[sel],
+                    evict
+                )
+
+        return result
+
+    def _replay_shard(
+        self,
+        shard: int,
+        student_values,
+        skill_values,
+        student_codes,
+        skill_codes,
+        correct,
+        order,
+        evict: bool = True
+    ) -> np.ndarray:
+        """
+        Vectorized replay of attempts that all belong to one shard.
+        Caller must hold the shard lock.
+        """
+        n = len(correct)
+
+        # Dense code per (student, skill) pair
+        pair_codes = student_codes * len(skill_values) + skill_codes
+        pair_values, pair_index = np.unique(pair_codes, return_inverse=True)
+        pair_students = pair_values // len(skill_values)
+        pair_skills = pair_values % len(skill_values)
+
+        # Sort attempts by pair, then by order; rank = position within the pair
+        sorted_idx = np.lexsort((order, pair_index))
+        sorted_pairs = pair_index[sorted_idx]
+        group_start = np.flatnonzero(np.r_[True, sorted_pairs[1:] != sorted_pairs[:-1]])
+        group_len = np.diff(np.r_[group_start, n])
+        rank = np.arange(n) - np.repeat(group_start, group_len)
+
+        # Current mastery for each pair (p_init for unseen pairs)
+        shard_students = np.unique(pair_students)
+        shard_skills = np.unique(pair_skills)
+        for student_id in student_values[shard_students].tolist():
+            self._touch(student_id, evict=False)
+
+        store = self.knowledge_state.shards[shard]
+        student_rows = np.zeros(len(student_values), dtype=np.int64)
+        student_rows[shard_students] = [
+            store.student_row(s) for s in student_values[shard_students].tolist()
+        ]
+        skill_cols = np.zeros(len(skill_values), dtype=np.int64)
+        skill_cols[shard_skills] = [
+            store.skill_col(k) for k in skill_values[shard_skills].tolist()
+        ]
+        rows = student_rows[pair_students]
+        cols = skill_cols[pair_skills]
+
+        # Parameters of each pair's skill; unseen pairs start at the skill's
+        # p_init, rounded through the store dtype like the scalar path
+        skill_table = np.array([self.params_for(k) for k in skill_values.tolist()])
+        pair_params = skill_table[pair_skills]
+
+        state = store.gather(rows, cols).astype(np.float64)
+        unseen = np.isnan(state)
+        state[unseen] = pair_params[unseen, 0].astype(store.dtype)
+
+        # Step k updates the k-th attempt of every pair at once
+        step_idx = sorted_idx[np.argsort(rank, kind="stable")]
+        step_bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+        result = np.empty(n, dtype=np.float64)
+
+        for k in range(len(step_bounds) - 1):
+            idx = step_idx[step_bounds[k]:step_bounds[k + 1]]
+            pairs = pair_index[idx]
+            p_know = state[pairs]
+            hit = correct[idx]
+
+            p = pair_params[pairs]
+            p_updated = self.step(p_know, hit, p[:, 1], p[:, 2], p[:, 3])
+            if store.dtype != np.float64:
+                # Round through the store dtype like the scalar path does
+                p_updated = p_updated.astype(store.dtype).astype(np.float64)
+            state[pairs] = p_updated
+            result[idx] = p_updated
+
+        store.scatter(rows, cols, state)
+        if self.log is not None:
+            # In application order, so the last record of a pair holds its state
+            applied = np.argsort(order, kind="stable")
+            self.log.append_many(
+                zip(
+                    [self.log_kind] * n,
+                    student_values[student_codes[applied]].tolist(),
+                    skill_values[skill_codes[applied]].tolist(),
+                    correct[applied].tolist(),
+                    result[applied].tolist(),
+                )
+            )
+        if evict:
+            self._evict(shard)
+
+        return result
+
+    def evict(self):
+        """
+        Evict students over the residency bound from every shard.
+        """
+        for shard, lock in enumerate(self._locks):
+            with lock:
+                self._evict(shard)
+
+    # -------------------------------------------------
+    # Snapshots and replay (see agents.state_log)
+    # -------------------------------------------------
+    def save_state(self, directory: str):
+        """
+        Write each shard's mastery array as a .npy file, with the
+        interned ids in ids.json.
+        """
+        shards = []
+        for shard, lock in enumerate(self._locks):
+            with lock:
+                store = self.knowledge_state.shards[shard]
+                values, student_ids, skill_ids = store.export()
+                size = len(store)
+            save_array(os.path.join(directory, f"shard-{shard:03d}.npy"), values)
+            shards.append({"students": student_ids, "skills": skill_ids, "size": size})
+        write_json(os.path.join(directory, "ids.json"), {"shards": shards})
+
+    def load_state(self, directory: str):
+        """
+        Replace the state with a snapshot written by save_state, mapping
+        the arrays rather than reading them. Its students count as
+        resident for paging.
+        """
+        shards = read_json(os.path.join(directory, "ids.json"))["shards"]
+        stores = [
+            PairStore.from_arrays(
+                load_array(os.path.join(directory, f"shard-{shard:03d}.npy"), self.knowledge_state.dtype),
+                ids["students"],
+                ids["skills"],
+                size=ids["size"],
+            )
+            for shard, ids in enumerate(shards)
+        ]
+
+        if len(stores) != len(self._locks) or self.shared is not None:
+            # Written with another shard count, or shared shards that
+            # stay in place: re-insert pair by pair
+            for store in stores:
+                for key in store:
+                    shard = self.knowledge_state.shard_index(key[0])
+                    with self._locks[shard]:
+                        self.knowledge_state.shards[shard][key] = store[key]
+            return
+
+        paging = self.loader is not None or self.max_students is not None
+        for shard, store in enumerate(stores):
+            with self._locks[shard]:
+                self.knowledge_state.shards[shard] = store
+                self._resident[shard] = OrderedDict.fromkeys(store.student_index if paging else (), True)
+                self._evict(shard)
+
+    def replay(self, records: list):
+        """
+        Re-apply logged changes. Records carry the resulting mastery, so
+        the last one of each pair is its state.
+        """
+        latest = {(record[1], record[2]): record[4] for record in records}
+        for key, mastery in latest.items():
+            shard = self.knowledge_state.shard_index(key[0])
+            with self._locks[shard]:
+                self.knowledge_state.shards[shard][key] = mastery
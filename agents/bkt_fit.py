@@ -0,0 +1,303 @@
+"""
+Per-skill BKT parameter fitting from attempt logs.
+
+Each skill's (p_init, p_learn, p_guess, p_slip) is estimated with EM
+(Baum-Welch for the two-state BKT model without forgetting). Sequences
+are laid out step-major: with students sorted by sequence length, the
+t-th attempts of all students still active at step t are one contiguous
+slice, so every forward/backward step is a handful of NumPy operations
+over all students at once. Skills are fitted in parallel processes.
+
+The result is a JSON parameter table {skill_id: {...}} that BKTEngine
+takes as `params` (the app loads it from BKT_PARAMS_PATH).
+
+Usage:
+    python -m agents.bkt_fit [--out PATH] [--workers N] [--min-attempts N]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine, _factorize
+
+# Guess and slip above these make "known" and "unknown" swap meaning
+MAX_GUESS = 0.3
+MAX_SLIP = 0.3
+EPS = 1e-6
+
+
+def step_major(sequence_codes: np.ndarray, correct: np.ndarray) -> tuple:
+    """
+    Lay out one skill's attempts step-major. `sequence_codes` gives the
+    student of each attempt; attempts must already be in time order within
+    each student. Returns (obs, offsets, counts): the attempts at step t
+    are obs[offsets[t]:offsets[t] + counts[t]], longest sequences first,
+    and counts is non-increasing.
+    """
+    _, seq, lengths = np.unique(sequence_codes, return_inverse=True, return_counts=True)
+
+    # Position of each attempt within its sequence
+    order = np.argsort(seq, kind="stable")
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    position = np.empty(len(seq), dtype=np.int64)
+    position[order] = np.arange(len(seq)) - np.repeat(starts, lengths)
+
+    # Rank sequences by length, longest first
+    by_length = np.argsort(-lengths, kind="stable")
+    seq_rank = np.empty(len(lengths), dtype=np.int64)
+    seq_rank[by_length] = np.arange(len(lengths))
+
+    counts = np.bincount(lengths - 1, minlength=lengths.max())[::-1].cumsum()[::-1]
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+
+    obs = np.empty(len(seq), dtype=bool)
+    obs[offsets[position] + seq_rank[seq]] = correct
+    return obs, offsets, counts
+
+
+def fit_skill(
+    obs: np.ndarray,
+    offsets: np.ndarray,
+    counts: np.ndarray,
+    init: tuple = (0.2, 0.1, 0.2, 0.1),
+    max_iter: int = 100,
+    tol: float = 1e-4
+) -> dict:
+    """
+    EM fit of one skill from its step-major attempts. Returns the
+    parameters, the final log-likelihood and the iterations used.
+    """
+    p_init, p_learn, p_guess, p_slip = init
+    n_steps = len(counts)
+    obs_f = obs.astype(np.float64)
+    known = np.empty(len(obs))      # forward, then posterior P(known)
+    scale = np.empty(len(obs))      # per-attempt normalizers
+    learned = np.empty(len(obs))    # posterior P(unknown -> known) after the attempt
+
+    # Attempts followed by another attempt of the same student
+    has_next = np.zeros(len(obs), dtype=bool)
+    for t in range(n_steps - 1):
+        has_next[offsets[t]:offsets[t] + counts[t + 1]] = True
+
+    log_likelihood = -np.inf
+    for iteration in range(1, max_iter + 1):
+        # Emission probabilities of every attempt
+        e_known = np.where(obs, 1 - p_slip, p_slip)
+        e_unknown = np.where(obs, p_guess, 1 - p_guess)
+
+        # Forward pass (scaled): P(known at t | answers up to t)
+        prior = np.full(counts[0], p_init)
+        for t in range(n_steps):
+            sl = slice(offsets[t], offsets[t] + counts[t])
+            if t:
+                prev = known[offsets[t - 1]:offsets[t - 1] + counts[t]]
+                prior = prev + (1 - prev) * p_learn
+            k = prior * e_known[sl]
+            u = (1 - prior) * e_unknown[sl]
+            scale[sl] = k + u
+            known[sl] = k / scale[sl]
+
+        new_log_likelihood = float(np.log(scale).sum())
+
+        # Backward pass: beta ratios, then posteriors in place
+        beta_k = np.ones(counts[0])
+        beta_u = np.ones(counts[0])
+        learned[:] = 0.0
+        for t in range(n_steps - 1, -1, -1):
+            sl = slice(offsets[t], offsets[t] + counts[t])
+            n_next = counts[t + 1] if t + 1 < n_steps else 0
+            forward = known[sl].copy()
+
+            bk = np.ones(counts[t])
+            bu = np.ones(counts[t])
+            if n_next:
+                nx = slice(offsets[t + 1], offsets[t + 1] + n_next)
+                ek = e_known[nx] * beta_k[:n_next] / scale[nx]
+                eu = e_unknown[nx] * beta_u[:n_next] / scale[nx]
+                bk[:n_next] = ek
+                bu[:n_next] = p_learn * ek + (1 - p_learn) * eu
+                learned[sl][:n_next] = (1 - forward[:n_next]) * p_learn * ek
+
+            post_k = forward * bk
+            known[sl] = post_k / (post_k + (1 - forward) * bu)
+            beta_k, beta_u = bk, bu
+
+        # M-step
+        first = known[:counts[0]]
+        unknown = 1 - known
+
+        p_init = float(first.mean())
+        p_learn = float(learned.sum() / max(unknown[has_next].sum(), EPS))
+        p_guess = float((unknown * obs_f).sum() / max(unknown.sum(), EPS))
+        p_slip = float((known * (1 - obs_f)).sum() / max(known.sum(), EPS))
+
+        p_init = min(max(p_init, EPS), 1 - EPS)
+        p_learn = min(max(p_learn, EPS), 1 - EPS)
+        p_guess = min(max(p_guess, EPS), MAX_GUESS)
+        p_slip = min(max(p_slip, EPS), MAX_SLIP)
+
+        converged = abs(new_log_likelihood - log_likelihood) < tol
+        log_likelihood = new_log_likelihood
+        if converged:
+            break
+
+    return {
+        "p_init": round(p_init, 6),
+        "p_learn": round(p_learn, 6),
+        "p_guess": round(p_guess, 6),
+        "p_slip": round(p_slip, 6),
+        "log_likelihood": round(log_likelihood, 4),
+        "iterations": iteration,
+    }
+
+
+def _fit_task(args) -> tuple:
+    skill_id, student_codes, correct, init = args
+    result = fit_skill(*step_major(student_codes, correct), init=init)
+    result["n_attempts"] = len(correct)
+    return skill_id, result
+
+
+def fit_params(
+    student_ids,
+    skill_ids,
+    is_correct,
+    order=None,
+    workers: int | None = None,
+    min_attempts: int = 50,
+    init: tuple | None = None
+) -> dict:
+    """
+    Fit every skill with at least `min_attempts` attempts. Attempts are
+    ordered by `order` (input position if omitted) within each student.
+    `workers` > 1 fits skills in that many processes.
+    """
+    correct = np.asarray(is_correct, dtype=bool)
+    n = len(correct)
+    order = np.arange(n) if order is None else np.asarray(order)
+    if n == 0:
+        return {}
+    if init is None:
+        engine = BKTEngine()
+        init = (engine.p_init, engine.p_learn, engine.p_guess, engine.p_slip)
+
+    _, student_codes = _factorize(student_ids)
+    skill_values, skill_codes = _factorize(skill_ids)
+
+    # Group by skill, then student, then time
+    sorted_idx = np.lexsort((order, student_codes, skill_codes))
+    sorted_skills = skill_codes[sorted_idx]
+    bounds = np.r_[0, np.flatnonzero(np.diff(sorted_skills)) + 1, n]
+
+    tasks = []
+    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        if hi - lo < min_attempts:
+            continue
+        idx = sorted_idx[lo:hi]
+        skill_id = skill_values[sorted_skills[lo]]
+        tasks.append((skill_id, student_codes[idx], correct[idx], init))
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_fit_task, tasks))
+    else:
+        results = [_fit_task(task) for task in tasks]
+
+    return dict(results)
+
+
+# -------------------------------------------------
+# Parameter table
+# -------------------------------------------------
+def save_param_table(params: dict, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_param_table(path: str) -> dict:
+    """
+    Fitted {skill_id: params} table, or {} if there is none at `path`.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_attempts(storage) -> tuple:
+    """
+    (student_ids, skill_ids, is_correct, order) columns of a storage
+    backend's attempt log, read in (student, skill, time) order.
+    """
+    students, skills, correct = [], [], []
+    for student_id, skill_id, is_correct in storage.iter_attempts():
+        students.append(student_id)
+        skills.append(skill_id)
+        correct.append(is_correct)
+    return students, skills, np.array(correct, dtype=bool), np.arange(len(correct))
+
+
+def simulate(true_params: dict, n_students: int, mean_length: int, seed: int = 0):
+    """
+    Attempt columns (student_ids, skill_ids, is_correct) in time order,
+    generated from BKT with the given per-skill parameters
+    {skill_id: (p_init, p_learn, p_guess, p_slip)}, for testing fits
+    against known parameters.
+    """
+    rng = np.random.default_rng(seed)
+    students, skills, correct = [], [], []
+
+    for skill_id, (p_init, p_learn, p_guess, p_slip) in true_params.items():
+        lengths = rng.integers(1, 2 * mean_length, n_students)
+        known = rng.random(n_students) < p_init
+        for t in range(lengths.max()):
+            active = np.flatnonzero(lengths > t)
+            hit = np.where(
+                known[active],
+                rng.random(len(active)) >= p_slip,
+                rng.random(len(active)) < p_guess
+            )
+            students.append(active)
+            skills.append(np.full(len(active), skill_id))
+            correct.append(hit)
+            known[active] |= rng.random(len(active)) < p_learn
+
+    student_ids = np.char.add("student_", np.concatenate(students).astype(str))
+    return student_ids, np.concatenate(skills), np.concatenate(correct)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit per-skill BKT parameters")
+    parser.add_argument("--out", default=os.getenv("BKT_PARAMS_PATH", "bkt_params.json"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--min-attempts", type=int, default=50)
+    args = parser.parse_args()
+
+    from database.storage import create_storage
+
+    start = time.perf_counter()
+    students, skills, correct, order = load_attempts(create_storage())
+    loaded = time.perf_counter()
+
+    params = fit_params(
+        students, skills, correct, order,
+        workers=args.workers, min_attempts=args.min_attempts
+    )
+    fitted = time.perf_counter()
+
+    save_param_table(params, args.out)
+    print(
+        f"Fitted {len(params)} skills from {len(correct)} attempts "
+        f"(load {loaded - start:.1f} s, fit {fitted - loaded:.1f} s) -> {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import contextmanager
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a dependency is down.
+
+    - closed: calls go through; `failure_threshold` consecutive failures
+      (errors or calls slower than `slow_call_seconds`) open the circuit.
+    - open: calls are rejected with CircuitOpenError for `reset_timeout`
+      seconds.
+    - half_open: one probe call is let through; success closes the
+      circuit, failure opens it again.
+
+    Thread-safe; wrap each upstream call in `with breaker.guard():`.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_seconds: float | None = None,
+        reset_timeout: float = 30.0
+    ):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    # -------------------------------------------------
+    # State
+    # -------------------------------------------------
+    def _refresh(self):
+        # Caller holds self._lock
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+
+    def _open(self):
+        # Caller holds self._lock
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.stats["opened"] += 1
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def snapshot(self) -> dict:
+        """
+        Current state, seconds until the next probe, and counters.
+        """
+        with self._lock:
+            self._refresh()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(self.reset_timeout - (time.monotonic() - self._opened_at), 3)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in": retry_in,
+                **self.stats,
+            }
+
+    # -------------------------------------------------
+    # Calls
+    # -------------------------------------------------
+    def before_call(self):
+        """
+        Admit a call or raise CircuitOpenError.
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == OPEN or (self._state == HALF_OPEN and self._probing):
+                self.stats["rejected"] += 1
+                raise CircuitOpenError("Circuit is open")
+            if self._state == HALF_OPEN:
+                self._probing = True
+            self.stats["calls"] += 1
+
+    def record_success(self, elapsed: float = 0.0):
+        with self._lock:
+            if self.slow_call_seconds is not None and elapsed > self.slow_call_seconds:
+                self.stats["slow_calls"] += 1
+                self._record_failure()
+                return
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self._record_failure()
+
+    def _record_failure(self):
+        # Caller holds self._lock
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def _abandon(self):
+        # A cancelled probe frees the slot for the next one
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """
+        Admit, time and record one call.
+        """
+        self.before_call()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self._abandon()
+            raise
+        self.record_success(time.monotonic() - start)
@@ -11,10 +11,17 @@ class MultiAgentController:
     - Adaptive Quiz Agent (RL)
     """
 
-    def __init__(self):
-        self.query_agent = StudentQueryAgent()
-        self.bkt_agent = BKTEngine()
-        self.rl_agent = AdaptiveQuizAgent()
+    def __init__(
+        self,
+        query_agent: StudentQueryAgent | None = None,
+        bkt_agent: BKTEngine | None = None,
+        rl_agent: AdaptiveQuizAgent | None = None
+    ):
+        # Agents can be injected so the controller shares state with the
+        # rest of the application instead of keeping its own copies
+        self.query_agent = query_agent or StudentQueryAgent()
+        self.bkt_agent = bkt_agent or BKTEngine()
+        self.rl_agent = rl_agent or AdaptiveQuizAgent()
 
     def handle_student_query(self, student_id: str, question: str) -> dict:
         """
@@ -31,6 +38,22 @@ class MultiAgentController:
             "answer": response
         }
 
+    async def handle_student_query_async(self, student_id: str, question: str) -> dict:
+        """
+        Async variant of handle_student_query; does not block a worker
+        thread while the LLM generates.
+        """
+        response = await self.query_agent.answer_question_async(
+            student_id=student_id,
+            question=question
+        )
+
+        return {
+            "student_id": student_id,
+            "question": question,
+            "answer": response
+        }
+
     def assess_response(self, student_id: str, skill_id: str, is_correct: bool) -> dict:
         """
         Update student mastery using BKT after an attempt.
@@ -58,7 +81,8 @@ class MultiAgentController:
 	
         decision = self.rl_agent.select_action(
             student_id=student_id,
-            mastery=mastery
+            mastery=mastery,
+            skill_id=skill_id
         )
 
         return {
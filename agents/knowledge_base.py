@@ -0,0 +1,156 @@
+"""
+Offline knowledge base for the rule-based fallback.
+
+Topics, their keywords and answers live in a JSON file
+(agents/knowledge_base.json by default). Keywords are compiled into an
+inverted index from normalized phrase to (topic, weight) postings, with
+rarer and longer phrases weighted higher. A question is answered by
+looking up each of its word n-grams, so lookup cost depends on the
+question's length, not on the number of topics.
+
+The compiled index is pickled next to the source file and reused while
+the source's size and modification time are unchanged.
+
+Usage:
+    python -m agents.knowledge_base build [path]
+"""
+
+import json
+import math
+import os
+import pickle
+import sys
+
+from agents.answer_cache import normalize_question
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "knowledge_base.json")
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+def _source_stamp(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class KnowledgeBase:
+    """
+    Topics and answers with an inverted keyword index.
+    """
+
+    def __init__(self, topics: list[dict], default_answer: str):
+        self.topics = [t["topic"] for t in topics]
+        self.answers = [t["answer"] for t in topics]
+        self.default_answer = default_answer
+
+        # Phrase -> topic ids, with the topic name itself as a keyword
+        phrase_topics = {}
+        for topic_id, topic in enumerate(topics):
+            for keyword in [topic["topic"], *topic.get("keywords", [])]:
+                phrase = normalize_question(keyword)
+                if phrase:
+                    phrase_topics.setdefault(phrase, set()).add(topic_id)
+
+        n_topics = max(1, len(topics))
+        self.index = {}
+        for phrase, topic_ids in phrase_topics.items():
+            weight = math.log(1 + n_topics / len(topic_ids)) * len(phrase.split())
+            self.index[phrase] = [(topic_id, weight) for topic_id in sorted(topic_ids)]
+
+        self.max_phrase_words = max((len(p.split()) for p in self.index), default=1)
+
+    def __len__(self) -> int:
+        return len(self.topics)
+
+    # -------------------------------------------------
+    # Loading
+    # -------------------------------------------------
+    @classmethod
+    def from_file(cls, path: str) -> "KnowledgeBase":
+        """
+        Build the index from a JSON knowledge base file.
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["topics"], data["default_answer"])
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH) -> "KnowledgeBase":
+        """
+        Load from the compiled index when it is current, otherwise build
+        from the source file and (re)write the compiled index.
+        """
+        stamp = _source_stamp(path)
+
+        try:
+            with open(path + INDEX_SUFFIX, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") == INDEX_VERSION and state.get("source") == stamp:
+                kb = cls.__new__(cls)
+                kb.__dict__.update(state["kb"])
+                return kb
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+            pass
+
+        kb = cls.from_file(path)
+        kb.save_index(path + INDEX_SUFFIX, stamp)
+        return kb
+
+    def save_index(self, index_path: str, stamp: tuple):
+        state = {"version": INDEX_VERSION, "source": stamp, "kb": self.__dict__}
+        tmp_path = index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print("Knowledge base index write failed:", e)
+
+    # -------------------------------------------------
+    # Lookup
+    # -------------------------------------------------
+    def _best(self, question: str) -> tuple[int, float] | None:
+        # Ties go to the topic listed first in the file
+        words = normalize_question(question).split()
+        scores = {}
+        seen = set()
+
+        for n in range(1, self.max_phrase_words + 1):
+            for i in range(len(words) - n + 1):
+                phrase = " ".join(words[i:i + n])
+                if phrase in seen:
+                    continue
+                seen.add(phrase)
+                for topic_id, weight in self.index.get(phrase, ()):
+                    scores[topic_id] = scores.get(topic_id, 0.0) + weight
+
+        if not scores:
+            return None
+        best = min(scores, key=lambda topic_id: (-scores[topic_id], topic_id))
+        return best, scores[best]
+
+    def match(self, question: str) -> tuple[str, float] | None:
+        """
+        Best-scoring (topic, score) for the question, or None.
+        """
+        best = self._best(question)
+        if best is None:
+            return None
+        return self.topics[best[0]], best[1]
+
+    def answer(self, question: str) -> str:
+        best = self._best(question)
+        if best is None:
+            return self.default_answer
+        return self.answers[best[0]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print(__doc__)
+        sys.exit(1)
+
+    source = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    kb = KnowledgeBase.from_file(source)
+    kb.save_index(source + INDEX_SUFFIX, _source_stamp(source))
+    print(f"Indexed {len(kb)} topics, {len(kb.index)} phrases -> {source + INDEX_SUFFIX}")
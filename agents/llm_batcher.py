@@ -0,0 +1,75 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for a few milliseconds and sends them
+    upstream as one batched call.
+
+    A batch is dispatched when `max_batch_size` items are pending or
+    `max_wait_ms` after its first item arrived, whichever comes first.
+    `send_batch` is an async callable taking the list of items and
+    returning one result per item, in order; each result is routed back
+    to the caller that submitted the item. If the batched call fails,
+    every caller in the batch gets the exception.
+    """
+
+    def __init__(self, send_batch, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+        self.stats = {"batches": 0, "items": 0}
+
+    async def submit(self, item):
+        """
+        Queue an item and wait for its result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            # Overflow starts the next window right away
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+
+        try:
+            results = await self.send_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,270 @@
+import sys
+import zlib
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+class PairStore(MutableMapping):
+    """
+    Compact (student_id, skill_id) -> float store.
+
+    Student and skill ids are interned to integer indices and values are
+    held in one contiguous array (students x skills x *cell_shape).
+    Untracked cells hold NaN. The array grows geometrically in both
+    dimensions as new ids arrive, so inserts stay amortized O(1).
+
+    Behaves like a dict keyed by (student_id, skill_id) tuples. With a
+    non-empty `cell_shape` each value is an array of that shape (e.g. a
+    states x actions Q-table) and a cell counts as tracked when its first
+    element is not NaN.
+    """
+
+    def __init__(
+        self,
+        dtype=np.float64,
+        initial_students: int = 64,
+        initial_skills: int = 8,
+        cell_shape: tuple = ()
+    ):
+        self.dtype = np.dtype(dtype)
+        self.cell_shape = tuple(cell_shape)
+
+        # Id interning: id -> index, plus the reverse lookup
+        self.student_index = {}
+        self.skill_index = {}
+        self.student_ids = []
+        self.skill_ids = []
+        self._free_rows = []
+
+        self.values = np.full(
+            (initial_students, initial_skills, *self.cell_shape), np.nan, dtype=self.dtype
+        )
+        self._size = 0
+
+    def _flags(self, values: np.ndarray) -> np.ndarray:
+        # First element of every cell; NaN marks an untracked cell
+        if not self.cell_shape:
+            return values
+        lead = values.shape[:values.ndim - len(self.cell_shape)]
+        return values.reshape(*lead, int(np.prod(self.cell_shape)))[..., 0]
+
+    # -------------------------------------------------
+    # Interning
+    # -------------------------------------------------
+    def _grow(self, n_rows: int, n_cols: int):
+        rows, cols = self.values.shape[:2]
+        if n_rows <= rows and n_cols <= cols:
+            return
+
+        new_rows = rows if n_rows <= rows else max(rows * 2, n_rows)
+        new_cols = cols if n_cols <= cols else max(cols * 2, n_cols)
+
+        values = np.full((new_rows, new_cols, *self.cell_shape), np.nan, dtype=self.dtype)
+        values[:rows, :cols] = self.values
+        self.values = values
+
+    def student_row(self, student_id: str) -> int:
+        """
+        Return the row index for a student, interning it if new.
+        """
+        row = self.student_index.get(student_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self.student_ids[row] = student_id
+            else:
+                row = len(self.student_ids)
+                self._grow(row + 1, 0)
+                self.student_ids.append(student_id)
+            self.student_index[student_id] = row
+        return row
+
+    def drop_student(self, student_id: str) -> int:
+        """
+        Forget every pair of a student and recycle its row.
+        Returns the number of pairs dropped.
+        """
+        row = self.student_index.pop(student_id, None)
+        if row is None:
+            return 0
+        dropped = int(np.count_nonzero(~np.isnan(self._flags(self.values[row]))))
+        self.values[row] = np.nan
+        self.student_ids[row] = None
+        self._free_rows.append(row)
+        self._size -= dropped
+        return dropped
+
+    def skill_col(self, skill_id: str) -> int:
+        """
+        Return the column index for a skill, interning it if new.
+        """
+        col = self.skill_index.get(skill_id)
+        if col is None:
+            col = len(self.skill_ids)
+            self._grow(0, col + 1)
+            self.skill_index[skill_id] = col
+            self.skill_ids.append(skill_id)
+        return col
+
+    def _locate(self, key):
+        student_id, skill_id = key
+        row = self.student_index.get(student_id)
+        col = self.skill_index.get(skill_id)
+        if row is None or col is None:
+            return None
+        return row, col
+
+    # -------------------------------------------------
+    # Mapping interface
+    # -------------------------------------------------
+    def _flag(self, cell: tuple) -> float:
+        if not self.cell_shape:
+            return self.values.item(cell)
+        return self.values[cell].flat[0].item()
+
+    def __getitem__(self, key):
+        cell = self._locate(key)
+        if cell is not None:
+            value = self.values.item(cell) if not self.cell_shape else self._flag(cell)
+            if value == value:  # not NaN
+                return self.values[cell].copy() if self.cell_shape else value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        student_id, skill_id = key
+        cell = (self.student_row(student_id), self.skill_col(skill_id))
+        current = self.values.item(cell) if not self.cell_shape else self._flag(cell)
+        if current != current:  # NaN: new pair
+            self._size += 1
+        self.values[cell] = value
+
+    def __delitem__(self, key):
+        cell = self._locate(key)
+        if cell is None or np.isnan(self._flag(cell)):
+            raise KeyError(key)
+        self.values[cell] = np.nan
+        self._size -= 1
+
+    def __iter__(self):
+        rows, cols = np.nonzero(~np.isnan(self._flags(self.values)))
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            yield self.student_ids[row], self.skill_ids[col]
+
+    def __len__(self) -> int:
+        return self._size
+
+    # -------------------------------------------------
+    # Vectorized access
+    # -------------------------------------------------
+    def gather(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Read cells by index; untracked cells come back as NaN.
+        """
+        return self.values[rows, cols]
+
+    def scatter(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray):
+        """
+        Write cells by index. Each (row, col) must appear at most once.
+        """
+        self._size += int(np.count_nonzero(np.isnan(self._flags(self.values[rows, cols]))))
+        self.values[rows, cols] = values
+
+    # -------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------
+    def export(self) -> tuple:
+        """
+        (values, student_ids, skill_ids): a copy of the values trimmed to
+        the interned ids. Recycled rows have the student id None.
+        """
+        rows, cols = len(self.student_ids), len(self.skill_ids)
+        return self.values[:rows, :cols].copy(), list(self.student_ids), list(self.skill_ids)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        values: np.ndarray,
+        student_ids: list,
+        skill_ids: list,
+        cell_shape: tuple = (),
+        size: int | None = None
+    ) -> "PairStore":
+        """
+        A store over `values` as returned by export(), used as is (e.g. a
+        memory-mapped snapshot). `size`, the number of tracked pairs, is
+        counted from the values if not given.
+        """
+        store = cls(dtype=values.dtype, initial_students=0, initial_skills=0, cell_shape=cell_shape)
+        store.values = values
+        store.student_ids = list(student_ids)
+        store.skill_ids = list(skill_ids)
+        store.student_index = {s: i for i, s in enumerate(store.student_ids) if s is not None}
+        store.skill_index = {k: i for i, k in enumerate(store.skill_ids)}
+        store._free_rows = [i for i, s in enumerate(store.student_ids) if s is None]
+        if size is None:
+            size = int(np.count_nonzero(~np.isnan(store._flags(values))))
+        store._size = size
+        return store
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the value array and the id interning.
+        """
+        interned = sum(
+            sys.getsizeof(index) + sys.getsizeof(ids) + sum(sys.getsizeof(i) for i in ids)
+            for index, ids in (
+                (self.student_index, self.student_ids),
+                (self.skill_index, self.skill_ids),
+            )
+        )
+        return self.values.nbytes + interned
+
+
+class ShardedPairStore(MutableMapping):
+    """
+    A PairStore split into independent shards by student id.
+
+    Every pair of a student lives in the same shard, so callers can guard
+    a student's state with a per-shard lock while other shards proceed.
+    Shard assignment uses crc32, which is stable across processes.
+    `shards` replaces the default PairStores (e.g. shared ones, see
+    agents.shared_state).
+    """
+
+    def __init__(self, n_shards: int = 16, dtype=np.float64, shards: list | None = None):
+        self.shards = shards if shards is not None else [PairStore(dtype=dtype) for _ in range(n_shards)]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.shards[0].dtype
+
+    def shard_index(self, student_id: str) -> int:
+        return zlib.crc32(student_id.encode("utf-8")) % len(self.shards)
+
+    def shard(self, student_id: str) -> PairStore:
+        return self.shards[self.shard_index(student_id)]
+
+    def __getitem__(self, key) -> float:
+        return self.shard(key[0])[key]
+
+    def __setitem__(self, key, value: float):
+        self.shard(key[0])[key] = value
+
+    def __delitem__(self, key):
+        del self.shard(key[0])[key]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def drop_student(self, student_id: str) -> int:
+        return self.shard(student_id).drop_student(student_id)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(shard.nbytes for shard in self.shards)
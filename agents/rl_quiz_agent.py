@@ -1,3 +1,17 @@
+import os
+import random
+import threading
+
+import numpy as np
+
+from agents.pair_store import PairStore
+from agents.state_log import load_array, read_json, save_array, write_json
+from metrics import timed
+
+# Upper bounds of the LOW and MEDIUM mastery states
+MASTERY_BINS = [0.3, 0.7]
+
+
 class AdaptiveQuizAgent:
     """
     Reinforcement Learning agent for adaptive quiz selection.
@@ -6,9 +20,30 @@ class AdaptiveQuizAgent:
     - Discrete state space (LOW, MEDIUM, HIGH)
     - Discrete action space (EASY, MEDIUM, HARD)
     - Tabular Q-learning
+
+    A shared Q-table (the prior) learns from every transition. When a
+    skill_id is given, each (student, skill) pair also learns its own
+    Q-table, stored as one states x actions cell of a PairStore (36 bytes
+    per pair in float32). Pairs without a table of their own act on the
+    prior, or on zeros with use_prior=False.
+
+    select_action_batch / update_policy_batch handle many pairs at once,
+    and snapshot / load_snapshot persist every table to an .npz file.
+
+    With a `log` (agents.state_log.StateLog), every transition is appended
+    as ("quiz", student_id, skill_id, state, next_state, reward, action,
+    pair table after it or None, prior row `state` after it), states and
+    actions as indices; save_state / load_state / replay restore the
+    tables from it.
+
+    With `shared` (an agents.shared_state.SharedRegion), the prior and
+    the per-pair tables live in that region, shared with other
+    processes, and the lock excludes those processes too.
     """
 
-    def __init__(self):
+    log_kind = "quiz"
+
+    def __init__(self, dtype=np.float32, use_prior: bool = True, log=None, shared=None):
         # State and action spaces
         self.states = ["LOW", "MEDIUM", "HIGH"]
         self.actions = ["EASY", "MEDIUM", "HARD"]
@@ -18,11 +53,35 @@ class AdaptiveQuizAgent:
         self.gamma = 0.9   # discount factor
         self.epsilon = 0.1 # exploration rate
 
-        # Initialize Q-table
-        # Q[state][action] = value
-        self.q_table = {
-            state: {action: 0.0 for action in self.actions}
-            for state in self.states
+        # Shared prior: prior[state_index, action_index] = value
+        shape = (len(self.states), len(self.actions))
+        self.use_prior = use_prior
+        self.shared = shared
+        if shared is None:
+            self.prior = np.zeros(shape)
+            # Per-(student, skill) Q-tables
+            self.pair_q = PairStore(dtype=dtype, cell_shape=shape)
+            # Guards Q-table updates from concurrent requests
+            self._lock = threading.Lock()
+        else:
+            self.prior = shared.array("quiz-prior", shape, np.float64)
+            self.pair_q = shared.pair_store("quiz", dtype, cell_shape=shape)
+            self._lock = shared.lock("quiz")
+
+        # Write-ahead log, appended to under self._lock
+        self.log = log
+
+    @property
+    def q_table(self) -> dict:
+        """
+        The shared prior as Q[state][action].
+        """
+        return {
+            state: {
+                action: float(self.prior[i, j])
+                for j, action in enumerate(self.actions)
+            }
+            for i, state in enumerate(self.states)
         }
 
     def _discretize_mastery(self, mastery: float) -> str:
@@ -33,26 +92,84 @@ class AdaptiveQuizAgent:
         else:
             return "HIGH"
 
+    def _state_indices(self, mastery) -> np.ndarray:
+        return np.digitize(np.asarray(mastery, dtype=np.float64), MASTERY_BINS)
+
     def compute_reward(self, mastery_before: float, mastery_after: float) -> float:
         return mastery_after - mastery_before
 
-    def select_action(self, student_id: str, mastery: float) -> dict:
+    # -------------------------------------------------
+    # Q-tables
+    # -------------------------------------------------
+    def _default_table(self) -> np.ndarray:
+        return self.prior if self.use_prior else np.zeros_like(self.prior)
+
+    def _table(self, student_id: str, skill_id: str | None) -> np.ndarray:
+        # A view of the live table: a concurrent update may land while
+        # it is read, which leaves each value either old or new
+        if skill_id is not None:
+            cell = self.pair_q._locate((student_id, skill_id))
+            if cell is not None:
+                table = self.pair_q.values[cell]
+                if table.flat[0] == table.flat[0]:  # not NaN
+                    return table
+            return self._default_table()
+        return self.prior
+
+    def _tables(self, student_ids, skill_ids) -> np.ndarray:
+        # Caller holds self._lock; float64 copies, one per pair
+        n = len(student_ids)
+        if skill_ids is None:
+            return np.broadcast_to(self.prior, (n, *self.prior.shape)).copy()
+
+        rows = np.array([self.pair_q.student_index.get(s, -1) for s in student_ids], dtype=np.int64)
+        cols = np.array([self.pair_q.skill_index.get(k, -1) for k in skill_ids], dtype=np.int64)
+        known = (rows >= 0) & (cols >= 0)
+
+        tables = np.full((n, *self.prior.shape), np.nan)
+        tables[known] = self.pair_q.gather(rows[known], cols[known])
+        missing = np.isnan(tables[:, 0, 0])
+        tables[missing] = self._default_table()
+        return tables
+
+    def _q_update(
+        self,
+        table: np.ndarray,
+        state: int,
+        next_state: int,
+        reward: float,
+        action: int | None = None
+    ):
+        # Credit the action that was taken; without it, best guess is the
+        # max-Q action
+        if action is None:
+            action = int(np.argmax(table[state]))
+
+        best_next_q = float(table[next_state].max())
+
+        # Q-learning update
+        old_q = float(table[state, action])
+        table[state, action] = old_q + self.alpha * (
+            reward + self.gamma * best_next_q - old_q
+        )
+
+    # -------------------------------------------------
+    # Acting and learning
+    # -------------------------------------------------
+    @timed("quiz", "select_action")
+    def select_action(self, student_id: str, mastery: float, skill_id: str | None = None) -> dict:
         """
         ε-greedy action selection.
         """
-        import random
-
         state = self._discretize_mastery(mastery)
 
         # Exploration
         if random.random() < self.epsilon:
             action = random.choice(self.actions)
         else:
-            # Exploitation
-            action = max(
-                self.q_table[state],
-                key=self.q_table[state].get
-            )
+            # Exploitation, without the lock
+            values = self._table(student_id, skill_id)[self.states.index(state)]
+            action = self.actions[int(np.argmax(values))]
 
         return {
             "student_id": student_id,
@@ -60,28 +177,272 @@ class AdaptiveQuizAgent:
             "action": action
         }
 
+    @timed("quiz", "update_policy")
     def update_policy(
         self,
         student_id: str,
         mastery_before: float,
         mastery_after: float,
-        reward: float
+        reward: float,
+        skill_id: str | None = None,
+        action: str | None = None
     ):
         """
-        Update Q-table using Q-learning rule.
+        Update Q-table using Q-learning rule, crediting `action` (the
+        difficulty actually served) when given.
         """
-        state = self._discretize_mastery(mastery_before)
-        next_state = self._discretize_mastery(mastery_after)
+        state = self.states.index(self._discretize_mastery(mastery_before))
+        next_state = self.states.index(self._discretize_mastery(mastery_after))
+        action = None if action is None else self.actions.index(action)
 
-        # Choose action that was taken (best guess: max-Q action)
-        action = max(self.q_table[state], key=self.q_table[state].get)
+        with self._lock:
+            table = None
+            if skill_id is not None:
+                key = (student_id, skill_id)
+                if key not in self.pair_q:
+                    # New pairs start from the prior as it is now
+                    self.pair_q[key] = self._default_table()
+                table = self.pair_q.values[self.pair_q._locate(key)]
+                self._q_update(table, state, next_state, reward, action)
 
-        best_next_q = max(self.q_table[next_state].values())
+            self._q_update(self.prior, state, next_state, reward, action)
 
-        # Q-learning update
-        old_q = self.q_table[state][action]
-        new_q = old_q + self.alpha * (
-            reward + self.gamma * best_next_q - old_q
+            if self.log is not None:
+                self.log.append((
+                    self.log_kind, student_id, skill_id, state, next_state, float(reward), action,
+                    None if table is None else table.ravel().tolist(),
+                    self.prior[state].tolist(),
+                ))
+
+    @timed("quiz", "select_action_batch")
+    def select_action_batch(self, student_ids, masteries, skill_ids=None, rng=None) -> dict:
+        """
+        ε-greedy selection for many students at once. Returns arrays of
+        state and action names aligned with the inputs.
+        """
+        rng = rng or np.random.default_rng()
+        states = self._state_indices(masteries)
+
+        with self._lock:
+            tables = self._tables(list(student_ids), None if skill_ids is None else list(skill_ids))
+
+        actions = np.argmax(tables[np.arange(len(states)), states], axis=1)
+        explore = rng.random(len(states)) < self.epsilon
+        actions[explore] = rng.integers(0, len(self.actions), int(explore.sum()))
+
+        return {
+            "state": np.array(self.states)[states],
+            "action": np.array(self.actions)[actions]
+        }
+
+    @timed("quiz", "update_policy_batch")
+    def update_policy_batch(
+        self,
+        student_ids,
+        mastery_before,
+        mastery_after,
+        rewards,
+        skill_ids=None,
+        actions=None
+    ):
+        """
+        Apply many transitions in order. Produces the same tables as
+        calling update_policy once per transition. `actions` are the
+        action names taken (None entries fall back to the max-Q action).
+        """
+        states = self._state_indices(mastery_before)
+        next_states = self._state_indices(mastery_after)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        n = len(states)
+
+        # -1 marks transitions without a recorded action
+        taken = np.full(n, -1, dtype=np.int64)
+        if actions is not None:
+            taken[:] = [-1 if a is None else self.actions.index(a) for a in actions]
+
+        with self._lock:
+            init_at = {}
+            if skill_ids is not None:
+                store = self.pair_q
+                rows = np.array([store.student_row(s) for s in student_ids], dtype=np.int64)
+                cols = np.array([store.skill_col(k) for k in skill_ids], dtype=np.int64)
+
+                # First transition of each pair, and which pairs are new
+                codes = rows * len(store.skill_ids) + cols
+                _, first = np.unique(codes, return_index=True)
+                is_new = np.isnan(store.gather(rows[first], cols[first])[:, 0, 0])
+                init_at = {int(i): None for i in first[is_new]}
+
+            # Shared prior, strictly in order; new pairs copy it as it stood
+            # just before their first transition
+            prior = self.prior
+            prior_rows = None if self.log is None else np.empty((n, len(self.actions)))
+            for i, (state, next_state, reward, action) in enumerate(
+                zip(states.tolist(), next_states.tolist(), rewards.tolist(), taken.tolist())
+            ):
+                if i in init_at:
+                    init_at[i] = self._default_table().copy()
+                self._q_update(prior, state, next_state, reward, None if action < 0 else action)
+                if prior_rows is not None:
+                    prior_rows[i] = prior[state]
+
+            if skill_ids is None:
+                self._log_batch(student_ids, None, states, next_states, rewards, taken, None, prior_rows)
+                return
+
+            # Per-pair tables: the k-th transition of every pair in one step
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            group_start = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1]
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.arange(n) - np.repeat(group_start, np.diff(np.r_[group_start, n]))
+
+            if init_at:
+                new_idx = np.fromiter(init_at, dtype=np.int64, count=len(init_at))
+                store.scatter(rows[new_idx], cols[new_idx], np.stack(list(init_at.values())))
+
+            after = None if self.log is None else np.empty((n, *self.prior.shape))
+            for k in range(int(rank.max()) + 1 if n else 0):
+                step = np.flatnonzero(rank == k)
+                r, c = rows[step], cols[step]
+                tables = store.gather(r, c).astype(np.float64)
+                idx = np.arange(len(step))
+                s, ns = states[step], next_states[step]
+
+                action = np.where(taken[step] >= 0, taken[step], np.argmax(tables[idx, s], axis=1))
+                best_next_q = tables[idx, ns].max(axis=1)
+                old_q = tables[idx, s, action]
+                tables[idx, s, action] = old_q + self.alpha * (
+                    rewards[step] + self.gamma * best_next_q - old_q
+                )
+                store.scatter(r, c, tables)
+                if after is not None:
+                    after[step] = tables
+
+            self._log_batch(student_ids, skill_ids, states, next_states, rewards, taken, after, prior_rows)
+
+    def _log_batch(self, student_ids, skill_ids, states, next_states, rewards, taken, tables, prior_rows):
+        # Caller holds self._lock; one record per transition, in order
+        if self.log is None:
+            return
+        n = len(states)
+        self.log.append_many(
+            zip(
+                [self.log_kind] * n,
+                np.asarray(student_ids).tolist(),
+                [None] * n if skill_ids is None else np.asarray(skill_ids).tolist(),
+                states.tolist(),
+                next_states.tolist(),
+                rewards.tolist(),
+                [None if a < 0 else a for a in taken.tolist()],
+                [None] * n if tables is None else tables.reshape(n, -1).tolist(),
+                prior_rows.tolist(),
+            )
+        )
+
+    # -------------------------------------------------
+    # Persistence
+    # -------------------------------------------------
+    def snapshot(self, path: str):
+        """
+        Write the prior and every pair's Q-table to an .npz file
+        (atomically, via a temporary file).
+        """
+        store = self.pair_q
+        with self._lock:
+            rows = [row for row, student_id in enumerate(store.student_ids) if student_id is not None]
+            values = store.values[rows, :len(store.skill_ids)].copy()
+            student_ids = np.array([store.student_ids[row] for row in rows], dtype=str)
+            skill_ids = np.array(store.skill_ids, dtype=str)
+            prior = self.prior.copy()
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, prior=prior, values=values, student_ids=student_ids, skill_ids=skill_ids)
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: str) -> bool:
+        """
+        Replace all Q-tables with a snapshot. Returns False if there is
+        no snapshot at `path`.
+        """
+        if not os.path.exists(path):
+            return False
+
+        with np.load(path) as data:
+            prior = data["prior"]
+            values = data["values"]
+            student_ids = data["student_ids"].tolist()
+            skill_ids = data["skill_ids"].tolist()
+
+        store = PairStore.from_arrays(
+            values.astype(self.pair_q.dtype), student_ids, skill_ids, cell_shape=self.prior.shape
         )
 
-        self.q_table[state][action] = new_q
+        self._install(prior, store)
+        return True
+
+    def _install(self, prior: np.ndarray, store: PairStore):
+        # Replace all tables; shared ones stay in place and are copied into
+        with self._lock:
+            self.prior[...] = prior
+            if self.shared is None:
+                self.pair_q = store
+            else:
+                self.pair_q.update(store)
+
+    # -------------------------------------------------
+    # Snapshots and replay (see agents.state_log)
+    # -------------------------------------------------
+    def save_state(self, directory: str):
+        """
+        Write the prior and the per-pair tables as .npy files, with the
+        interned ids in ids.json.
+        """
+        with self._lock:
+            values, student_ids, skill_ids = self.pair_q.export()
+            size = len(self.pair_q)
+            prior = self.prior.copy()
+
+        save_array(os.path.join(directory, "prior.npy"), prior)
+        save_array(os.path.join(directory, "pair_q.npy"), values)
+        write_json(
+            os.path.join(directory, "ids.json"),
+            {"students": student_ids, "skills": skill_ids, "size": size}
+        )
+
+    def load_state(self, directory: str):
+        """
+        Replace all Q-tables with a snapshot written by save_state,
+        mapping the per-pair tables rather than reading them.
+        """
+        ids = read_json(os.path.join(directory, "ids.json"))
+        store = PairStore.from_arrays(
+            load_array(os.path.join(directory, "pair_q.npy"), self.pair_q.dtype),
+            ids["students"],
+            ids["skills"],
+            cell_shape=self.prior.shape,
+            size=ids["size"]
+        )
+        prior = np.load(os.path.join(directory, "prior.npy"))
+
+        self._install(prior, store)
+
+    def replay(self, records: list):
+        """
+        Re-apply logged transitions. Records carry the tables they
+        produced, so the last one of each pair (and of each prior row)
+        is its state.
+        """
+        tables = {}
+        prior_rows = {}
+        for record in records:
+            if record[7] is not None:
+                tables[record[1], record[2]] = record[7]
+            prior_rows[record[3]] = record[8]
+
+        with self._lock:
+            for key, table in tables.items():
+                self.pair_q[key] = np.reshape(table, self.prior.shape)
+            for state, row in prior_rows.items():
+                self.prior[state] = row
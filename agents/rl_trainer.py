@@ -0,0 +1,267 @@
+"""
+Offline training for AdaptiveQuizAgent.
+
+- simulate: Q-learning on thousands of simulated students at once. Each
+  student's knowledge follows BKT dynamics with a BKTEngine's parameters;
+  the served difficulty scales the chance of learning from the question
+  by LEARN_GAIN[state, action] before the answer is observed, and the
+  agent's state and reward come from the BKT mastery estimate. Every
+  step applies the mean TD error of its transitions per (state, action)
+  to the shared table, crediting the actions actually chosen.
+- replay: logged (mastery, quiz_action) -> next mastery transitions from
+  the learning history (of the STORAGE_BACKEND storage), applied in order
+  to the shared and per-pair tables.
+
+The trained tables are exported with AdaptiveQuizAgent.snapshot, which
+the app loads from RL_SNAPSHOT_PATH at startup while its STATE_DIR has
+no checkpoint (delete the directory to serve newly trained tables).
+
+Usage:
+    python -m agents.rl_trainer simulate [--students N] [--episodes N] [--steps N] [--out PATH]
+    python -m agents.rl_trainer replay [--epochs N] [--init PATH] [--out PATH]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from database.trends import mastery_value
+
+# Multiplier on p_learn for serving each difficulty (columns: EASY,
+# MEDIUM, HARD) to a student in each mastery state (rows: LOW, MEDIUM,
+# HIGH): questions matched to the student's level teach the most.
+LEARN_GAIN = np.array([
+    [2.0, 0.7, 0.2],
+    [0.5, 2.0, 0.7],
+    [0.2, 0.7, 2.0],
+])
+
+
+class SimulatedTrainer:
+    """
+    Vectorized Q-learning against `n_students` simulated students per
+    episode of `steps` quiz questions.
+
+    `alpha` is the step size of the per-step mean TD update; it is kept
+    well below the online rate so the shared table settles instead of
+    tracking sampling noise.
+    """
+
+    def __init__(
+        self,
+        agent: AdaptiveQuizAgent | None = None,
+        bkt: BKTEngine | None = None,
+        n_students: int = 5000,
+        steps: int = 10,
+        alpha: float = 0.05,
+        learn_gain: np.ndarray = LEARN_GAIN,
+        seed: int | None = None
+    ):
+        self.agent = agent or AdaptiveQuizAgent()
+        self.bkt = bkt or BKTEngine()
+        self.n_students = n_students
+        self.steps = steps
+        self.alpha = alpha
+        self.learn_gain = np.asarray(learn_gain, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+    def _step(self, mastery: np.ndarray, known: np.ndarray) -> tuple:
+        agent, bkt, rng = self.agent, self.bkt, self.rng
+        n = len(mastery)
+        q = agent.prior
+
+        # ε-greedy over the shared table
+        states = agent._state_indices(mastery)
+        actions = np.argmax(q[states], axis=1)
+        explore = rng.random(n) < agent.epsilon
+        actions[explore] = rng.integers(0, len(agent.actions), int(explore.sum()))
+
+        # The question may teach the skill, then the answer is observed
+        p_learn = np.clip(bkt.p_learn * self.learn_gain[states, actions], 0.0, 1.0)
+        known |= rng.random(n) < p_learn
+        correct = np.where(known, rng.random(n) >= bkt.p_slip, rng.random(n) < bkt.p_guess)
+
+        next_mastery = bkt.step(mastery, correct)
+        rewards = agent.compute_reward(mastery, next_mastery)
+        next_states = agent._state_indices(next_mastery)
+
+        # Mean TD error per (state, action) cell
+        td = rewards + agent.gamma * q[next_states].max(axis=1) - q[states, actions]
+        cells = states * q.shape[1] + actions
+        sums = np.bincount(cells, weights=td, minlength=q.size)
+        counts = np.bincount(cells, minlength=q.size)
+        delta = self.alpha * sums / np.maximum(counts, 1)
+        q += delta.reshape(q.shape)
+
+        return next_mastery, rewards, float(np.abs(delta).max())
+
+    def run_episode(self) -> dict:
+        """
+        One episode for every simulated student.
+        """
+        n = self.n_students
+        mastery = np.full(n, self.bkt.p_init)
+        known = self.rng.random(n) < self.bkt.p_init
+        returns = np.zeros(n)
+        q_change = 0.0
+
+        with self.agent._lock:
+            for _ in range(self.steps):
+                mastery, rewards, delta = self._step(mastery, known)
+                returns += rewards
+                q_change = max(q_change, delta)
+
+        return {
+            "mean_return": round(float(returns.mean()), 6),
+            "final_mastery": round(float(mastery.mean()), 6),
+            "q_change": round(q_change, 6),
+        }
+
+    def train(self, episodes: int) -> dict:
+        """
+        Run `episodes` episodes. Returns throughput, the per-episode
+        convergence curve and the greedy policy.
+        """
+        curve = []
+        start = time.perf_counter()
+        for episode in range(episodes):
+            curve.append({"episode": episode + 1, **self.run_episode()})
+        elapsed = time.perf_counter() - start
+
+        return {
+            "students": self.n_students,
+            "episodes": episodes,
+            "seconds": round(elapsed, 3),
+            # Every episode runs all n_students students
+            "student_episodes_per_second": round(self.n_students * episodes / elapsed, 1),
+            "curve": curve,
+            "policy": greedy_policy(self.agent),
+        }
+
+
+def greedy_policy(agent: AdaptiveQuizAgent) -> dict:
+    """
+    Best action per state under the shared table.
+    """
+    return {
+        state: agent.actions[int(np.argmax(agent.prior[i]))]
+        for i, state in enumerate(agent.states)
+    }
+
+
+# -------------------------------------------------
+# Replay of logged transitions
+# -------------------------------------------------
+def history_transitions(docs) -> dict:
+    """
+    Consecutive (mastery, quiz_action) -> next mastery transitions of each
+    (student, skill) pair. `docs` must be sorted by student, skill and
+    time; records without mastery or without a served action are skipped.
+    """
+    transitions = {
+        "student_ids": [],
+        "skill_ids": [],
+        "mastery_before": [],
+        "mastery_after": [],
+        "actions": [],
+    }
+
+    previous = None
+    for doc in docs:
+        mastery = mastery_value(doc.get("mastery"))
+        if mastery is None:
+            continue
+        pair = (doc["student_id"], doc["skill_id"])
+
+        if previous is not None and previous[0] == pair and previous[2] is not None:
+            transitions["student_ids"].append(pair[0])
+            transitions["skill_ids"].append(pair[1])
+            transitions["mastery_before"].append(previous[1])
+            transitions["mastery_after"].append(mastery)
+            transitions["actions"].append(previous[2])
+
+        previous = (pair, mastery, doc.get("quiz_action"))
+
+    return transitions
+
+
+def load_history_transitions(storage) -> dict:
+    """
+    Transitions from a storage backend's learning history, read in
+    (student, skill, time) order.
+    """
+    return history_transitions(storage.iter_mastery_history())
+
+
+def replay(agent: AdaptiveQuizAgent, transitions: dict, epochs: int = 1) -> dict:
+    """
+    Apply logged transitions to the shared and per-pair tables `epochs`
+    times, crediting the actions that were served.
+    """
+    before = np.asarray(transitions["mastery_before"], dtype=np.float64)
+    after = np.asarray(transitions["mastery_after"], dtype=np.float64)
+    rewards = agent.compute_reward(before, after)
+
+    start = time.perf_counter()
+    for _ in range(epochs):
+        agent.update_policy_batch(
+            transitions["student_ids"],
+            before,
+            after,
+            rewards,
+            skill_ids=transitions["skill_ids"],
+            actions=transitions["actions"],
+        )
+    elapsed = time.perf_counter() - start
+
+    return {
+        "transitions": len(before),
+        "epochs": epochs,
+        "seconds": round(elapsed, 3),
+        "transitions_per_second": round(len(before) * epochs / elapsed, 1) if elapsed else None,
+        "policy": greedy_policy(agent),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline training for the adaptive quiz agent")
+    parser.add_argument("mode", choices=["simulate", "replay"])
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--episodes", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--init", help="snapshot to start from")
+    parser.add_argument("--out", default=os.getenv("RL_SNAPSHOT_PATH", "rl_q_tables.npz"))
+    args = parser.parse_args()
+
+    agent = AdaptiveQuizAgent()
+    if args.init and not agent.load_snapshot(args.init):
+        print("No snapshot at", args.init)
+
+    if args.mode == "simulate":
+        trainer = SimulatedTrainer(
+            agent, n_students=args.students, steps=args.steps, seed=args.seed
+        )
+        report = trainer.train(args.episodes)
+        for point in report.pop("curve"):
+            print(
+                f"episode {point['episode']:>4}  mean_return {point['mean_return']:.4f}  "
+                f"final_mastery {point['final_mastery']:.4f}  q_change {point['q_change']:.5f}"
+            )
+    else:
+        from database.storage import create_storage
+
+        report = replay(agent, load_history_transitions(create_storage()), args.epochs)
+
+    print(report)
+    agent.snapshot(args.out)
+    print("Exported Q-tables to", args.out)
+
+
+if __name__ == "__main__":
+    main()
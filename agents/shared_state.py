@@ -0,0 +1,321 @@
+"""
+Learned state shared by several processes (e.g. `uvicorn --workers N`).
+
+A SharedRegion is a directory of memory-mapped .npy files. Every process
+that opens the same directory sees the same mastery and Q-value arrays,
+so a student's state does not depend on which worker serves a request.
+
+- SharedPairStore is a PairStore whose values and id interning live in
+  the region. Capacity is fixed when the region is created; rows are
+  never recycled, so an id's row, once published, never changes and
+  each process caches it.
+- Reads take no lock. Values are aligned 4- or 8-byte floats, written
+  with single stores, so a reader sees either the old or the new value.
+  A new id is published by writing its slot's hash last.
+- Writes take a StripeLock: a thread lock plus an fcntl lock on a file,
+  which excludes other processes. The engines take one per shard (BKT)
+  or one for the shared prior (Q-learning); interning new ids takes the
+  id table's own lock.
+
+The files are the state: they outlive the processes and are reused by
+the next ones (delete the directory to start over or to resize).
+"""
+
+import fcntl
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from agents.pair_store import PairStore, ShardedPairStore
+
+# Longest id, in UTF-8 bytes, that the shared id tables hold
+MAX_ID_BYTES = 128
+
+
+class SharedStateFullError(Exception):
+    """
+    Raised when a shared id table is at capacity.
+    """
+
+
+class StripeLock:
+    """
+    Re-entrant lock across the threads of this process (a threading.RLock)
+    and across processes (an fcntl lock on `path`, held while the
+    outermost acquire lasts).
+    """
+
+    def __init__(self, path: str):
+        self._local = threading.RLock()
+        self._depth = 0
+        # fcntl locks drop when any descriptor of the file closes: keep
+        # this one open for the life of the process
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self):
+        self._local.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._local.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._local.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _id_hash(encoded: bytes) -> int:
+    # Stable across processes (unlike hash()); 0 marks an empty slot
+    h = int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little", signed=True)
+    return h or 1
+
+
+class SharedIdIndex:
+    """
+    id -> index interning in a shared open-addressing hash table. Indices
+    are handed out in order and never reused. Lookups are lock-free and
+    cached per process.
+    """
+
+    def __init__(self, region: "SharedRegion", name: str, capacity: int):
+        table_size = 1 << max(3, (2 * capacity - 1).bit_length())
+        self.capacity = capacity
+        self.mask = table_size - 1
+        self.hashes = region.array(f"{name}.hashes", (table_size,), np.int64)
+        self.rows = region.array(f"{name}.rows", (table_size,), np.int64)
+        self.names = region.array(f"{name}.names", (capacity,), f"S{MAX_ID_BYTES}")
+        self.count = region.array(f"{name}.count", (1,), np.int64)
+        self.lock = region.lock(name)
+
+        self._cache = {}
+        self._ids = []
+
+    def _probe(self, encoded: bytes, h: int) -> tuple:
+        # (slot, index): the slot holding the id, or the empty slot ending
+        # its probe sequence with index None
+        slot = h & self.mask
+        while True:
+            stored = int(self.hashes[slot])
+            if stored == 0:
+                return slot, None
+            if stored == h:
+                index = int(self.rows[slot])
+                if self.names[index] == encoded:
+                    return slot, index
+            slot = (slot + 1) & self.mask
+
+    def get(self, key: str, default=None):
+        index = self._cache.get(key)
+        if index is None:
+            encoded = key.encode("utf-8")
+            index = self._probe(encoded, _id_hash(encoded))[1]
+            if index is None:
+                return default
+            self._cache[key] = index
+        return index
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def intern(self, key: str) -> int:
+        """
+        Index of `key`, allocating the next one if it is new.
+        """
+        index = self.get(key)
+        if index is not None:
+            return index
+
+        encoded = key.encode("utf-8")
+        if len(encoded) > MAX_ID_BYTES or encoded.endswith(b"\0"):
+            raise ValueError(f"Id not storable in shared state: {key!r}")
+        h = _id_hash(encoded)
+        with self.lock:
+            slot, index = self._probe(encoded, h)
+            if index is None:
+                index = int(self.count[0])
+                if index >= self.capacity:
+                    raise SharedStateFullError(f"Shared id table full ({self.capacity} ids)")
+                # Name and row first: readers trust a slot once its hash is set
+                self.names[index] = encoded
+                self.rows[slot] = index
+                self.hashes[slot] = h
+                self.count[0] = index + 1
+        self._cache[key] = index
+        return index
+
+    def ids(self) -> list:
+        """
+        Every id, by index.
+        """
+        ids = self._ids
+        count = int(self.count[0])
+        if len(ids) < count:
+            ids = ids + [name.decode("utf-8") for name in self.names[len(ids):count].tolist()]
+            self._ids = ids
+        return ids
+
+    def __len__(self) -> int:
+        return int(self.count[0])
+
+
+class SharedPairStore(PairStore):
+    """
+    PairStore over a shared, fixed-size value array (students x skills x
+    *cell_shape) with shared id interning. Callers serialize writes
+    with a StripeLock; reads need no lock.
+
+    The array never grows: interning an id past capacity raises
+    SharedStateFullError. Dropping a student clears its row but keeps it.
+    The number of tracked pairs is kept in the region too, updated by
+    the writers, so len() does not scan the array.
+    """
+
+    def __init__(
+        self,
+        region: "SharedRegion",
+        name: str,
+        students: int,
+        skills: int,
+        dtype=np.float64,
+        cell_shape: tuple = ()
+    ):
+        self.dtype = np.dtype(dtype)
+        self.cell_shape = tuple(cell_shape)
+        self.values = region.array(
+            f"{name}.values", (students, skills, *self.cell_shape), self.dtype, fill=np.nan
+        )
+        self.student_index = SharedIdIndex(region, f"{name}.students", students)
+        self.skill_index = SharedIdIndex(region, f"{name}.skills", skills)
+        self._free_rows = []
+
+        # Tracked pairs; -1 in a region created before the count was kept
+        self._count = region.array(f"{name}.size", (1,), np.int64, fill=-1)
+        if self._count[0] < 0:
+            with region.lock(name):
+                if self._count[0] < 0:
+                    self._count[0] = self._scan_size()
+
+    @property
+    def _size(self) -> int:
+        return int(self._count[0])
+
+    @_size.setter
+    def _size(self, value: int):
+        # PairStore's writers update it; callers hold the write lock
+        self._count[0] = value
+
+    def _scan_size(self) -> int:
+        rows, cols = len(self.student_index), len(self.skill_index)
+        return int(np.count_nonzero(~np.isnan(self._flags(self.values[:rows, :cols]))))
+
+    @property
+    def student_ids(self) -> list:
+        return self.student_index.ids()
+
+    @property
+    def skill_ids(self) -> list:
+        return self.skill_index.ids()
+
+    def student_row(self, student_id: str) -> int:
+        return self.student_index.intern(student_id)
+
+    def skill_col(self, skill_id: str) -> int:
+        return self.skill_index.intern(skill_id)
+
+    def drop_student(self, student_id: str) -> int:
+        row = self.student_index.get(student_id)
+        if row is None:
+            return 0
+        dropped = int(np.count_nonzero(~np.isnan(self._flags(self.values[row]))))
+        self.values[row] = np.nan
+        self._size -= dropped
+        return dropped
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+
+class SharedRegion:
+    """
+    A directory of shared arrays and locks. Stores are sized for about
+    `students` students and `skills` skills; arrays are created (by
+    whichever process gets there first) on first open.
+    """
+
+    def __init__(self, directory: str, students: int = 100_000, skills: int = 64):
+        self.directory = directory
+        self.students = students
+        self.skills = skills
+        # Whether this process created any array, i.e. the region was new
+        self.created = False
+
+        os.makedirs(os.path.join(directory, "locks"), exist_ok=True)
+        self._locks = {}
+        self._create_lock = self.lock("region")
+
+    def lock(self, name: str) -> StripeLock:
+        """
+        The lock called `name`; one instance per process.
+        """
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = StripeLock(os.path.join(self.directory, "locks", name))
+        return lock
+
+    def array(self, name: str, shape: tuple, dtype, fill=None) -> np.ndarray:
+        """
+        The shared array called `name`, created with `fill` (zeros if
+        None) if it does not exist yet.
+        """
+        path = os.path.join(self.directory, name + ".npy")
+        dtype = np.dtype(dtype)
+        with self._create_lock:
+            if not os.path.exists(path):
+                tmp = path + ".tmp"
+                array = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+                if fill is not None:
+                    array[...] = fill
+                array.flush()
+                del array
+                os.replace(tmp, path)
+                self.created = True
+
+        array = np.load(path, mmap_mode="r+")
+        if array.shape != tuple(shape) or array.dtype != dtype:
+            raise ValueError(
+                f"{path} holds {array.dtype}{array.shape}, not {dtype}{tuple(shape)}; "
+                "delete the shared state directory to resize it"
+            )
+        return array
+
+    def pair_store(self, name: str, dtype=np.float64, cell_shape: tuple = ()) -> SharedPairStore:
+        return SharedPairStore(self, name, self.students, self.skills, dtype, cell_shape)
+
+    def sharded_store(self, name: str, n_shards: int, dtype=np.float64) -> ShardedPairStore:
+        """
+        A ShardedPairStore of shared shards. Students spread unevenly
+        over shards, so each gets a quarter more than an even share.
+        """
+        per_shard = -(-self.students * 5 // (4 * n_shards))
+        return ShardedPairStore(
+            dtype=dtype,
+            shards=[
+                SharedPairStore(self, f"{name}-{i:03d}", per_shard, self.skills, dtype)
+                for i in range(n_shards)
+            ]
+        )
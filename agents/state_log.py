@@ -0,0 +1,381 @@
+"""
+Write-ahead log and binary snapshots of the agents' learned state.
+
+BKTEngine and AdaptiveQuizAgent append every change of their state to
+the log, under the lock that guards the change, so records of a pair are
+in the order they were applied. A record holds the attempt or transition
+that caused the change and the state it produced, so replaying a record
+that a snapshot already reflects is harmless.
+
+A checkpoint rolls the log over to a new segment, then has each
+component write its arrays as .npy files plus a JSON id dictionary. Once
+the snapshot is complete, the segments and snapshots it covers are
+deleted. Recovery maps the latest snapshot (copy-on-write, so pages are
+read on first access) and replays only the segments written after it:
+restart time follows the activity since the last checkpoint, not the
+total history.
+
+Directory layout:
+    events-00000007.log     one JSON array per line
+    snapshot-00000007/      state as of the start of segment 7
+        bkt/ids.json, bkt/shard-000.npy, ...
+        quiz/ids.json, quiz/pair_q.npy, quiz/prior.npy
+
+Every append is written through to the OS, so a crashed process loses
+nothing; fsync happens every `sync_interval` seconds, at checkpoints and
+on close, which bounds what a machine crash can lose.
+
+When the components' state is shared by several processes (see
+agents.shared_state), each process runs a StateLog with `shared=True`
+over the same directory and nothing is appended: snapshots alone copy
+the shared state to disk, every `checkpoint_interval` seconds and on
+close, taken by one process at a time.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+SEGMENT_NAME = "events-{:08d}.log"
+SNAPSHOT_NAME = "snapshot-{:08d}"
+SEGMENT_PATTERN = re.compile(r"events-(\d{8})\.log")
+SNAPSHOT_PATTERN = re.compile(r"snapshot-(\d{8})")
+
+# Records handed to a component's replay() at a time
+REPLAY_BATCH = 10_000
+
+
+# -------------------------------------------------
+# Snapshot files
+# -------------------------------------------------
+def save_array(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_array(path: str, dtype=None) -> np.ndarray:
+    """
+    Map a .npy file copy-on-write: writes stay private to the process.
+    """
+    array = np.load(path, mmap_mode="c")
+    if dtype is not None and array.dtype != np.dtype(dtype):
+        return array.astype(dtype)
+    return array
+
+
+def write_json(path: str, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_json(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StateLog:
+    """
+    Append-only log of state changes plus periodic snapshots, in one
+    directory.
+
+    Components are registered under their `log_kind`, the first element
+    of every record they append, and implement:
+    - save_state(directory): write a snapshot of their state
+    - load_state(directory): replace their state with a snapshot
+    - replay(records): re-apply logged records, in order
+
+    A background thread fsyncs the log and checkpoints every
+    `checkpoint_interval` seconds, or as soon as `checkpoint_events`
+    records were appended since the last checkpoint. Nothing is written
+    while no records arrive.
+
+    With `shared`, the components' state is shared with other processes
+    running a StateLog over the same directory. Checkpoints then run
+    every `checkpoint_interval` seconds whether or not records arrive.
+    They take an fcntl lock on the directory and are skipped when
+    another process completed one within half the interval.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sync_interval: float = 1.0,
+        checkpoint_interval: float = 300.0,
+        checkpoint_events: int = 1_000_000,
+        shared: bool = False
+    ):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_events = checkpoint_events
+        self.shared = shared
+        self.components = {}
+
+        # Segment being appended to, opened on the first append
+        self._file = None
+        self.segment = None
+        # Records appended since the last checkpoint
+        self.pending = 0
+
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        # Excludes other processes' checkpoints; kept open, as fcntl locks
+        # drop when any descriptor of the file closes
+        self._dir_lock = None
+        if shared:
+            self._dir_lock = os.open(os.path.join(directory, "checkpoint.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def register(self, component):
+        self.components[component.log_kind] = component
+
+    def start(self):
+        """
+        Start the background sync and checkpoint thread.
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="state-log", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """
+        Stop the thread, checkpoint if anything was logged since the last
+        checkpoint, and close the log.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.pending:
+            self.checkpoint()
+        elif self.shared:
+            # Processes stopping together write one final snapshot
+            self.checkpoint(min_age=self.sync_interval)
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    # -------------------------------------------------
+    # Files
+    # -------------------------------------------------
+    def _numbers(self, pattern) -> list[int]:
+        return sorted(
+            int(match.group(1))
+            for match in map(pattern.fullmatch, os.listdir(self.directory))
+            if match
+        )
+
+    def _roll(self) -> int:
+        # Caller holds self._lock. Later records go to a new segment,
+        # numbered past every segment and snapshot on disk.
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        segment = max(
+            self._numbers(SEGMENT_PATTERN) + self._numbers(SNAPSHOT_PATTERN), default=0
+        ) + 1
+        path = os.path.join(self.directory, SEGMENT_NAME.format(segment))
+        self._file = open(path, "a", encoding="utf-8")
+        self.segment = segment
+        return segment
+
+    def latest_snapshot(self) -> str | None:
+        """
+        Path of the newest complete snapshot, if any.
+        """
+        snapshots = self._numbers(SNAPSHOT_PATTERN)
+        if not snapshots:
+            return None
+        return os.path.join(self.directory, SNAPSHOT_NAME.format(snapshots[-1]))
+
+    def snapshot_age(self) -> float:
+        """
+        Seconds since the newest complete snapshot was written (infinite
+        if there is none).
+        """
+        snapshot = self.latest_snapshot()
+        if snapshot is None:
+            return float("inf")
+        return time.time() - os.path.getmtime(snapshot)
+
+    # -------------------------------------------------
+    # Appending
+    # -------------------------------------------------
+    def append(self, record):
+        self.append_many((record,))
+
+    def append_many(self, records):
+        """
+        Append records (JSON-serializable sequences) in order.
+        """
+        lines = [json.dumps(record, separators=(",", ":")) + "\n" for record in records]
+        if not lines:
+            return
+        with self._lock:
+            if self._file is None:
+                self._roll()
+            self._file.write("".join(lines))
+            self._file.flush()
+            self.pending += len(lines)
+            due = self.pending >= self.checkpoint_events
+        if due:
+            self._wakeup.set()
+
+    def sync(self):
+        """
+        fsync the current segment. Appends are not blocked meanwhile.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # -------------------------------------------------
+    # Checkpoints and recovery
+    # -------------------------------------------------
+    def checkpoint(self, min_age: float | None = None) -> int | None:
+        """
+        Snapshot every component, then delete the segments and snapshots
+        the new snapshot covers. Returns its segment number, or None if
+        skipped because the latest snapshot is under `min_age` seconds old.
+        """
+        with self._checkpoint_lock:
+            if self._dir_lock is not None:
+                fcntl.lockf(self._dir_lock, fcntl.LOCK_EX)
+            try:
+                if min_age is not None and self.snapshot_age() < min_age:
+                    return None
+                return self._checkpoint()
+            finally:
+                if self._dir_lock is not None:
+                    fcntl.lockf(self._dir_lock, fcntl.LOCK_UN)
+
+    def _checkpoint(self) -> int:
+        # Caller holds the checkpoint locks
+        with self._lock:
+            segment = self._roll()
+            self.pending = 0
+
+        # Components are copied after the rollover: changes made during
+        # the copy are in both the snapshot and the new segment
+        final = os.path.join(self.directory, SNAPSHOT_NAME.format(segment))
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        for kind, component in self.components.items():
+            path = os.path.join(tmp, kind)
+            os.makedirs(path)
+            component.save_state(path)
+        os.replace(tmp, final)
+        _fsync_dir(self.directory)
+
+        for old in self._numbers(SNAPSHOT_PATTERN):
+            if old < segment:
+                shutil.rmtree(os.path.join(self.directory, SNAPSHOT_NAME.format(old)))
+        for old in self._numbers(SEGMENT_PATTERN):
+            if old < segment:
+                os.remove(os.path.join(self.directory, SEGMENT_NAME.format(old)))
+        return segment
+
+    def recover(self) -> int:
+        """
+        Load the latest snapshot into the registered components and replay
+        the segments written after it. Returns the number of records
+        replayed.
+        """
+        start = 0
+        snapshot = self.latest_snapshot()
+        if snapshot is not None:
+            start = int(SNAPSHOT_PATTERN.fullmatch(os.path.basename(snapshot)).group(1))
+            for kind, component in self.components.items():
+                path = os.path.join(snapshot, kind)
+                if os.path.isdir(path):
+                    component.load_state(path)
+
+        replayed = 0
+        for segment in self._numbers(SEGMENT_PATTERN):
+            if segment >= start:
+                for records in self._read_segment(segment):
+                    self._replay(records)
+                    replayed += len(records)
+        return replayed
+
+    def _read_segment(self, segment: int):
+        path = os.path.join(self.directory, SEGMENT_NAME.format(segment))
+        batch = []
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError("incomplete record")
+                    batch.append(json.loads(line))
+                except ValueError as e:
+                    # A write torn by a crash ends the segment
+                    print(f"State log {path}:{line_no} ignored from here:", e)
+                    break
+                if len(batch) >= REPLAY_BATCH:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _replay(self, records: list):
+        by_kind = {}
+        for record in records:
+            by_kind.setdefault(record[0], []).append(record)
+        for kind, kind_records in by_kind.items():
+            component = self.components.get(kind)
+            if component is None:
+                print(f"State log: no component for {len(kind_records)} '{kind}' records")
+                continue
+            component.replay(kind_records)
+
+    def _run(self):
+        last_checkpoint = time.monotonic()
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+            try:
+                self.sync()
+                if self.pending and (
+                    self.pending >= self.checkpoint_events
+                    or time.monotonic() - last_checkpoint >= self.checkpoint_interval
+                ):
+                    self.checkpoint()
+                    last_checkpoint = time.monotonic()
+                elif self.shared and time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    self.checkpoint(min_age=self.checkpoint_interval / 2)
+                    last_checkpoint = time.monotonic()
+            except Exception as e:
+                print("State log checkpoint failed:", e)
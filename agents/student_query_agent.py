@@ -1,73 +1,362 @@
-import requests
+import asyncio
+import json
 import os
+import time
+from contextlib import contextmanager
+
+import httpx
+import requests
+
+from agents.answer_cache import AnswerCache
+from agents.circuit_breaker import CircuitBreaker, CircuitOpenError
+from agents.knowledge_base import DEFAULT_PATH as KNOWLEDGE_BASE_PATH, KnowledgeBase
+from agents.llm_batcher import MicroBatcher
+from metrics import LLM_ERRORS, LLM_LATENCY, timed
+
+DEFAULT_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+UNAVAILABLE_ANSWER = "AI service is temporarily unavailable. Please try again later."
+
+
+class UpstreamError(Exception):
+    """
+    Non-200 response from the LLM.
+    """
+
+    def __init__(self, status_code: int):
+        super().__init__(f"LLM unavailable (HTTP {status_code})")
+        self.status_code = status_code
+
+
+def _error_kind(error: Exception) -> str:
+    if isinstance(error, UpstreamError):
+        return f"http_{error.status_code}"
+    if isinstance(error, (httpx.TimeoutException, requests.Timeout)):
+        return "timeout"
+    if isinstance(error, (httpx.TransportError, requests.ConnectionError)):
+        return "connection"
+    return type(error).__name__
+
 
 class StudentQueryAgent:
-    def __init__(self):
-        self.api_key = os.getenv("HF_API_KEY")
-        self.api_url = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+    """
+    Answers student questions with the hosted LLM, falling back to the
+    offline knowledge base when no API key is configured.
+
+    The async path shares one keep-alive connection pool and caps the
+    number of concurrent upstream calls, so slow generations cannot tie
+    up more than `max_concurrency` requests' worth of resources.
+
+    With `batch_size` > 1, concurrent async generations are micro-batched:
+    questions arriving within `batch_wait_ms` of each other are sent as one
+    inference call with a list of inputs (see agents.llm_batcher).
+
+    stream_answer_async yields the answer token by token as the LLM
+    generates it (text-generation-inference streaming).
+
+    Upstream calls go through a circuit breaker: after repeated failures or
+    slow calls the agent stops calling the LLM for a while and answers
+    from the cache or the offline knowledge base immediately. Their
+    latency and errors are recorded in the LLM metrics (metrics.py).
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        api_url: str | None = None,
+        max_concurrency: int | None = None,
+        timeout: float | None = None,
+        connect_timeout: float | None = None,
+        cache: AnswerCache | None = None,
+        batch_size: int | None = None,
+        batch_wait_ms: float | None = None,
+        breaker: CircuitBreaker | None = None,
+        knowledge_base: KnowledgeBase | None = None
+    ):
+        self.api_key = api_key or os.getenv("HF_API_KEY")
+        self.api_url = api_url or os.getenv("HF_API_URL", DEFAULT_API_URL)
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
-def answer_question(self, student_id: str, question: str) -> dict:
-    question_lower = question.lower()
-
-    # ---------- Intelligent Rule-Based Fallback ----------
-    if not self.api_key:
-        if "java" in question_lower:
-            answer = (
-                "Java is a high-level, object-oriented programming language "
-                "used to build platform-independent applications.\n\n"
-                "Example:\n"
-                "A banking system built in Java can run on Windows, Linux, or macOS "
-                "using the Java Virtual Machine (JVM)."
-            )
-        elif "hadoop" in question_lower:
-            answer = (
-                "Hadoop is an open-source Big Data framework used for storing and "
-                "processing large datasets across distributed systems.\n\n"
-                "Example:\n"
-                "Companies like Facebook use Hadoop to process petabytes of user data."
-            )
-        else:
-            answer = (
-                "This is a conceptual question. Please provide more context "
-                "or specify the topic for a clearer explanation."
-            )
 
-        return {
-            "student_id": student_id,
-            "question": question,
-            "answer": answer
-        }
+        # Upstream limits
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "30"))
+        self.connect_timeout = connect_timeout or float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+
+        # Micro-batching of async generations (batch_size <= 1 disables)
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("LLM_BATCH_SIZE", "0"))
+        self.batch_wait_ms = batch_wait_ms if batch_wait_ms is not None else float(os.getenv("LLM_BATCH_WAIT_MS", "10"))
 
-    # ---------- LLM-Based Answer (Primary Path) ----------
-    payload = {
-        "inputs": f"Answer clearly with explanation and examples:\n{question}"
-    }
-
-    try:
-        response = requests.post(
-            self.api_url,
-            headers=self.headers,
-            json=payload,
-            timeout=30
+        # Offline answers (agents/knowledge_base.json unless overridden)
+        self.knowledge_base = knowledge_base or KnowledgeBase.load(
+            os.getenv("KNOWLEDGE_BASE_PATH", KNOWLEDGE_BASE_PATH)
         )
 
-        if response.status_code != 200:
-            raise Exception("LLM unavailable")
+        # Fast-fail guard around every upstream call
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            slow_call_seconds=float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "10")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+        )
 
-        result = response.json()
-        generated_text = result[0]["generated_text"]
+        # Generated answers keyed by normalized question (None disables)
+        self.cache = cache
 
+        # Keep-alive session for the sync path
+        self.session = requests.Session()
+
+        # Async client and concurrency cap, created on first use
+        self._client = None
+        self._semaphore = None
+        self._batcher = None
+
+    # -------------------------------------------------
+    # Helpers
+    # -------------------------------------------------
+    def _fallback_answer(self, question: str) -> str:
+        return self.knowledge_base.answer(question)
+
+    def _payload(self, question: str) -> dict:
         return {
-            "student_id": student_id,
-            "question": question,
-            "answer": generated_text
+            "inputs": f"Answer clearly with explanation and examples:\n{question}"
         }
 
-    except Exception:
+    def _result(self, student_id: str, question: str, answer: str) -> dict:
         return {
             "student_id": student_id,
             "question": question,
-            "answer": "AI service is temporarily unavailable. Please try again later."
+            "answer": answer
         }
+
+    def _async_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            if self.batch_size > 1:
+                self._batcher = MicroBatcher(
+                    self._generate_batch_async,
+                    max_batch_size=self.batch_size,
+                    max_wait_ms=self.batch_wait_ms
+                )
+        return self._client
+
+    @contextmanager
+    def _upstream(self, mode: str):
+        """
+        Guard one upstream call with the breaker and record it in the
+        LLM metrics under `mode`.
+        """
+        start = time.perf_counter()
+        try:
+            with self.breaker.guard():
+                yield
+        except CircuitOpenError:
+            LLM_ERRORS.labels(mode, "circuit_open").inc()
+            raise
+        except Exception as e:
+            LLM_ERRORS.labels(mode, _error_kind(e)).inc()
+            LLM_LATENCY.labels(mode).observe(time.perf_counter() - start)
+            raise
+        LLM_LATENCY.labels(mode).observe(time.perf_counter() - start)
+
+    async def aclose(self):
+        """
+        Close the async connection pool.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+            self._batcher = None
+
+    # -------------------------------------------------
+    # Answering
+    # -------------------------------------------------
+    def _generate(self, question: str) -> str:
+        """
+        One upstream generation. Raises on any failure.
+        """
+        with self._upstream("sync"):
+            response = self.session.post(
+                self.api_url,
+                headers=self.headers,
+                json=self._payload(question),
+                timeout=(self.connect_timeout, self.timeout)
+            )
+
+            if response.status_code != 200:
+                raise UpstreamError(response.status_code)
+
+        result = response.json()
+        return result[0]["generated_text"]
+
+    async def _generate_async(self, question: str) -> str:
+        """
+        One upstream generation over the pooled async client.
+        Raises on any failure.
+        """
+        client = self._async_client()
+        if self._batcher is not None:
+            return await self._batcher.submit(question)
+
+        async with self._semaphore:
+            with self._upstream("async"):
+                response = await client.post(self.api_url, json=self._payload(question))
+
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code)
+
+        result = response.json()
+        return result[0]["generated_text"]
+
+    async def _generate_batch_async(self, questions: list[str]) -> list[str]:
+        """
+        One batched upstream generation: a list of inputs in, one
+        generated text per input out, in order. Raises on any failure.
+        """
+        client = self._async_client()
+        payload = {"inputs": [self._payload(q)["inputs"] for q in questions]}
+
+        async with self._semaphore:
+            with self._upstream("batch"):
+                response = await client.post(self.api_url, json=payload)
+
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code)
+
+        # The inference API nests one result list per input
+        return [
+            (item[0] if isinstance(item, list) else item)["generated_text"]
+            for item in response.json()
+        ]
+
+    @timed("query", "answer_question")
+    def answer_question(self, student_id: str, question: str) -> dict:
+        # ---------- Intelligent Rule-Based Fallback ----------
+        if not self.api_key:
+            return self._result(student_id, question, self._fallback_answer(question))
+
+        # ---------- LLM-Based Answer (Primary Path) ----------
+        try:
+            if self.cache is not None:
+                generated_text = self.cache.get_or_compute(
+                    question, lambda: self._generate(question)
+                )
+            else:
+                generated_text = self._generate(question)
+
+            return self._result(student_id, question, generated_text)
+
+        except CircuitOpenError:
+            return self._result(student_id, question, self._fallback_answer(question))
+
+        except Exception:
+            return self._result(student_id, question, UNAVAILABLE_ANSWER)
+
+    @timed("query", "answer_question_async")
+    async def answer_question_async(self, student_id: str, question: str) -> dict:
+        """
+        Non-blocking variant of answer_question over the pooled client.
+        """
+        if not self.api_key:
+            return self._result(student_id, question, self._fallback_answer(question))
+
+        try:
+            if self.cache is not None:
+                generated_text = await self.cache.get_or_compute_async(
+                    question, lambda: self._generate_async(question)
+                )
+            else:
+                generated_text = await self._generate_async(question)
+
+            return self._result(student_id, question, generated_text)
+
+        except CircuitOpenError:
+            return self._result(student_id, question, self._fallback_answer(question))
+
+        except Exception:
+            return self._result(student_id, question, UNAVAILABLE_ANSWER)
+
+    # -------------------------------------------------
+    # Streaming
+    # -------------------------------------------------
+    async def _stream_generate(self, question: str):
+        """
+        Token texts of one streamed upstream generation. The breaker
+        judges the call by its time to first byte; failures after that
+        raise to the consumer without counting against the circuit.
+        """
+        client = self._async_client()
+
+        async with self._semaphore:
+            with self._upstream("stream"):
+                request = client.build_request(
+                    "POST", self.api_url, json={**self._payload(question), "stream": True}
+                )
+                response = await client.send(request, stream=True)
+                if response.status_code != 200:
+                    await response.aclose()
+                    raise UpstreamError(response.status_code)
+
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    token = json.loads(line[len("data:"):]).get("token") or {}
+                    if token.get("text") and not token.get("special"):
+                        yield token["text"]
+            finally:
+                await response.aclose()
+
+    async def stream_answer_async(self, student_id: str, question: str):
+        """
+        Streaming variant of answer_question_async. Yields {"token": text}
+        events as the answer is generated, then a final
+        {"done": True, "student_id", "question", "answer"} event with the
+        full answer ("truncated": True if the upstream stream broke off).
+        Offline, cached and fast-failed answers arrive as a single token.
+        """
+        answer = None
+        if not self.api_key:
+            answer = self._fallback_answer(question)
+        elif self.cache is not None:
+            answer = await self.cache.get_async(question)
+
+        if answer is not None:
+            yield {"token": answer}
+            yield {"done": True, **self._result(student_id, question, answer)}
+            return
+
+        tokens = []
+        generated = truncated = False
+        try:
+            async for token in self._stream_generate(question):
+                tokens.append(token)
+                yield {"token": token}
+            generated = True
+
+        except CircuitOpenError:
+            tokens = [self._fallback_answer(question)]
+            yield {"token": tokens[0]}
+
+        except Exception:
+            if tokens:
+                truncated = True
+            else:
+                tokens = [UNAVAILABLE_ANSWER]
+                yield {"token": UNAVAILABLE_ANSWER}
+
+        answer = "".join(tokens)
+        done = {"done": True, **self._result(student_id, question, answer)}
+        if truncated:
+            done["truncated"] = True
+        elif generated and self.cache is not None:
+            await asyncio.to_thread(self.cache.put, question, answer)
+        yield done
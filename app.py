@@ -1,44 +1,184 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Literal
+
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from metrics import REGISTRY, STATE_SIZE, MetricsMiddleware, SamplingProfiler, profiled
 
 # Database
-# Database collections
-from database.db import (
-    students_collection,
-    history_collection,
-    bkt_states_collection,
-    learning_history_collection,
-    analytics_collection,
+from database.models import (
+    bkt_state_document,
+    attempt_document,
+    learning_history_document,
 )
-
-# Optional DB health check
-try:
-    from database.db import check_db_connection
-except ImportError:
-    check_db_connection = None
+from database.storage import RejectedWriteError, create_storage
+from database.trends import learning_gain
+from database.write_behind import WriteBehindWriter
 
 # Agents
+from agents.answer_cache import AnswerCache
 from agents.student_query_agent import StudentQueryAgent
 from agents.bkt_agent import BKTEngine
+from agents.bkt_fit import load_param_table
 from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.shared_state import SharedRegion
+from agents.state_log import StateLog
 from agents.controller import MultiAgentController
-from database.db import check_db_connection
 
 
 # -------------------------------------------------
 # App initialization
 # -------------------------------------------------
+# History, BKT state, attempts, trends and cached answers live in the
+# backend chosen by STORAGE_BACKEND (mongo, sqlite or memory)
+storage = create_storage()
+
+# BKT persistence is write-behind: endpoints update memory and enqueue,
+# a background thread flushes to storage in bulk.
+bkt_writer = WriteBehindWriter(storage)
+
+
+def load_bkt_states(student_id: str) -> dict:
+    """
+    Persisted {skill_id: mastery} rows of a student, overlaid with states
+    still waiting in the write-behind buffer.
+    """
+    states = storage.load_bkt_states(student_id)
+    states.update(bkt_writer.pending_states(student_id))
+    return states
+
+
+def enqueue_bkt_state(student_id: str, skill_id: str, mastery: float):
+    """
+    Queue a changed BKT state for write-behind; evicted students are paged
+    back in from these. Called by the engine under the student's shard
+    lock, so the last state queued for a pair is its latest.
+    """
+    # Persist the unrounded state so a warm start resumes exactly
+    bkt_writer.enqueue_state(bkt_state_document(
+        student_id=student_id,
+        skill_id=skill_id,
+        mastery=mastery,
+    ))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storage.ensure_schema()
+    bkt_writer.start()
+    # Shared state is recovered only into a new region, by the process
+    # that created it; the others find it filled
+    if shared_state is None or shared_state.created:
+        # Offline-trained Q-tables seed a state directory without a checkpoint
+        if state_log.latest_snapshot() is None and rl_agent.load_snapshot(RL_SNAPSHOT_PATH):
+            print("Loaded Q-tables from", RL_SNAPSHOT_PATH)
+        replayed = state_log.recover()
+        print(f"Recovered learned state from {STATE_DIR} ({replayed} logged changes replayed)")
+    state_log.start()
+    yield
+    state_log.close()
+    bkt_writer.close()
+    await query_agent.aclose()
+    storage.close()
+
+
 app = FastAPI(
     title="Agentic Personalized Learning Assistant",
     description="AI-Based Agentic Learning System Backend",
     version="1.0",
+    lifespan=lifespan,
 )
 
+# Per-route latency for GET /metrics; PROFILE_SAMPLE_RATE > 0 profiles
+# that fraction of requests (see GET/POST /metrics/profile)
+profiler = SamplingProfiler(rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")))
+app.add_middleware(MetricsMiddleware, profiler=profiler)
+
 # Agents
-query_agent = StudentQueryAgent()
-bkt_engine = BKTEngine()
-rl_agent = AdaptiveQuizAgent()
-controller = MultiAgentController()
+# Generated answers are cached per normalized question, in memory and
+# in the storage backend's answer cache (if it has one)
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+    store=storage.answer_store(),
+)
+query_agent = StudentQueryAgent(cache=answer_cache)
+# Default page size of GET /history
+HISTORY_PAGE_SIZE = 100
+
+# POST /bkt/attempts/bulk: lines applied and persisted per chunk, and
+# the longest line accepted
+BULK_CHUNK_LINES = int(os.getenv("BULK_CHUNK_LINES", "1000"))
+BULK_MAX_LINE_BYTES = 64 * 1024
+EPOCH = datetime(1970, 1, 1)
+
+# With SHARED_STATE_DIR set (to run several workers, e.g. on /dev/shm),
+# BKT mastery and Q-tables live in memory-mapped files there, shared by
+# every worker process (see agents/shared_state.py). The files are not
+# durable (tmpfs), so the workers still snapshot them to STATE_DIR.
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR")
+shared_state = None
+if SHARED_STATE_DIR:
+    shared_state = SharedRegion(
+        SHARED_STATE_DIR,
+        students=int(os.getenv("SHARED_STATE_STUDENTS", "100000")),
+        skills=int(os.getenv("SHARED_STATE_SKILLS", "64")),
+    )
+
+# Learned state is logged ahead to STATE_DIR and checkpointed there;
+# startup maps the last checkpoint and replays the log written since (see
+# agents/state_log.py). Shared state is only checkpointed, by one worker
+# at a time: several workers cannot append to one log.
+STATE_DIR = os.getenv("STATE_DIR", "state")
+state_log = StateLog(
+    STATE_DIR,
+    checkpoint_interval=float(os.getenv("STATE_CHECKPOINT_SECONDS", "300")),
+    checkpoint_events=int(os.getenv("STATE_CHECKPOINT_EVENTS", "1000000")),
+    shared=shared_state is not None,
+)
+engine_log = None if shared_state else state_log
+
+# Students are paged in from stored BKT states on first touch; idle ones
+# are evicted (except from shared state, which is sized up front)
+# Per-skill parameters fitted by `python -m agents.bkt_fit`, if present
+bkt_engine = BKTEngine(
+    loader=load_bkt_states,
+    max_students=None if shared_state else int(os.getenv("BKT_MAX_RESIDENT_STUDENTS", "100000")),
+    params=load_param_table(os.getenv("BKT_PARAMS_PATH", "bkt_params.json")),
+    log=engine_log,
+    shared=shared_state,
+    on_change=enqueue_bkt_state,
+)
+# Per-(student, skill) Q-tables; those trained by `python -m agents.rl_trainer`
+# are loaded at startup into new state
+rl_agent = AdaptiveQuizAgent(log=engine_log, shared=shared_state)
+RL_SNAPSHOT_PATH = os.getenv("RL_SNAPSHOT_PATH", "rl_q_tables.npz")
+
+state_log.register(bkt_engine)
+state_log.register(rl_agent)
+
+# One set of agents shared by the endpoints and the controller, so /learn
+# and /bkt/* read and update the same state
+controller = MultiAgentController(
+    query_agent=query_agent,
+    bkt_agent=bkt_engine,
+    rl_agent=rl_agent,
+)
+
+# In-memory state sizes, read at every scrape
+STATE_SIZE.labels("bkt_pairs").set_function(lambda: len(bkt_engine.knowledge_state))
+STATE_SIZE.labels("rl_pair_tables").set_function(lambda: len(rl_agent.pair_q))
+STATE_SIZE.labels("answer_cache").set_function(lambda: len(answer_cache))
+STATE_SIZE.labels("bkt_write_behind_pending").set_function(bkt_writer.pending)
+STATE_SIZE.labels("state_log_since_checkpoint").set_function(lambda: state_log.pending)
 
 
 # -------------------------------------------------
@@ -49,6 +189,10 @@ class QueryRequest(BaseModel):
     question: str
 
 
+class StreamQueryRequest(QueryRequest):
+    skill_id: str | None = None
+
+
 class BKTInitRequest(BaseModel):
     student_id: str
     skill_id: str
@@ -60,6 +204,10 @@ class BKTUpdateRequest(BaseModel):
     is_correct: bool
 
 
+class AttemptLine(BKTUpdateRequest):
+    timestamp: datetime | None = None
+
+
 class LearnRequest(BaseModel):
     student_id: str
     skill_id: str
@@ -70,19 +218,22 @@ class LearnRequest(BaseModel):
 class QuizNextRequest(BaseModel):
     student_id: str
     mastery: float
+    skill_id: str | None = None
 
 
 class QuizFeedbackRequest(BaseModel):
     student_id: str
     mastery_before: float
     mastery_after: float
+    skill_id: str | None = None
+    action: Literal["EASY", "MEDIUM", "HARD"] | None = None
 
 @app.get("/")
 def health():
-   
     return {
         "api": "OK",
-        "database": "Connected" if db_status else "Not Connected",
+        "storage": storage.name,
+        "database": "Connected" if storage.ping() else "Not Connected",
     }
 
 
@@ -92,39 +243,73 @@ def health():
 # LLM Query
 # -------------------------------------------------
 @app.post("/query")
-def query_student(request: QueryRequest):
-    return query_agent.answer_question(
+async def query_student(request: QueryRequest):
+    return await query_agent.answer_question_async(
         student_id=request.student_id,
         question=request.question,
     )
 
 
+@app.post("/query/stream")
+async def query_student_stream(
+    request: StreamQueryRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+):
+    """
+    Stream the answer as it is generated: {"token": ...} events followed
+    by a final {"done": true, ...} event with the full answer, as NDJSON
+    or server-sent events. The full answer is saved to learning history
+    once the stream completes.
+    """
+    async def events():
+        async for event in query_agent.stream_answer_async(
+            request.student_id, request.question
+        ):
+            if event.get("done"):
+                history_doc = learning_history_document(
+                    student_id=request.student_id,
+                    skill_id=request.skill_id,
+                    question=request.question,
+                    answer={k: v for k, v in event.items() if k != "done"},
+                    is_correct=None,
+                    mastery=None,
+                    quiz_action=None,
+                )
+                await run_in_threadpool(storage.insert_history, history_doc)
+
+            line = json.dumps(event)
+            yield f"data: {line}\n\n" if format == "sse" else line + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+
+@app.get("/query/cache")
+def answer_cache_stats():
+    return answer_cache.snapshot()
+
+
+@app.get("/query/breaker")
+def llm_breaker_state():
+    return query_agent.breaker.snapshot()
+
+
 # -------------------------------------------------
 # BKT Endpoints
 # -------------------------------------------------
 @app.post("/bkt/init")
+@profiled
 def initialize_bkt(request: BKTInitRequest):
     result = bkt_engine.initialize_skill(
         student_id=request.student_id,
         skill_id=request.skill_id,
     )
 
-    doc = bkt_state_document(
-        student_id=request.student_id,
-        skill_id=request.skill_id,
-        mastery=result["mastery"],
-    )
-
-    bkt_states_collection.update_one(
-        {"student_id": request.student_id, "skill_id": request.skill_id},
-        {"$set": doc},
-        upsert=True,
-    )
-
     return result
 
 
 @app.post("/bkt/update")
+@profiled
 def update_bkt(request: BKTUpdateRequest):
     result = bkt_engine.update_skill(
         student_id=request.student_id,
@@ -132,30 +317,207 @@ def update_bkt(request: BKTUpdateRequest):
         is_correct=request.is_correct,
     )
 
-    state_doc = bkt_state_document(
-        student_id=request.student_id,
-        skill_id=request.skill_id,
-        mastery=result["mastery"],
-    )
+    enqueue_bkt_attempt(request.student_id, request.skill_id, request.is_correct)
 
-    bkt_states_collection.update_one(
-        {"student_id": request.student_id, "skill_id": request.skill_id},
-        {"$set": state_doc},
-        upsert=True,
-    )
+    return result
 
-    attempt_doc = attempt_document(
-        student_id=request.student_id,
-        skill_id=request.skill_id,
-        is_correct=request.is_correct,
+
+def enqueue_bkt_attempt(student_id: str, skill_id: str, is_correct: bool):
+    """
+    Queue an attempt for write-behind. The state it produced is queued
+    by the engine (enqueue_bkt_state).
+    """
+    bkt_writer.enqueue_attempt(attempt_document(
+        student_id=student_id,
+        skill_id=skill_id,
+        is_correct=is_correct,
+    ))
+
+
+@app.post("/bkt/attempts/bulk")
+async def bulk_attempts(request: Request):
+    """
+    Ingest graded attempts streamed as NDJSON, one
+    {"student_id", "skill_id", "is_correct"[, "timestamp"]} object per
+    line. Every BULK_CHUNK_LINES lines are applied to the BKT state and
+    persisted with one bulk write per kind.
+
+    Within a chunk, the attempts of each (student, skill) are applied in
+    timestamp order (line order for equal timestamps); lines without a
+    timestamp are stamped with their arrival time. Chunks are applied in
+    upload order, so an attempt older than one of its pair in an earlier
+    chunk is still applied after it: upload attempts sorted by time.
+
+    The response is NDJSON, streamed while the upload is read: one
+    {"line", "status", "mastery" | "error"} object per non-blank line,
+    sent as soon as its chunk is processed, then {"done": true, "lines",
+    "ok", "queued", "error"}. "queued" lines were applied, but their
+    chunk's write failed and is retried by the write-behind writer. The
+    next chunk is read only once the previous statuses are sent, so
+    memory use is bounded by the chunk size, whatever the upload size.
+    """
+    async def stream_statuses():
+        totals = {"ok": 0, "queued": 0, "error": 0}
+        chunk = []
+        lines = 0
+
+        async def flush():
+            statuses = await run_in_threadpool(ingest_attempt_chunk, chunk)
+            for status in statuses:
+                totals[status["status"]] += 1
+            return "".join(json.dumps(status) + "\n" for status in statuses)
+
+        async for line_no, line in _ndjson_lines(request.stream(), BULK_MAX_LINE_BYTES):
+            chunk.append((line_no, line))
+            lines = line_no
+            if len(chunk) >= BULK_CHUNK_LINES:
+                yield await flush()
+                chunk = []
+        if chunk:
+            yield await flush()
+
+        yield json.dumps({"done": True, "lines": lines, **totals}) + "\n"
+
+    return _DuplexStreamingResponse(stream_statuses(), media_type="application/x-ndjson")
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that can be sent while the request body is still
+    being read. Starlette's stock one listens for the client disconnect
+    on `receive`, which would swallow the body messages; here the body
+    read itself ends the stream (ClientDisconnect) if the client leaves.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def _ndjson_lines(chunks, max_line_bytes: int):
+    """
+    (line number, bytes) of every non-blank line of a streamed body.
+    Lines longer than `max_line_bytes` are discarded as they arrive and
+    come through as None.
+    """
+    buffer = b""
+    line_no = 0
+    oversized = False
+
+    async for data in chunks:
+        buffer += data
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            line = buffer[start:end]
+            start = end + 1
+            line_no += 1
+            if oversized or len(line) > max_line_bytes:
+                oversized = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        buffer = buffer[start:]
+
+        if len(buffer) > max_line_bytes:
+            oversized = True
+            buffer = b""
+
+    if oversized:
+        yield line_no + 1, None
+    elif buffer.strip():
+        yield line_no + 1, buffer
+
+
+def _validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        ".".join(str(part) for part in detail["loc"]) + ": " + detail["msg"]
+        if detail["loc"] else detail["msg"]
+        for detail in error.errors()
     )
 
-    bkt_attempts_collection.insert_one(attempt_doc)
 
-    return result
+def ingest_attempt_chunk(lines: list[tuple]) -> list[dict]:
+    """
+    Parse, apply and persist one chunk of NDJSON attempt lines. Returns
+    a status per line, in line order.
+    """
+    statuses = []
+    attempts = []
+    for line_no, raw in lines:
+        if raw is None:
+            statuses.append({
+                "line": line_no,
+                "status": "error",
+                "error": f"Line longer than {BULK_MAX_LINE_BYTES} bytes",
+            })
+            continue
+        try:
+            attempt = AttemptLine.model_validate_json(raw)
+        except ValidationError as e:
+            statuses.append({"line": line_no, "status": "error", "error": _validation_error(e)})
+            continue
+
+        status = {"line": line_no, "status": "ok"}
+        statuses.append(status)
+        attempts.append((status, attempt))
+
+    if not attempts:
+        return statuses
+
+    # Attempt timestamps as naive UTC; arrival time when missing
+    attempt_docs = []
+    for _, attempt in attempts:
+        doc = attempt_document(attempt.student_id, attempt.skill_id, attempt.is_correct)
+        if attempt.timestamp is not None:
+            timestamp = attempt.timestamp
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            doc["timestamp"] = timestamp
+        attempt_docs.append(doc)
+
+    # Each pair's attempts are applied in timestamp order, ties in line
+    # order. Students are evicted only once their new states are persisted
+    # or buffered, so paging them back in cannot read older states.
+    masteries = bkt_engine.update_batch(
+        [attempt.student_id for _, attempt in attempts],
+        [attempt.skill_id for _, attempt in attempts],
+        [attempt.is_correct for _, attempt in attempts],
+        order=[(doc["timestamp"] - EPOCH).total_seconds() for doc in attempt_docs],
+        evict=False,
+    ).tolist()
+
+    # Only the state after each pair's last attempt is written
+    latest = {}
+    for (status, attempt), doc, mastery in zip(attempts, attempt_docs, masteries):
+        status["mastery"] = round(mastery, 4)
+        key = (attempt.student_id, attempt.skill_id)
+        if key not in latest or doc["timestamp"] >= latest[key][0]:
+            latest[key] = (doc["timestamp"], mastery)
+
+    state_docs = [
+        bkt_state_document(student_id, skill_id, mastery)
+        for (student_id, skill_id), (_, mastery) in latest.items()
+    ]
+
+    try:
+        bkt_writer.write_through(state_docs, attempt_docs)
+    except RejectedWriteError as e:
+        print("Bulk attempt write rejected:", e)
+        for status, _ in attempts:
+            status["status"] = "error"
+            status["error"] = "Rejected by storage"
+    except Exception as e:
+        # write_through put the documents back in the write-behind buffer
+        print("Bulk attempt write failed, queued for retry:", e)
+        for status, _ in attempts:
+            status["status"] = "queued"
+    finally:
+        bkt_engine.evict()
+
+    return statuses
 
 
 @app.get("/bkt/mastery")
+@profiled
 def get_mastery(student_id: str, skill_id: str):
     mastery = bkt_engine.get_mastery(student_id, skill_id)
     return {
@@ -169,14 +531,17 @@ def get_mastery(student_id: str, skill_id: str):
 # RL Quiz Endpoints
 # -------------------------------------------------
 @app.post("/quiz/next")
+@profiled
 def get_next_quiz(request: QuizNextRequest):
     return rl_agent.select_action(
         student_id=request.student_id,
         mastery=request.mastery,
+        skill_id=request.skill_id,
     )
 
 
 @app.post("/quiz/feedback")
+@profiled
 def quiz_feedback(request: QuizFeedbackRequest):
     reward = rl_agent.compute_reward(
         mastery_before=request.mastery_before,
@@ -188,6 +553,8 @@ def quiz_feedback(request: QuizFeedbackRequest):
         mastery_before=request.mastery_before,
         mastery_after=request.mastery_after,
         reward=reward,
+        skill_id=request.skill_id,
+        action=request.action,
     )
 
     return {
@@ -201,108 +568,220 @@ def quiz_feedback(request: QuizFeedbackRequest):
 # Unified Learning Endpoint (CLOSED LOOP)
 # -------------------------------------------------
 @app.post("/learn")
-def learn(request: LearnRequest):
-    response = {}
+async def learn(request: LearnRequest, background_tasks: BackgroundTasks):
+    """
+    Closed loop: the LLM answer and the assessment -> difficulty stage run
+    concurrently, and the history insert runs after the response is sent.
+    `timings` reports each stage in milliseconds.
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    async def timed(stage: str, awaitable):
+        stage_start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = _elapsed_ms(stage_start)
+
+    # 1 || 2. LLM response (on the event loop) alongside the blocking BKT
+    # and trend work (in the threadpool)
+    query_result, adaptation = await asyncio.gather(
+        timed("query", controller.handle_student_query_async(
+            student_id=request.student_id,
+            question=request.question,
+        )),
+        timed("adaptation", run_in_threadpool(assess_and_decide, request, timings)),
+    )
 
-    # 1. LLM response
-    query_result = controller.handle_student_query(
+    response = {"query": query_result}
+    response.update(adaptation)
+
+    # 3. Persist history off the response path
+    mastery = adaptation.get("assessment", {}).get("mastery")
+    quiz_action = adaptation.get("next_quiz", {}).get("recommended_difficulty")
+    history_doc = learning_history_document(
         student_id=request.student_id,
+        skill_id=request.skill_id,
         question=request.question,
+        answer=query_result,
+        is_correct=request.is_correct,
+        mastery=mastery,
+        quiz_action=quiz_action,
     )
-    response["query"] = query_result
+    background_tasks.add_task(persist_history, history_doc)
 
-    mastery = None
-    quiz_action = None
+    timings["total"] = _elapsed_ms(start)
+    response["timings"] = timings
+    return response
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+@profiled
+def assess_and_decide(request: LearnRequest, timings: dict) -> dict:
+    response = {}
 
     # 2. Assessment + Adaptation
     if request.is_correct is not None:
+        stage_start = time.perf_counter()
         assessment = controller.assess_response(
             student_id=request.student_id,
             skill_id=request.skill_id,
             is_correct=request.is_correct,
         )
+        enqueue_bkt_attempt(request.student_id, request.skill_id, request.is_correct)
         response["assessment"] = assessment
         mastery = assessment["mastery"]
+        timings["assessment"] = _elapsed_ms(stage_start)
 
-        # Closed-loop difficulty decision
-        records = list(
-            learning_history_collection.find(
-                {
-                    "student_id": request.student_id,
-                    "skill_id": request.skill_id,
-                    "mastery": {"$ne": None},
-                }
-            ).sort("timestamp", 1)
+        # Closed-loop difficulty decision: fold this sample into the
+        # running trend and decide from the aggregate as it was before it
+        stage_start = time.perf_counter()
+        previous = storage.record_mastery(
+            student_id=request.student_id,
+            skill_id=request.skill_id,
+            mastery=mastery["mastery"],
         )
+        gain = learning_gain(previous)
+        timings["trend"] = _elapsed_ms(stage_start)
 
         difficulty = "MEDIUM"
-        if len(records) >= 2:
-            initial = records[0]["mastery"]["mastery"]
-            latest = records[-1]["mastery"]["mastery"]
-            gain = latest - initial
-
+        if gain is not None:
             if gain > 0.05:
                 difficulty = "HARD"
             elif gain < -0.05:
                 difficulty = "EASY"
 
         response["next_quiz"] = {"recommended_difficulty": difficulty}
-        quiz_action = difficulty
 
-    # 3. Persist history
-    history_doc = learning_history_document(
-        student_id=request.student_id,
-        skill_id=request.skill_id,
-        question=request.question,
-        answer=query_result,
-        is_correct=request.is_correct,
-        mastery=mastery,
-        quiz_action=quiz_action,
-    )
+    return response
 
-    learning_history_collection.insert_one(history_doc)
 
-    return response
+def persist_history(history_doc: dict):
+    try:
+        storage.insert_history(history_doc)
+    except Exception as e:
+        print("History insert failed:", e)
+
+
+# -------------------------------------------------
+# Metrics
+# -------------------------------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Every metric in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/profile", response_class=PlainTextResponse)
+def profile_report(
+    sort: Literal["cumulative", "tottime", "calls"] = "cumulative",
+    limit: int = Query(40, ge=1, le=500),
+):
+    """
+    Merged cProfile statistics of the sampled requests so far.
+    """
+    return PlainTextResponse(profiler.report(sort=sort, limit=limit))
+
+
+@app.post("/metrics/profile")
+def configure_profiler(rate: float = Query(..., ge=0, le=1), reset: bool = False):
+    """
+    Profile a `rate` fraction of requests from now on (0 turns the
+    profiler off); `reset` discards the statistics collected so far.
+    """
+    profiler.rate = rate
+    if reset:
+        profiler.reset()
+    return profiler.snapshot()
 
 
 # -------------------------------------------------
 # Analytics Endpoints
 # -------------------------------------------------
 @app.get("/history")
-def get_learning_history(student_id: str, skill_id: str | None = None):
-    query = {"student_id": student_id}
-    if skill_id:
-        query["skill_id"] = skill_id
+@profiled
+def get_learning_history(
+    student_id: str,
+    skill_id: str | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = None,
+    stream: bool = False,
+):
+    """
+    Keyset-paginated history ordered by timestamp. Pass the returned
+    `next_cursor` as `cursor` for the next page; `fields` is a
+    comma-separated projection. With `stream=true` the records (from
+    `cursor` on, up to `limit` if given) are streamed as NDJSON.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    try:
+        if cursor:
+            storage.parse_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        return StreamingResponse(
+            storage.iter_history_ndjson(
+                student_id,
+                skill_id=skill_id,
+                after=cursor,
+                fields=field_list,
+                limit=limit,
+            ),
+            media_type="application/x-ndjson",
+        )
 
-    records = list(
-        learning_history_collection.find(query, {"_id": 0}).sort("timestamp", 1)
+    page = storage.history_page(
+        student_id,
+        skill_id=skill_id,
+        after=cursor,
+        fields=field_list,
+        limit=limit or HISTORY_PAGE_SIZE,
     )
 
     return {
         "student_id": student_id,
-        "count": len(records),
-        "history": records,
+        "count": len(page["history"]),
+        "history": page["history"],
+        "next_cursor": page["next_cursor"],
     }
 
 
 @app.get("/analytics/mastery-curve")
-def mastery_curve(student_id: str, skill_id: str):
-    records = list(
-        learning_history_collection.find(
-            {
-                "student_id": student_id,
-                "skill_id": skill_id,
-                "mastery": {"$ne": None},
-            },
-            {"_id": 0, "timestamp": 1, "mastery": 1},
-        ).sort("timestamp", 1)
+@profiled
+def mastery_curve(
+    student_id: str,
+    skill_id: str,
+    max_points: int | None = Query(None, ge=2),
+    bucket_seconds: float | None = Query(None, gt=0),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    method: Literal["minmax", "lttb"] = "minmax",
+):
+    """
+    Mastery over time, optionally limited to [start, end] and downsampled
+    to `max_points` (bucket min/max, or LTTB) or to fixed
+    `bucket_seconds` time buckets.
+    """
+    curve = storage.mastery_curve(
+        student_id,
+        skill_id,
+        max_points=max_points,
+        bucket_seconds=bucket_seconds,
+        start=start,
+        end=end,
+        method=method,
     )
 
-    curve = []
-    for r in records:
-        m = r["mastery"]["mastery"] if isinstance(r["mastery"], dict) else r["mastery"]
-        curve.append({"timestamp": r["timestamp"], "mastery": m})
-
     return {
         "student_id": student_id,
         "skill_id": skill_id,
@@ -312,28 +791,22 @@ def mastery_curve(student_id: str, skill_id: str):
 
 
 @app.get("/analytics/summary")
+@profiled
 def learning_summary(student_id: str, skill_id: str):
-    records = list(
-        learning_history_collection.find(
-            {
-                "student_id": student_id,
-                "skill_id": skill_id,
-                "mastery": {"$ne": None},
-            }
-        ).sort("timestamp", 1)
-    )
+    aggregate = storage.get_trend(student_id, skill_id)
+    points = aggregate["count"] if aggregate else 0
 
-    if len(records) < 2:
+    if points < 2:
         return {
             "student_id": student_id,
             "skill_id": skill_id,
             "status": "insufficient data",
-            "points": len(records),
+            "points": points,
         }
 
-    initial = records[0]["mastery"]["mastery"]
-    latest = records[-1]["mastery"]["mastery"]
-    gain = round(latest - initial, 4)
+    initial = aggregate["initial_mastery"]
+    latest = aggregate["latest_mastery"]
+    gain = round(learning_gain(aggregate), 4)
 
     if gain > 0.05:
         trend = "improving"
@@ -349,6 +822,8 @@ def learning_summary(student_id: str, skill_id: str):
         "initial_mastery": initial,
         "latest_mastery": latest,
         "learning_gain": gain,
+        "mean_mastery": round(aggregate["mean"], 4),
+        "mastery_variance": round(aggregate["m2"] / points, 4),
         "trend": trend,
-        "points": len(records),
+        "points": points,
     }
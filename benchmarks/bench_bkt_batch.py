@@ -0,0 +1,56 @@
+"""
+Compare replaying an attempt stream through BKTEngine.update_batch against
+the per-call update_skill loop.
+
+Usage:
+    python -m benchmarks.bench_bkt_batch [n_attempts] [n_students] [n_skills]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+
+
+def make_stream(n_attempts: int, n_students: int, n_skills: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    student_ids = np.char.add("student_", rng.integers(0, n_students, n_attempts).astype(str))
+    skill_ids = np.char.add("skill_", rng.integers(0, n_skills, n_attempts).astype(str))
+    is_correct = rng.random(n_attempts) < 0.6
+    order = np.arange(n_attempts)
+    return student_ids, skill_ids, is_correct, order
+
+
+def main():
+    n_attempts = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_students = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    n_skills = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    student_ids, skill_ids, is_correct, order = make_stream(n_attempts, n_students, n_skills)
+
+    loop_engine = BKTEngine()
+    start = time.perf_counter()
+    for student_id, skill_id, correct in zip(
+        student_ids.tolist(), skill_ids.tolist(), is_correct.tolist()
+    ):
+        loop_engine.update_skill(student_id, skill_id, correct)
+    loop_time = time.perf_counter() - start
+
+    batch_engine = BKTEngine()
+    start = time.perf_counter()
+    batch_engine.update_batch(student_ids, skill_ids, is_correct, order=order)
+    batch_time = time.perf_counter() - start
+
+    identical = loop_engine.knowledge_state == batch_engine.knowledge_state
+
+    print(f"attempts={n_attempts} students={n_students} skills={n_skills}")
+    print(f"per-call loop : {loop_time:8.3f} s  ({n_attempts / loop_time:12,.0f} attempts/s)")
+    print(f"update_batch  : {batch_time:8.3f} s  ({n_attempts / batch_time:12,.0f} attempts/s)")
+    print(f"speedup       : {loop_time / batch_time:8.1f}x")
+    print(f"identical     : {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Fit per-skill BKT parameters on a simulated attempt log with known
+parameters and report fitting time and parameter recovery error.
+
+Usage:
+    python -m benchmarks.bench_bkt_fit [n_students_per_skill] [n_skills] [workers]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from agents.bkt_fit import fit_params, simulate
+
+PARAMS = ["p_init", "p_learn", "p_guess", "p_slip"]
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    n_skills = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    rng = np.random.default_rng(1)
+    true_params = {
+        f"skill_{i}": (
+            rng.uniform(0.1, 0.6), rng.uniform(0.05, 0.3),
+            rng.uniform(0.05, 0.3), rng.uniform(0.03, 0.2)
+        )
+        for i in range(n_skills)
+    }
+    student_ids, skill_ids, is_correct = simulate(true_params, n_students, mean_length=5)
+
+    start = time.perf_counter()
+    fitted = fit_params(student_ids, skill_ids, is_correct, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    errors = np.array([
+        [abs(fitted[skill][name] - value) for name, value in zip(PARAMS, true)]
+        for skill, true in true_params.items()
+    ])
+
+    print(f"attempts={len(is_correct)} skills={n_skills} workers={workers}")
+    print(f"fit time      : {elapsed:8.2f} s  ({len(is_correct) / elapsed:12,.0f} attempts/s)")
+    print(f"EM iterations : {np.mean([p['iterations'] for p in fitted.values()]):8.1f} (mean)")
+    for name, mean_err, max_err in zip(PARAMS, errors.mean(axis=0), errors.max(axis=0)):
+        print(f"{name:<8} error: mean {mean_err:.4f}  max {max_err:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Seed synthetic learning history into a scratch database and report query
+latency and explain() plans for the /learn and analytics queries, without
+and with the indexes from database/indexes.py.
+
+Needs a running MongoDB (MONGO_URI, default mongodb://localhost:27017).
+The scratch database is dropped at the end.
+
+Usage:
+    python -m benchmarks.bench_history_indexes [n_students] [n_skills] [records_per_pair]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from database.indexes import drop_indexes, ensure_indexes
+
+
+BENCH_DB = "agentic_learning_bench"
+REPEATS = 50
+
+
+def seed(db, n_students: int, n_skills: int, records_per_pair: int):
+    history = db["learning_history"]
+    history.drop()
+
+    start = datetime(2026, 1, 1)
+    batch = []
+    for s in range(n_students):
+        for k in range(n_skills):
+            mastery = 0.2
+            for i in range(records_per_pair):
+                mastery = min(1.0, max(0.0, mastery + random.uniform(-0.05, 0.1)))
+                batch.append({
+                    "student_id": f"student_{s:05d}",
+                    "skill_id": f"skill_{k:03d}",
+                    "question": "What is Hadoop?",
+                    "answer": {"answer": "..."},
+                    "is_correct": random.random() < 0.6,
+                    "mastery": {"mastery": round(mastery, 4)},
+                    "quiz_action": "MEDIUM",
+                    "timestamp": start + timedelta(minutes=i, seconds=s),
+                })
+                if len(batch) >= 10_000:
+                    history.insert_many(batch)
+                    batch = []
+    if batch:
+        history.insert_many(batch)
+
+
+def queries(student_id: str, skill_id: str) -> dict:
+    """
+    The filters and sorts issued by /learn, /history and /analytics/*.
+    """
+    return {
+        "learn/summary": (
+            {"student_id": student_id, "skill_id": skill_id, "mastery": {"$ne": None}},
+            None,
+        ),
+        "mastery-curve": (
+            {"student_id": student_id, "skill_id": skill_id, "mastery": {"$ne": None}},
+            {"_id": 0, "timestamp": 1, "mastery": 1},
+        ),
+        "history": (
+            {"student_id": student_id},
+            {"_id": 0},
+        ),
+    }
+
+
+def measure(history, student_ids, skill_ids) -> dict:
+    results = {}
+    for name in queries("", ""):
+        latencies = []
+        for _ in range(REPEATS):
+            filter_, projection = queries(random.choice(student_ids), random.choice(skill_ids))[name]
+            start = time.perf_counter()
+            list(history.find(filter_, projection).sort("timestamp", 1))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        filter_, projection = queries(student_ids[0], skill_ids[0])[name]
+        explain = history.find(filter_, projection).sort("timestamp", 1).explain()
+        plan = explain["queryPlanner"]["winningPlan"]
+        stats = explain["executionStats"]
+
+        results[name] = {
+            "p50_ms": statistics.median(latencies),
+            "max_ms": max(latencies),
+            "plan": plan_stages(plan),
+            "docs_examined": stats["totalDocsExamined"],
+            "keys_examined": stats["totalKeysExamined"],
+            "returned": stats["nReturned"],
+        }
+    return results
+
+
+def plan_stages(plan: dict) -> str:
+    """
+    Flatten a winning plan into e.g. 'SORT <- COLLSCAN'.
+    """
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+
+def report(label: str, results: dict):
+    print(f"\n{label}")
+    for name, r in results.items():
+        print(
+            f"  {name:14s} p50={r['p50_ms']:8.2f} ms  max={r['max_ms']:8.2f} ms  "
+            f"docs={r['docs_examined']:>8} keys={r['keys_examined']:>8} "
+            f"returned={r['returned']:>6}  plan: {r['plan']}"
+        )
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_skills = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    records_per_pair = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    db = client[BENCH_DB]
+    history = db["learning_history"]
+
+    random.seed(0)
+    start = time.perf_counter()
+    seed(db, n_students, n_skills, records_per_pair)
+    print(
+        f"Seeded {history.estimated_document_count():,} history records "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+
+    student_ids = [f"student_{s:05d}" for s in range(n_students)]
+    skill_ids = [f"skill_{k:03d}" for k in range(n_skills)]
+
+    try:
+        drop_indexes(db)
+        report("Without indexes", measure(history, student_ids, skill_ids))
+
+        ensure_indexes(db)
+        report("With indexes", measure(history, student_ids, skill_ids))
+    finally:
+        client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Fallback lookup cost and load time of the offline knowledge base as the
+number of topics grows.
+
+Usage:
+    python -m benchmarks.bench_knowledge_base [n_queries]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from agents.knowledge_base import INDEX_SUFFIX, KnowledgeBase
+
+SIZES = [10, 100, 1_000, 10_000]
+
+
+def make_topics(n_topics: int) -> list[dict]:
+    return [
+        {
+            "topic": f"Topic {i}",
+            "keywords": [f"keyword{i}", f"concept{i} basics", f"area{i % 50}"],
+            "answer": f"Answer about topic {i}.",
+        }
+        for i in range(n_topics)
+    ]
+
+
+def main():
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    print(f"queries={n_queries}")
+    print(f"{'topics':>7} {'us/lookup':>10} {'build ms':>9} {'load ms':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_topics in SIZES:
+            path = os.path.join(tmp, f"kb_{n_topics}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"default_answer": "?", "topics": make_topics(n_topics)}, f)
+
+            start = time.perf_counter()
+            KnowledgeBase.load(path)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            kb = KnowledgeBase.load(path)
+            load_time = time.perf_counter() - start
+            assert os.path.exists(path + INDEX_SUFFIX)
+
+            questions = [
+                f"Can you explain the concept{i % n_topics} basics with an example?"
+                for i in range(n_queries)
+            ]
+            start = time.perf_counter()
+            for question in questions:
+                kb.answer(question)
+            lookup_time = time.perf_counter() - start
+
+            print(
+                f"{n_topics:>7} {lookup_time / n_queries * 1e6:>10.2f} "
+                f"{build_time * 1000:>9.1f} {load_time * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Throughput and latency of StudentQueryAgent with and without
+micro-batching, against the local stub LLM server.
+
+The stub models a server with a fixed number of generation slots where a
+call costs a fixed overhead plus a small per-input cost, so batching
+trades a few milliseconds of queueing for far fewer upstream calls.
+
+Usage:
+    python -m benchmarks.bench_llm_batching [n_requests] [concurrency]
+"""
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from agents.student_query_agent import StudentQueryAgent
+from benchmarks.stub_llm_server import StubLLMServer
+
+# (batch_size, batch_wait_ms); batch_size 0 disables batching
+SETTINGS = [(0, 0), (4, 2), (8, 5), (16, 10), (32, 20)]
+
+
+async def run(agent: StudentQueryAgent, n_requests: int, concurrency: int):
+    latencies = []
+    next_id = iter(range(n_requests))
+
+    async def client():
+        for i in next_id:
+            start = time.perf_counter()
+            await agent._generate_async(f"Question {i}?")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await agent.aclose()
+    return elapsed, np.array(latencies) * 1000
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    print(f"requests={n_requests} concurrency={concurrency}")
+    print(f"{'batch':>5} {'wait ms':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'calls':>6}")
+
+    for batch_size, wait_ms in SETTINGS:
+        server = StubLLMServer(delay=0.05, item_delay=0.002, workers=4).start()
+        agent = StudentQueryAgent(
+            api_key="bench-key",
+            api_url=server.url,
+            max_concurrency=16,
+            batch_size=batch_size,
+            batch_wait_ms=wait_ms
+        )
+        elapsed, latencies = asyncio.run(run(agent, n_requests, concurrency))
+        server.stop()
+
+        print(
+            f"{batch_size:>5} {wait_ms:>7} {n_requests / elapsed:>8.1f} "
+            f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+            f"{server.requests:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
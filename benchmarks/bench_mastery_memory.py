@@ -0,0 +1,63 @@
+"""
+Report bytes per tracked (student, skill) pair for the old tuple-keyed dict
+and for PairStore at float64 and float32.
+
+Usage:
+    python -m benchmarks.bench_mastery_memory [n_students] [n_skills]
+"""
+
+import sys
+import tracemalloc
+
+import numpy as np
+
+from agents.pair_store import PairStore
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del state
+    return after - before
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_skills = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Ids are allocated up front so only the state structure is measured
+    students = [f"student_{i:07d}" for i in range(n_students)]
+    skills = [f"skill_{j:03d}" for j in range(n_skills)]
+    n_pairs = n_students * n_skills
+
+    def build_dict():
+        state = {}
+        for s in students:
+            for k in skills:
+                state[(s, k)] = 0.2 + len(state) * 1e-9
+        return state
+
+    def build_store(dtype):
+        def build():
+            store = PairStore(dtype=dtype)
+            for s in students:
+                for k in skills:
+                    store[(s, k)] = 0.2
+            return store
+        return build
+
+    print(f"students={n_students} skills={n_skills} pairs={n_pairs}")
+    for name, build in (
+        ("dict[(str, str)] -> float", build_dict),
+        ("PairStore float64", build_store(np.float64)),
+        ("PairStore float32", build_store(np.float32)),
+    ):
+        total = measure(build)
+        print(f"{name:28s}: {total / 1e6:10.1f} MB  {total / n_pairs:8.1f} bytes/pair")
+
+
+if __name__ == "__main__":
+    main()
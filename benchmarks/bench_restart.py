@@ -0,0 +1,77 @@
+"""
+Restart time of the learned state: replaying the whole attempt log versus
+mapping the latest snapshot and replaying the log tail written after it.
+
+Usage:
+    python -m benchmarks.bench_restart [n_attempts] [n_students] [n_skills]
+"""
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.state_log import StateLog
+
+
+def open_state(directory: str):
+    log = StateLog(directory)
+    bkt = BKTEngine(log=log)
+    quiz = AdaptiveQuizAgent(log=log)
+    log.register(bkt)
+    log.register(quiz)
+    return log, bkt, quiz
+
+
+def record(bkt, quiz, students, skills, correct, batch: int = 10_000):
+    """
+    Apply attempts and the matching policy updates, as /learn would.
+    """
+    for i in range(0, len(students), batch):
+        s, k, c = students[i:i + batch], skills[i:i + batch], correct[i:i + batch]
+        before = np.array([bkt.knowledge_state.get(key, 0.2) for key in zip(s, k)])
+        after = bkt.update_batch(s, k, c)
+        quiz.update_policy_batch(s, before, after, after - before, skill_ids=k)
+
+
+def restart(directory: str) -> tuple:
+    start = time.perf_counter()
+    log, bkt, quiz = open_state(directory)
+    replayed = log.recover()
+    elapsed = time.perf_counter() - start
+    return elapsed, replayed, len(bkt.knowledge_state)
+
+
+def main():
+    n_attempts = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_students = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    n_skills = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    rng = np.random.default_rng(0)
+    students = np.array([f"student_{i:06d}" for i in rng.integers(0, n_students, n_attempts)])
+    skills = np.array([f"skill_{j:03d}" for j in rng.integers(0, n_skills, n_attempts)])
+    correct = rng.random(n_attempts) < 0.6
+
+    print(f"attempts={n_attempts} students={n_students} skills={n_skills}")
+    for tail_fraction in (1.0, 0.1, 0.01, 0.0):
+        tail = int(n_attempts * tail_fraction)
+        with tempfile.TemporaryDirectory() as tmp:
+            log, bkt, quiz = open_state(tmp)
+            head = n_attempts - tail
+            record(bkt, quiz, students[:head], skills[:head], correct[:head])
+            if head:
+                log.checkpoint()
+            record(bkt, quiz, students[head:], skills[head:], correct[head:])
+            log.sync()
+
+            elapsed, replayed, pairs = restart(tmp)
+
+        label = "full log, no snapshot" if tail == n_attempts else f"snapshot + {tail_fraction:.0%} tail"
+        print(f"{label:26s}: {elapsed * 1000:9.1f} ms  replayed={replayed:8d}  bkt pairs={pairs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+End-to-end load test of the FastAPI app with local stand-ins.
+
+A synthetic student population drives /learn, /bkt/update, /quiz/next,
+/analytics/summary and /analytics/mastery-curve in-process (ASGI, no
+sockets) with a configurable request mix and concurrency. Storage is the
+in-memory backend (or --storage sqlite, or mongomock: pip install -r
+benchmarks/requirements.txt) and the LLM is benchmarks.stub_llm_server,
+so runs need no external services.
+
+Reports throughput and p50/p95/p99 latency per endpoint and writes them
+as JSON. --compare prints the change against an earlier result file and
+exits non-zero if any endpoint's p95 or throughput regressed by more
+than --tolerance.
+
+Usage:
+    python -m benchmarks.load_test [--students N] [--requests N] [--concurrency N]
+        [--mix learn=2,bkt_update=4,quiz_next=3,summary=1,curve=1]
+        [--storage memory|sqlite|mongomock]
+        [--out results.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+DEFAULT_MIX = "learn=2,bkt_update=4,quiz_next=3,summary=1,curve=1"
+
+
+# -------------------------------------------------
+# Environment
+# -------------------------------------------------
+def load_app(llm_url: str, workdir: str, storage: str = "memory"):
+    """
+    Import the app against a local storage backend and the stub LLM.
+    """
+    if storage == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--storage mongomock needs mongomock: pip install -r benchmarks/requirements.txt")
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["STORAGE_BACKEND"] = "mongo"
+    else:
+        os.environ["STORAGE_BACKEND"] = storage
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "learning.db")
+
+    os.environ["HF_API_KEY"] = "load-test"
+    os.environ["HF_API_URL"] = llm_url
+    os.environ["RL_SNAPSHOT_PATH"] = os.path.join(workdir, "rl_q_tables.npz")
+    os.environ["BKT_PARAMS_PATH"] = os.path.join(workdir, "bkt_params.json")
+    os.environ["STATE_DIR"] = os.path.join(workdir, "state")
+
+    import app as app_module
+    return app_module
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -------------------------------------------------
+# Workload
+# -------------------------------------------------
+class Population:
+    """
+    Students with a latent ability per skill; answers are correct with
+    that probability. Questions follow a Zipf-like popularity so the
+    answer cache sees realistic repeats.
+    """
+
+    def __init__(self, n_students: int, n_skills: int, n_questions: int, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.students = [f"student_{i}" for i in range(n_students)]
+        self.skills = [f"skill_{i}" for i in range(n_skills)]
+        self.ability = self.rng.beta(2, 2, (n_students, n_skills))
+
+        weights = 1.0 / np.arange(1, n_questions + 1)
+        self.question_p = weights / weights.sum()
+
+    def pick(self) -> tuple:
+        student = int(self.rng.integers(len(self.students)))
+        skill = int(self.rng.integers(len(self.skills)))
+        correct = bool(self.rng.random() < self.ability[student, skill])
+        return self.students[student], self.skills[skill], correct
+
+    def question(self, skill_id: str) -> str:
+        q = int(self.rng.choice(len(self.question_p), p=self.question_p))
+        return f"Explain concept {q} of {skill_id}"
+
+
+def make_request(endpoint: str, population: Population) -> tuple:
+    """
+    (method, path, params, json) for one request to `endpoint`.
+    """
+    student_id, skill_id, correct = population.pick()
+    pair = {"student_id": student_id, "skill_id": skill_id}
+
+    if endpoint == "learn":
+        body = {**pair, "question": population.question(skill_id), "is_correct": correct}
+        return "POST", "/learn", None, body
+    if endpoint == "bkt_update":
+        return "POST", "/bkt/update", None, {**pair, "is_correct": correct}
+    if endpoint == "quiz_next":
+        mastery = float(population.rng.random())
+        return "POST", "/quiz/next", None, {**pair, "mastery": mastery}
+    if endpoint == "summary":
+        return "GET", "/analytics/summary", pair, None
+    if endpoint == "curve":
+        return "GET", "/analytics/mastery-curve", pair, None
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def drive(app, population: Population, mix: dict, n_requests: int, concurrency: int) -> tuple:
+    import httpx
+
+    names = list(mix)
+    p = np.array([mix[name] for name in names])
+    plan = population.rng.choice(len(names), size=n_requests, p=p / p.sum())
+    requests = iter([make_request(names[i], population) + (names[i],) for i in plan])
+
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+        async def user():
+            for method, path, params, body, name in requests:
+                start = time.perf_counter()
+                response = await client.request(method, path, params=params, json=body)
+                latencies[name].append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float) -> dict:
+    def stats(values: list, n_errors: int) -> dict:
+        ms = np.array(values) * 1000
+        return {
+            "requests": len(values),
+            "errors": n_errors,
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(float(ms.mean()), 3),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        }
+
+    endpoints = {
+        name: stats(values, errors[name])
+        for name, values in latencies.items() if values
+    }
+    everything = [v for values in latencies.values() for v in values]
+    endpoints["all"] = stats(everything, sum(errors.values()))
+    return endpoints
+
+
+# -------------------------------------------------
+# Comparison
+# -------------------------------------------------
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print per-endpoint changes; True if nothing regressed beyond
+    `tolerance` (a fraction).
+    """
+    ok = True
+    print(f"\n{'endpoint':<12} {'rps':>10} {'p95 ms':>10}   (change vs baseline)")
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        rps_change = now["throughput_rps"] / before["throughput_rps"] - 1
+        p95_change = now["p95_ms"] / before["p95_ms"] - 1
+        regressed = rps_change < -tolerance or p95_change > tolerance
+        ok &= not regressed
+        print(
+            f"{name:<12} {rps_change:>+10.1%} {p95_change:>+10.1%}"
+            + ("   REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test with local stand-ins")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--skills", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--llm-delay", type=float, default=0.05)
+    parser.add_argument("--storage", choices=["memory", "sqlite", "mongomock"], default="memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    from benchmarks.stub_llm_server import StubLLMServer
+
+    llm = StubLLMServer(delay=args.llm_delay).start()
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    app_module = load_app(llm.url, workdir, args.storage)
+    app = app_module.app
+
+    population = Population(args.students, args.skills, args.questions, seed=args.seed)
+    mix = parse_mix(args.mix)
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            await drive(app, population, mix, args.warmup, args.concurrency)
+            return await drive(app, population, mix, args.requests, args.concurrency)
+
+    latencies, errors, elapsed = asyncio.run(run())
+    llm.stop()
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "duration_s": round(elapsed, 3),
+        "llm_upstream_requests": llm.requests,
+        "endpoints": summarize(latencies, errors, elapsed),
+    }
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f} s")
+    print(f"{'endpoint':<12} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in result["endpoints"].items():
+        print(
+            f"{name:<12} {s['requests']:>9} {s['errors']:>7} {s['throughput_rps']:>9.1f} "
+            f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}"
+        )
+
+    out = args.out or os.path.join(
+        "benchmarks", "results", f"load_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print("Results written to", out)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
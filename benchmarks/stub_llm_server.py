@@ -0,0 +1,156 @@
+"""
+Local stand-in for the Hugging Face text-generation endpoint.
+
+Answers POSTs shaped like the inference API ({"inputs": "..."}) with
+[{"generated_text": "..."}] after a configurable delay, over HTTP/1.1
+keep-alive. Batched requests ({"inputs": ["...", "..."]}) get one
+[{"generated_text": ...}] list per input and cost `delay` plus
+`item_delay` per input. `workers` caps how many generations run at once,
+like a model server with a fixed number of GPU slots. With
+{"stream": true} the answer is sent as text-generation-inference style
+server-sent events, one token every `token_delay` seconds, over chunked
+transfer encoding. It records how many
+connections were opened and how many requests were in flight at once, so
+tests can check pooling and concurrency caps.
+
+Usage:
+    python -m benchmarks.stub_llm_server [port] [delay_seconds]
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        delay: float = 0.05,
+        status: int = 200,
+        item_delay: float = 0.0,
+        workers: int | None = None,
+        token_delay: float = 0.0
+    ):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.delay = delay
+        self.status = status
+        self.item_delay = item_delay
+        self.token_delay = token_delay
+        self.slots = threading.Semaphore(workers) if workers else None
+
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.inputs = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def generate(self, prompt: str) -> str:
+        question = prompt.rsplit("\n", 1)[-1]
+        return f"Stub answer to: {question}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        payload = json.loads(body or b"{}")
+        inputs = payload.get("inputs", "")
+        batched = isinstance(inputs, list)
+        prompts = inputs if batched else [inputs]
+
+        with server.lock:
+            server.requests += 1
+            server.inputs += len(prompts)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+        try:
+            if server.slots is not None:
+                server.slots.acquire()
+            try:
+                time.sleep(server.delay + server.item_delay * len(prompts))
+            finally:
+                if server.slots is not None:
+                    server.slots.release()
+
+            if payload.get("stream") and not batched and server.status == 200:
+                self._send_stream(server.generate(inputs))
+                return
+
+            results = [[{"generated_text": server.generate(p)}] for p in prompts]
+            self._send_json(server.status, results if batched else results[0])
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send_stream(self, text: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        tokens = re.findall(r"\s*\S+", text)
+        for i, token in enumerate(tokens):
+            time.sleep(self.server.token_delay)
+            last = i == len(tokens) - 1
+            event = {
+                "index": i + 1,
+                "token": {"id": i, "text": token, "special": False},
+                "generated_text": text if last else None,
+            }
+            self._send_chunk(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+        self._send_chunk(b"")
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    server = StubLLMServer(port=port, delay=delay)
+    print(f"Stub LLM server on {server.url} (delay {delay}s)")
+    server.serve_forever()
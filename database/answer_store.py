@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+
+class MongoAnswerStore:
+    """
+    Persistent tier for agents.answer_cache.AnswerCache.
+
+    One document per normalized question (_id = cache key). Expired
+    documents are ignored on read and removed by the TTL index on
+    expires_at (see database/indexes.py).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, key: str) -> str | None:
+        doc = self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"answer": 1},
+        )
+        return doc["answer"] if doc else None
+
+    def set(self, key: str, answer: str, ttl: float):
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "answer": answer,
+                "expires_at": datetime.utcnow() + timedelta(seconds=ttl),
+            }},
+            upsert=True,
+        )
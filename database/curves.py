@@ -0,0 +1,243 @@
+"""
+Mastery curves with server-side downsampling.
+
+- Time buckets are reduced inside a Mongo aggregation pipeline to the
+  minimum and maximum point of each bucket, so only the reduced series
+  leaves the database.
+- max_points picks the bucket width from the series' time range, or, with
+  method="lttb", runs Largest-Triangle-Three-Buckets over the projected
+  (timestamp, mastery) pairs in the application.
+
+downsample_points applies the same reductions to a series already in
+memory, for the SQLite and in-memory storage backends.
+"""
+
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Nested BKT result dict, or a bare float in older documents
+MASTERY_VALUE = {"$ifNull": ["$mastery.mastery", "$mastery"]}
+
+
+def _epoch_seconds(value: datetime) -> float:
+    # pymongo returns naive datetimes that are in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _epoch_ms(value: datetime) -> int:
+    # Whole milliseconds, like Mongo date arithmetic
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def curve_filter(
+    student_id: str,
+    skill_id: str,
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> dict:
+    query = {
+        "student_id": student_id,
+        "skill_id": skill_id,
+        "mastery": {"$ne": None},
+    }
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lte"] = end
+    return query
+
+
+def raw_curve(collection, query: dict) -> list[dict]:
+    """
+    Every point of the curve, unwrapped by the database.
+    """
+    return list(collection.aggregate([
+        {"$match": query},
+        {"$sort": {"timestamp": 1}},
+        {"$project": {"_id": 0, "timestamp": 1, "mastery": MASTERY_VALUE}},
+    ]))
+
+
+def bucketed_curve(collection, query: dict, bucket_ms: int, origin_ms: int = 0) -> list[dict]:
+    """
+    Min and max point of every `bucket_ms` time bucket (aligned to
+    `origin_ms`, epoch milliseconds), in time order.
+    """
+    buckets = collection.aggregate([
+        {"$match": query},
+        {"$project": {
+            "timestamp": 1,
+            "mastery": MASTERY_VALUE,
+            # Date minus date is milliseconds
+            "ms": {"$subtract": ["$timestamp", EPOCH]},
+        }},
+        {"$group": {
+            "_id": {"$subtract": [
+                "$ms",
+                {"$mod": [{"$subtract": ["$ms", origin_ms]}, bucket_ms]},
+            ]},
+            # Documents compare field by field: lowest/highest mastery,
+            # ties broken by timestamp
+            "low": {"$min": {"mastery": "$mastery", "timestamp": "$timestamp"}},
+            "high": {"$max": {"mastery": "$mastery", "timestamp": "$timestamp"}},
+        }},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True)
+
+    curve = []
+    for bucket in buckets:
+        low, high = bucket["low"], bucket["high"]
+        if low["timestamp"] == high["timestamp"]:
+            curve.append(low)
+        else:
+            curve.extend(sorted((low, high), key=lambda p: p["timestamp"]))
+    return curve
+
+
+def time_range(collection, query: dict) -> tuple | None:
+    """
+    (first, last) timestamp of the matching points, from the index.
+    """
+    first = collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", 1)])
+    if first is None:
+        return None
+    last = collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", -1)])
+    return first["timestamp"], last["timestamp"]
+
+
+def lttb(points: list[dict], threshold: int) -> list[dict]:
+    """
+    Largest-Triangle-Three-Buckets downsampling to `threshold` points.
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with its neighbours. Below 3 points there are no
+    buckets: only the endpoints are kept.
+    """
+    n = len(points)
+    if threshold >= n:
+        return points
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    x = np.array([_epoch_seconds(p["timestamp"]) for p in points])
+    y = np.array([p["mastery"] for p in points], dtype=np.float64)
+
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_hi = min(int((i + 2) * every) + 1, n)
+
+        # Average of the next bucket (the last point for the final bucket)
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected.append(a)
+    selected.append(n - 1)
+
+    return [points[i] for i in selected]
+
+
+def bucket_points(points: list[dict], bucket_ms: int, origin_ms: int = 0) -> list[dict]:
+    """
+    bucketed_curve over (timestamp, mastery) points held in memory.
+    """
+    buckets = {}
+    for point in points:
+        ms = _epoch_ms(point["timestamp"])
+        key = ms - (ms - origin_ms) % bucket_ms
+        rank = (point["mastery"], point["timestamp"])
+
+        low, high = buckets.get(key, (point, point))
+        if rank < (low["mastery"], low["timestamp"]):
+            low = point
+        if rank > (high["mastery"], high["timestamp"]):
+            high = point
+        buckets[key] = (low, high)
+
+    curve = []
+    for key in sorted(buckets):
+        low, high = buckets[key]
+        if low["timestamp"] == high["timestamp"]:
+            curve.append(low)
+        else:
+            curve.extend(sorted((low, high), key=lambda p: p["timestamp"]))
+    return curve
+
+
+def downsample_points(
+    points: list[dict],
+    max_points: int | None = None,
+    bucket_seconds: float | None = None,
+    method: str = "minmax"
+) -> list[dict]:
+    """
+    mastery_curve's downsampling applied to a time-ordered series.
+    """
+    if bucket_seconds:
+        curve = bucket_points(points, max(1, int(bucket_seconds * 1000)))
+        if max_points and len(curve) > max_points:
+            curve = lttb(curve, max_points)
+        return curve
+
+    if not max_points or len(points) <= max_points:
+        return points
+
+    if method == "lttb":
+        return lttb(points, max_points)
+
+    first, last = points[0]["timestamp"], points[-1]["timestamp"]
+    span_ms = (last - first).total_seconds() * 1000
+    bucket_ms = max(1, math.ceil((span_ms + 1) / max(1, max_points // 2)))
+    return bucket_points(points, bucket_ms, _epoch_ms(first))
+
+
+def mastery_curve(
+    collection,
+    student_id: str,
+    skill_id: str,
+    max_points: int | None = None,
+    bucket_seconds: float | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    method: str = "minmax"
+) -> list[dict]:
+    """
+    The (optionally downsampled) mastery curve of a student and skill.
+    """
+    query = curve_filter(student_id, skill_id, start, end)
+
+    if bucket_seconds:
+        curve = bucketed_curve(collection, query, max(1, int(bucket_seconds * 1000)))
+        if max_points and len(curve) > max_points:
+            curve = lttb(curve, max_points)
+        return curve
+
+    if not max_points or collection.count_documents(query) <= max_points:
+        return raw_curve(collection, query)
+
+    if method == "lttb":
+        return lttb(raw_curve(collection, query), max_points)
+
+    # Two points (min and max) per bucket
+    first, last = time_range(collection, query)
+    span_ms = (last - first).total_seconds() * 1000
+    bucket_ms = max(1, math.ceil((span_ms + 1) / max(1, max_points // 2)))
+    origin_ms = int(_epoch_seconds(first) * 1000)
+    return bucketed_curve(collection, query, bucket_ms, origin_ms)
@@ -1,26 +1,98 @@
-from pymongo import MongoClient
+"""
+Lazy MongoDB connection.
+
+Nothing connects at import: the client is created on first use, so
+modules that import this one load (and the app starts with another
+storage backend, see database/storage.py) without a reachable MongoDB.
+The collection names below stay importable as module attributes.
+
+Every command is timed per collection into the metrics registry (see
+metrics.py) by a pymongo command listener.
+"""
+
 import os
+import threading
+
+from pymongo import MongoClient, monitoring
+
+from metrics import MONGO_FAILURES, MONGO_LATENCY
 
 MONGO_URI = os.getenv("MONGO_URI")
+DATABASE_NAME = os.getenv("MONGO_DATABASE", "agentic_learning")
+
+# Module attribute -> collection name
+COLLECTIONS = {
+    "learning_history_collection": "learning_history",
+    "bkt_states_collection": "bkt_states",
+    "bkt_attempts_collection": "bkt_attempts",
+    "learning_trends_collection": "learning_trends",
+    "answer_cache_collection": "answer_cache",
+    "analytics_collection": "analytics",
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records the latency of every command, and failures, under its
+    collection and command name.
+    """
 
-client = None
-db = None
+    def __init__(self):
+        # (connection, request_id) -> collection of commands in flight
+        self._collections = {}
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.admin.command("ping")
-    db = client["agentic_learning"]
-except Exception as e:
-    print("MongoDB connection failed:", e)
+    def started(self, event):
+        name = event.command_name
+        target = event.command.get("collection" if name == "getMore" else name)
+        self._collections[event.connection_id, event.request_id] = target if isinstance(target, str) else "-"
 
-# Collections
-learning_history_collection = db["learning_history"]
-bkt_states_collection = db["bkt_states"]
-analytics_collection = db["analytics"]
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
 
-def check_db_connection():
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
+
+
+def get_client() -> MongoClient:
+    """
+    The shared client, created on first call. MongoClient connects in the
+    background, so this does not block on an unreachable server.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                MONGO_URI,
+                serverSelectionTimeoutMS=5000,
+                event_listeners=[CommandMetrics()],
+            )
+        return _client
+
+
+def get_db():
+    return get_client()[DATABASE_NAME]
+
+
+def check_db_connection() -> bool:
     try:
-        client.admin.command("ping")
+        get_client().admin.command("ping")
         return True
     except Exception:
         return False
+
+
+def __getattr__(name: str):
+    # client, db and the *_collection names, resolved on first access
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_db()
+    if name in COLLECTIONS:
+        return get_db()[COLLECTIONS[name]]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
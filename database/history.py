@@ -0,0 +1,159 @@
+"""
+Keyset pagination over the learning history.
+
+Pages are ordered by (timestamp, _id) and a page cursor encodes the sort
+key of the last record returned, so fetching page N costs the same as
+fetching page 1 (no skip) and works with the student/skill/timestamp
+indexes.
+
+The cursor format, paging and projection helpers are shared by every
+storage backend; find_history / history_page / iter_history_ndjson are
+the Mongo implementations.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+
+SORT = [("timestamp", 1), ("_id", 1)]
+
+
+def encode_cursor(doc: dict) -> str:
+    """
+    Opaque cursor pointing just after `doc`.
+    """
+    raw = json.dumps({"t": doc["timestamp"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, id_type=ObjectId) -> tuple:
+    """
+    Inverse of encode_cursor: (timestamp, id), with the id converted by
+    `id_type` (ObjectId for Mongo, int for the SQL and memory backends).
+    Raises ValueError on a malformed cursor.
+    """
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(raw["t"]), id_type(raw["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def project(record: dict, fields: list[str] | None) -> dict:
+    """
+    `record` reduced to `fields` (dotted paths allowed) plus the sort
+    key, like a Mongo projection.
+    """
+    if not fields:
+        return record
+
+    projected = {}
+    for field in [*fields, "timestamp", "_id"]:
+        source, target = record, projected
+        *parents, leaf = field.split(".")
+        for part in parents:
+            source = source.get(part) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(part, {})
+        else:
+            if leaf in source:
+                target[leaf] = source[leaf]
+    return projected
+
+
+def page_of(records: list[dict], limit: int) -> dict:
+    """
+    Page response from up to `limit` + 1 records in sort order: the extra
+    record only signals that there is a next page.
+    """
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1])
+
+    for record in records:
+        record.pop("_id", None)
+
+    return {"history": records, "next_cursor": next_cursor}
+
+
+def ndjson_lines(records):
+    """
+    Records as NDJSON lines (internal ids dropped).
+    """
+    for record in records:
+        record.pop("_id", None)
+        yield json.dumps(record, default=_json_default) + "\n"
+
+
+def history_filter(student_id: str, skill_id: str | None = None, after: str | None = None) -> dict:
+    query = {"student_id": student_id}
+    if skill_id:
+        query["skill_id"] = skill_id
+
+    if after:
+        timestamp, _id = decode_cursor(after)
+        query["$or"] = [
+            {"timestamp": {"$gt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$gt": _id}},
+        ]
+    return query
+
+
+def history_projection(fields: list[str] | None) -> dict | None:
+    """
+    Projection for the requested fields; the sort key is always included
+    so a cursor can be built from the last record.
+    """
+    if not fields:
+        return None
+    projection = {field: 1 for field in fields}
+    projection.update({"timestamp": 1, "_id": 1})
+    return projection
+
+
+def find_history(
+    collection,
+    student_id: str,
+    skill_id: str | None = None,
+    after: str | None = None,
+    fields: list[str] | None = None,
+    limit: int | None = None,
+    batch_size: int = 500
+):
+    """
+    Cursor over a student's history in (timestamp, _id) order.
+    """
+    cursor = collection.find(
+        history_filter(student_id, skill_id, after),
+        history_projection(fields),
+    ).sort(SORT).batch_size(batch_size)
+
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def history_page(collection, student_id: str, skill_id=None, after=None, fields=None, limit: int = 100) -> dict:
+    """
+    One page of history plus the cursor for the next page (None at the end).
+    """
+    return page_of(list(find_history(collection, student_id, skill_id, after, fields, limit + 1)), limit)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_history_ndjson(collection, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+    """
+    Yield history records as NDJSON lines straight from the Mongo cursor,
+    one batch in memory at a time.
+    """
+    return ndjson_lines(find_history(collection, student_id, skill_id, after, fields, limit))
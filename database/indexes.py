@@ -0,0 +1,76 @@
+"""
+Index bootstrap for the learning collections.
+
+Every analytics and /learn query filters on student_id (+ skill_id) and
+sorts on timestamp, so those collections get compound indexes in that
+order. create_indexes is a no-op for indexes that already exist, so this
+runs safely at every startup.
+"""
+
+from pymongo import ASCENDING, IndexModel
+
+
+INDEXES = {
+    "learning_history": [
+        # _id breaks timestamp ties for keyset pagination
+        IndexModel(
+            [
+                ("student_id", ASCENDING),
+                ("skill_id", ASCENDING),
+                ("timestamp", ASCENDING),
+                ("_id", ASCENDING),
+            ],
+            name="student_skill_timestamp_id",
+        ),
+        IndexModel(
+            [("student_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+            name="student_timestamp_id",
+        ),
+    ],
+    "bkt_states": [
+        IndexModel(
+            [("student_id", ASCENDING), ("skill_id", ASCENDING)],
+            name="student_skill",
+            unique=True,
+        ),
+    ],
+    "bkt_attempts": [
+        IndexModel(
+            [("student_id", ASCENDING), ("skill_id", ASCENDING), ("timestamp", ASCENDING)],
+            name="student_skill_timestamp",
+        ),
+    ],
+    "answer_cache": [
+        # Mongo removes cached answers once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "learning_trends": [
+        IndexModel(
+            [("student_id", ASCENDING), ("skill_id", ASCENDING)],
+            name="student_skill",
+            unique=True,
+        ),
+    ],
+}
+
+
+def ensure_indexes(db) -> dict:
+    """
+    Create any missing indexes. Returns {collection: [index names]}.
+    """
+    return {
+        name: db[name].create_indexes(models)
+        for name, models in INDEXES.items()
+    }
+
+
+def drop_indexes(db):
+    """
+    Drop the indexes managed here (the _id index is left alone).
+    """
+    for name, models in INDEXES.items():
+        existing = db[name].index_information()
+        for model in models:
+            index_name = model.document["name"]
+            if index_name in existing:
+                db[name].drop_index(index_name)
@@ -0,0 +1,138 @@
+import itertools
+import threading
+from bisect import bisect_right, insort
+from datetime import datetime, timezone
+
+from database.history import project
+from database.storage import Storage
+from database.trends import fold_mastery, mastery_value
+
+
+def _sort_key(record: dict) -> tuple:
+    return record["timestamp"], record["_id"]
+
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    # Stored timestamps are naive UTC; aware bounds are converted to match
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class MemoryStorage(Storage):
+    """
+    Process-local storage: nothing is persisted, everything is gone when
+    the process exits. For tests, benchmarks and single-process demos.
+
+    History records are kept in (timestamp, _id) order per student and
+    per (student, skill), so pages and curves are bisected slices.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._by_student = {}
+        self._by_pair = {}
+        self._states = {}
+        self._attempts = []
+        self._trends = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------
+    # History
+    # -------------------------------------------------
+    def insert_history(self, doc: dict):
+        record = {**doc, "_id": next(self._ids)}
+        with self._lock:
+            insort(self._by_student.setdefault(doc["student_id"], []), record, key=_sort_key)
+            insort(
+                self._by_pair.setdefault((doc["student_id"], doc["skill_id"]), []),
+                record,
+                key=_sort_key
+            )
+
+    def find_history(self, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+        start = self.parse_cursor(after) if after else None
+
+        with self._lock:
+            if skill_id:
+                records = self._by_pair.get((student_id, skill_id), [])
+            else:
+                records = self._by_student.get(student_id, [])
+            lo = bisect_right(records, start, key=_sort_key) if start else 0
+            records = records[lo:lo + limit] if limit else records[lo:]
+
+        return (project(dict(record), fields) for record in records)
+
+    def mastery_points(self, student_id: str, skill_id: str, start=None, end=None) -> list[dict]:
+        start, end = _naive_utc(start), _naive_utc(end)
+        with self._lock:
+            records = list(self._by_pair.get((student_id, skill_id), []))
+
+        return [
+            {"timestamp": record["timestamp"], "mastery": mastery_value(record["mastery"])}
+            for record in records
+            if record.get("mastery") is not None
+            and (start is None or record["timestamp"] >= start)
+            and (end is None or record["timestamp"] <= end)
+        ]
+
+    def iter_mastery_history(self):
+        with self._lock:
+            pairs = sorted(self._by_pair.items())
+
+        for _, records in pairs:
+            for record in records:
+                if record.get("mastery") is not None:
+                    yield {
+                        "student_id": record["student_id"],
+                        "skill_id": record["skill_id"],
+                        "mastery": record["mastery"],
+                        "quiz_action": record.get("quiz_action"),
+                    }
+
+    # -------------------------------------------------
+    # BKT state and attempts
+    # -------------------------------------------------
+    def load_bkt_states(self, student_id: str) -> dict:
+        with self._lock:
+            return dict(self._states.get(student_id, {}))
+
+    def save_bkt_states(self, docs: list[dict]):
+        with self._lock:
+            for doc in docs:
+                self._states.setdefault(doc["student_id"], {})[doc["skill_id"]] = doc["mastery"]
+
+    def insert_attempts(self, docs: list[dict]):
+        rows = [
+            (doc["student_id"], doc["skill_id"], doc["timestamp"], bool(doc["is_correct"]))
+            for doc in docs
+        ]
+        with self._lock:
+            self._attempts.extend(rows)
+
+    def iter_attempts(self):
+        with self._lock:
+            rows = sorted(self._attempts, key=lambda row: row[:3])
+
+        for student_id, skill_id, _, is_correct in rows:
+            yield student_id, skill_id, is_correct
+
+    # -------------------------------------------------
+    # Analytics
+    # -------------------------------------------------
+    def record_mastery(self, student_id: str, skill_id: str, mastery: float) -> dict | None:
+        key = (student_id, skill_id)
+        with self._lock:
+            previous = self._trends.get(key)
+            self._trends[key] = fold_mastery(
+                previous or {"student_id": student_id, "skill_id": skill_id},
+                mastery
+            )
+        return previous
+
+    def get_trend(self, student_id: str, skill_id: str) -> dict | None:
+        with self._lock:
+            aggregate = self._trends.get((student_id, skill_id))
+        return dict(aggregate) if aggregate else None
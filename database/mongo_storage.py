@@ -0,0 +1,144 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import curves, history, trends
+from database.answer_store import MongoAnswerStore
+from database.indexes import ensure_indexes
+from database.storage import RejectedWriteError, Storage
+
+
+class MongoStorage(Storage):
+    """
+    Storage on the MongoDB collections, using the query helpers in
+    database.history, database.curves and database.trends.
+
+    `db` defaults to the lazily connected database from database.db.
+    """
+
+    name = "mongo"
+    cursor_id = ObjectId
+
+    def __init__(self, db=None):
+        if db is None:
+            from database.db import get_db
+            db = get_db()
+
+        self.db = db
+        self.history = db["learning_history"]
+        self.states = db["bkt_states"]
+        self.attempts = db["bkt_attempts"]
+        self.trends = db["learning_trends"]
+        self.answers = db["answer_cache"]
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+    def ensure_schema(self):
+        ensure_indexes(self.db)
+
+    def ping(self) -> bool:
+        try:
+            self.db.client.admin.command("ping")
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self.db.client.close()
+
+    # -------------------------------------------------
+    # History
+    # -------------------------------------------------
+    def insert_history(self, doc: dict):
+        self.history.insert_one(doc)
+
+    def find_history(self, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+        return history.find_history(self.history, student_id, skill_id, after, fields, limit)
+
+    def mastery_curve(
+        self,
+        student_id: str,
+        skill_id: str,
+        max_points=None,
+        bucket_seconds=None,
+        start=None,
+        end=None,
+        method: str = "minmax"
+    ) -> list[dict]:
+        # Downsampled by the server
+        return curves.mastery_curve(
+            self.history, student_id, skill_id,
+            max_points=max_points,
+            bucket_seconds=bucket_seconds,
+            start=start,
+            end=end,
+            method=method,
+        )
+
+    def mastery_points(self, student_id: str, skill_id: str, start=None, end=None) -> list[dict]:
+        return curves.raw_curve(self.history, curves.curve_filter(student_id, skill_id, start, end))
+
+    def iter_mastery_history(self):
+        return self.history.find(
+            {"mastery": {"$ne": None}},
+            {"_id": 0, "student_id": 1, "skill_id": 1, "mastery": 1, "quiz_action": 1},
+            sort=[("student_id", 1), ("skill_id", 1), ("timestamp", 1), ("_id", 1)],
+        )
+
+    # -------------------------------------------------
+    # BKT state and attempts
+    # -------------------------------------------------
+    def load_bkt_states(self, student_id: str) -> dict:
+        return {
+            doc["skill_id"]: doc["mastery"]
+            for doc in self.states.find(
+                {"student_id": student_id},
+                {"_id": 0, "skill_id": 1, "mastery": 1},
+            )
+        }
+
+    def save_bkt_states(self, docs: list[dict]):
+        requests = [
+            UpdateOne(
+                {"student_id": doc["student_id"], "skill_id": doc["skill_id"]},
+                {"$set": doc},
+                upsert=True
+            )
+            for doc in docs
+        ]
+        try:
+            self.states.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            raise RejectedWriteError(e.details.get("writeErrors")) from e
+
+    def insert_attempts(self, docs: list[dict]):
+        try:
+            # insert_many assigns _id client-side, so a retry after a
+            # partial failure cannot insert duplicates
+            self.attempts.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            raise RejectedWriteError(e.details.get("writeErrors")) from e
+
+    def iter_attempts(self):
+        for doc in self.attempts.find(
+            {},
+            {"_id": 0, "student_id": 1, "skill_id": 1, "is_correct": 1},
+            sort=[("student_id", 1), ("skill_id", 1), ("timestamp", 1)],
+        ):
+            yield doc["student_id"], doc["skill_id"], bool(doc["is_correct"])
+
+    # -------------------------------------------------
+    # Analytics
+    # -------------------------------------------------
+    def record_mastery(self, student_id: str, skill_id: str, mastery: float) -> dict | None:
+        return trends.record_mastery(self.trends, student_id, skill_id, mastery)
+
+    def get_trend(self, student_id: str, skill_id: str) -> dict | None:
+        return trends.get_trend(self.trends, student_id, skill_id)
+
+    # -------------------------------------------------
+    # Answer cache
+    # -------------------------------------------------
+    def answer_store(self):
+        return MongoAnswerStore(self.answers)
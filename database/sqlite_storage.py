@@ -0,0 +1,399 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from database.history import _json_default, project
+from database.storage import RejectedWriteError, Storage
+from database.trends import fold_mastery, mastery_value
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Rows per query when iterating history and attempts
+CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS learning_history (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    skill_id TEXT,
+    timestamp INTEGER NOT NULL,
+    mastery REAL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_student_skill_timestamp_id
+    ON learning_history (student_id, skill_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS history_student_timestamp_id
+    ON learning_history (student_id, timestamp, id);
+
+CREATE TABLE IF NOT EXISTS bkt_states (
+    student_id TEXT NOT NULL,
+    skill_id TEXT NOT NULL,
+    mastery REAL NOT NULL,
+    updated_at INTEGER,
+    PRIMARY KEY (student_id, skill_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS bkt_attempts (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    skill_id TEXT NOT NULL,
+    is_correct INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_student_skill_timestamp
+    ON bkt_attempts (student_id, skill_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS learning_trends (
+    student_id TEXT NOT NULL,
+    skill_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    initial_mastery REAL,
+    latest_mastery REAL,
+    mean REAL,
+    m2 REAL,
+    updated_at INTEGER,
+    PRIMARY KEY (student_id, skill_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS answer_cache (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+TREND_FIELDS = ["count", "initial_mastery", "latest_mastery", "mean", "m2", "updated_at"]
+
+
+def _to_us(value: datetime) -> int:
+    # Microseconds since the epoch; naive datetimes are UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+class SQLiteStorage(Storage):
+    """
+    Embedded storage in one SQLite file.
+
+    - WAL journal with synchronous=NORMAL: readers never block the writer
+      and a commit is one sequential append to the log.
+    - All writes go through one connection under a lock, each call in a
+      single transaction, so a bulk call (BKT states, attempts) costs one
+      commit however many rows it holds.
+    - Reads use a connection per thread, so they run alongside writes.
+    - Timestamps are stored as integer microseconds (UTC); a history
+      record is kept as JSON next to the columns it is queried by.
+
+    path=":memory:" gives a private in-memory database (reads then share
+    the write connection).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "agentic_learning.db", timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._memory = path == ":memory:"
+
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._conn = self._connect()
+        self.ensure_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _read(self, sql: str, params=()) -> list:
+        if self._memory:
+            with self._write_lock:
+                return self._conn.execute(sql, params).fetchall()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._write_lock:
+                self._readers.append(conn)
+        return conn.execute(sql, params).fetchall()
+
+    def _iter_keyset(self, select: str, where: str, key: str, params=()):
+        """
+        Rows of `SELECT {key}, {select} ... WHERE {where} ORDER BY {key}`,
+        read in keyset chunks of CHUNK_SIZE so neither a cursor nor the
+        whole result is held between chunks. `key` must be unique per row,
+        non-NULL and indexed in that order.
+        """
+        width = len(key.split(","))
+        position = None
+        while True:
+            sql = f"SELECT {key}, {select} WHERE {where}"
+            chunk_params = list(params)
+            if position:
+                sql += f" AND ({key}) > ({', '.join('?' * width)})"
+                chunk_params.extend(position)
+            sql += f" ORDER BY {key} LIMIT ?"
+            chunk_params.append(CHUNK_SIZE)
+
+            rows = self._read(sql, chunk_params)
+            yield from rows
+            if len(rows) < CHUNK_SIZE:
+                return
+            position = rows[-1][:width]
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+    def ensure_schema(self):
+        with self._write_lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.execute("DELETE FROM answer_cache WHERE expires_at <= ?", (time.time(),))
+
+    def ping(self) -> bool:
+        try:
+            self._read("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        with self._write_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self._conn.close()
+
+    # -------------------------------------------------
+    # History
+    # -------------------------------------------------
+    def insert_history(self, doc: dict):
+        record = {k: v for k, v in doc.items() if k != "timestamp"}
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO learning_history (student_id, skill_id, timestamp, mastery, doc) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    doc["student_id"],
+                    doc.get("skill_id"),
+                    _to_us(doc["timestamp"]),
+                    mastery_value(doc.get("mastery")),
+                    json.dumps(record, default=_json_default),
+                ),
+            )
+
+    def find_history(self, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+        position = None
+        if after:
+            timestamp, _id = self.parse_cursor(after)
+            position = (_to_us(timestamp), _id)
+        return self._find_history(student_id, skill_id, position, fields, limit)
+
+    def _find_history(self, student_id, skill_id, position, fields, limit):
+        # Keyset chunks: no cursor is held open between records
+        where = "student_id = ?"
+        params = [student_id]
+        if skill_id:
+            where += " AND skill_id = ?"
+            params.append(skill_id)
+
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            sql = f"SELECT id, timestamp, doc FROM learning_history WHERE {where}"
+            chunk_params = list(params)
+            if position:
+                sql += " AND (timestamp, id) > (?, ?)"
+                chunk_params.extend(position)
+            sql += " ORDER BY timestamp, id LIMIT ?"
+            chunk_params.append(size)
+
+            rows = self._read(sql, chunk_params)
+            for _id, timestamp, doc in rows:
+                record = json.loads(doc)
+                record["timestamp"] = _from_us(timestamp)
+                record["_id"] = _id
+                yield project(record, fields)
+
+            if len(rows) < size:
+                return
+            position = (rows[-1][1], rows[-1][0])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def mastery_points(self, student_id: str, skill_id: str, start=None, end=None) -> list[dict]:
+        sql = (
+            "SELECT timestamp, mastery FROM learning_history "
+            "WHERE student_id = ? AND skill_id = ? AND mastery IS NOT NULL"
+        )
+        params = [student_id, skill_id]
+        if start:
+            sql += " AND timestamp >= ?"
+            params.append(_to_us(start))
+        if end:
+            sql += " AND timestamp <= ?"
+            params.append(_to_us(end))
+        sql += " ORDER BY timestamp, id"
+
+        return [
+            {"timestamp": _from_us(timestamp), "mastery": mastery}
+            for timestamp, mastery in self._read(sql, params)
+        ]
+
+    def iter_mastery_history(self):
+        # Records with a mastery always have a skill (it is assessed)
+        rows = self._iter_keyset(
+            "doc FROM learning_history",
+            "mastery IS NOT NULL AND skill_id IS NOT NULL",
+            "student_id, skill_id, timestamp, id",
+        )
+        for *_, doc in rows:
+            record = json.loads(doc)
+            yield {
+                "student_id": record["student_id"],
+                "skill_id": record["skill_id"],
+                "mastery": record["mastery"],
+                "quiz_action": record.get("quiz_action"),
+            }
+
+    # -------------------------------------------------
+    # BKT state and attempts
+    # -------------------------------------------------
+    def load_bkt_states(self, student_id: str) -> dict:
+        return dict(self._read(
+            "SELECT skill_id, mastery FROM bkt_states WHERE student_id = ?",
+            (student_id,),
+        ))
+
+    def save_bkt_states(self, docs: list[dict]):
+        rows = [
+            (doc["student_id"], doc["skill_id"], doc["mastery"], _to_us(doc["updated_at"]))
+            for doc in docs
+        ]
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO bkt_states (student_id, skill_id, mastery, updated_at) "
+                    "VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (student_id, skill_id) DO UPDATE SET "
+                    "mastery = excluded.mastery, updated_at = excluded.updated_at",
+                    rows,
+                )
+        except sqlite3.IntegrityError as e:
+            raise RejectedWriteError(str(e)) from e
+
+    def insert_attempts(self, docs: list[dict]):
+        rows = [
+            (doc["student_id"], doc["skill_id"], bool(doc["is_correct"]), _to_us(doc["timestamp"]))
+            for doc in docs
+        ]
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO bkt_attempts (student_id, skill_id, is_correct, timestamp) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.IntegrityError as e:
+            raise RejectedWriteError(str(e)) from e
+
+    def iter_attempts(self):
+        rows = self._iter_keyset(
+            "is_correct FROM bkt_attempts",
+            "1",
+            "student_id, skill_id, timestamp, id",
+        )
+        for student_id, skill_id, _, _, is_correct in rows:
+            yield student_id, skill_id, bool(is_correct)
+
+    # -------------------------------------------------
+    # Analytics
+    # -------------------------------------------------
+    def _trend(self, row, student_id: str, skill_id: str) -> dict | None:
+        if row is None:
+            return None
+        aggregate = {"student_id": student_id, "skill_id": skill_id, **dict(zip(TREND_FIELDS, row))}
+        aggregate["updated_at"] = _from_us(aggregate["updated_at"])
+        return aggregate
+
+    def record_mastery(self, student_id: str, skill_id: str, mastery: float) -> dict | None:
+        columns = ", ".join(TREND_FIELDS)
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT {columns} FROM learning_trends WHERE student_id = ? AND skill_id = ?",
+                (student_id, skill_id),
+            ).fetchone()
+            previous = self._trend(row, student_id, skill_id)
+
+            aggregate = fold_mastery(previous, mastery)
+            aggregate["updated_at"] = _to_us(aggregate["updated_at"])
+            conn.execute(
+                f"INSERT OR REPLACE INTO learning_trends (student_id, skill_id, {columns}) "
+                f"VALUES (?, ?, {', '.join('?' * len(TREND_FIELDS))})",
+                (student_id, skill_id, *(aggregate[field] for field in TREND_FIELDS)),
+            )
+        return previous
+
+    def get_trend(self, student_id: str, skill_id: str) -> dict | None:
+        rows = self._read(
+            f"SELECT {', '.join(TREND_FIELDS)} FROM learning_trends "
+            "WHERE student_id = ? AND skill_id = ?",
+            (student_id, skill_id),
+        )
+        return self._trend(rows[0] if rows else None, student_id, skill_id)
+
+    # -------------------------------------------------
+    # Answer cache
+    # -------------------------------------------------
+    def answer_store(self):
+        return SQLiteAnswerStore(self)
+
+
+class SQLiteAnswerStore:
+    """
+    Persistent AnswerCache tier in the answer_cache table. Expired rows
+    are ignored on read and purged by ensure_schema.
+    """
+
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+
+    def get(self, key: str) -> str | None:
+        rows = self.storage._read(
+            "SELECT answer FROM answer_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, key: str, answer: str, ttl: float):
+        with self.storage._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answer_cache (key, answer, expires_at) VALUES (?, ?, ?)",
+                (key, answer, time.time() + ttl),
+            )
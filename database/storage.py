@@ -0,0 +1,173 @@
+"""
+Storage interface for the learning data.
+
+The app reads and writes history, BKT state, attempts, trend analytics
+and cached answers only through a Storage, so the backing store is a
+deployment choice:
+- mongo (default): MongoDB collections (database/mongo_storage.py)
+- sqlite: one embedded database file in WAL mode, bulk writes in single
+  transactions (database/sqlite_storage.py)
+- memory: process-local dicts and lists, for tests and benchmarks
+  (database/memory_storage.py)
+
+Selected with STORAGE_BACKEND; SQLITE_PATH sets the SQLite file.
+"""
+
+import os
+
+from database.curves import downsample_points
+from database.history import decode_cursor, ndjson_lines, page_of
+
+
+class RejectedWriteError(Exception):
+    """
+    A write the backend refused for good (e.g. a constraint violation);
+    retrying it would fail the same way.
+    """
+
+
+class Storage:
+    """
+    Base class of the storage backends.
+
+    Records returned by history reads are dicts shaped like the documents
+    from database.models, with the storage's own record id under "_id"
+    (dropped before they are returned to clients).
+    """
+
+    name = "base"
+
+    # Type of the record ids in history cursors
+    cursor_id = int
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+    def ensure_schema(self):
+        """
+        Create missing tables / indexes. Safe to call at every startup.
+        """
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    # -------------------------------------------------
+    # History
+    # -------------------------------------------------
+    def insert_history(self, doc: dict):
+        raise NotImplementedError
+
+    def find_history(self, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+        """
+        Iterator over a student's history in (timestamp, _id) order,
+        starting after the `after` cursor.
+        """
+        raise NotImplementedError
+
+    def parse_cursor(self, cursor: str) -> tuple:
+        """
+        (timestamp, id) of a history cursor. Raises ValueError if it is
+        malformed.
+        """
+        return decode_cursor(cursor, self.cursor_id)
+
+    def history_page(self, student_id: str, skill_id=None, after=None, fields=None, limit: int = 100) -> dict:
+        return page_of(list(self.find_history(student_id, skill_id, after, fields, limit + 1)), limit)
+
+    def iter_history_ndjson(self, student_id: str, skill_id=None, after=None, fields=None, limit=None):
+        return ndjson_lines(self.find_history(student_id, skill_id, after, fields, limit))
+
+    def mastery_points(self, student_id: str, skill_id: str, start=None, end=None) -> list[dict]:
+        """
+        Time-ordered {"timestamp", "mastery"} points of a pair's history.
+        """
+        raise NotImplementedError
+
+    def mastery_curve(
+        self,
+        student_id: str,
+        skill_id: str,
+        max_points=None,
+        bucket_seconds=None,
+        start=None,
+        end=None,
+        method: str = "minmax"
+    ) -> list[dict]:
+        points = self.mastery_points(student_id, skill_id, start, end)
+        return downsample_points(points, max_points, bucket_seconds, method)
+
+    def iter_mastery_history(self):
+        """
+        {"student_id", "skill_id", "mastery", "quiz_action"} of every
+        history record with a mastery, by student, skill and time.
+        """
+        raise NotImplementedError
+
+    # -------------------------------------------------
+    # BKT state and attempts
+    # -------------------------------------------------
+    def load_bkt_states(self, student_id: str) -> dict:
+        """
+        Persisted {skill_id: mastery} of a student.
+        """
+        raise NotImplementedError
+
+    def save_bkt_states(self, docs: list[dict]):
+        """
+        Upsert BKT state documents, one per (student_id, skill_id).
+        """
+        raise NotImplementedError
+
+    def insert_attempts(self, docs: list[dict]):
+        raise NotImplementedError
+
+    def iter_attempts(self):
+        """
+        (student_id, skill_id, is_correct) of every attempt, by student,
+        skill and time.
+        """
+        raise NotImplementedError
+
+    # -------------------------------------------------
+    # Analytics
+    # -------------------------------------------------
+    def record_mastery(self, student_id: str, skill_id: str, mastery: float) -> dict | None:
+        """
+        Fold a mastery sample into the pair's trend aggregate (see
+        database.trends). Returns the aggregate as it was before.
+        """
+        raise NotImplementedError
+
+    def get_trend(self, student_id: str, skill_id: str) -> dict | None:
+        raise NotImplementedError
+
+    # -------------------------------------------------
+    # Answer cache
+    # -------------------------------------------------
+    def answer_store(self):
+        """
+        Persistent tier for AnswerCache (get / set), or None.
+        """
+        return None
+
+
+def create_storage(backend: str | None = None, **options) -> Storage:
+    """
+    Storage for `backend` (default: STORAGE_BACKEND, else "mongo").
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "mongo")).lower()
+
+    if backend == "mongo":
+        from database.mongo_storage import MongoStorage
+        return MongoStorage(**options)
+    if backend == "sqlite":
+        from database.sqlite_storage import SQLiteStorage
+        options.setdefault("path", os.getenv("SQLITE_PATH", "agentic_learning.db"))
+        return SQLiteStorage(**options)
+    if backend == "memory":
+        from database.memory_storage import MemoryStorage
+        return MemoryStorage(**options)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
@@ -0,0 +1,165 @@
+"""
+Running per-(student, skill) learning-trend aggregates.
+
+Each document in the learning_trends collection holds, for one pair:
+- initial_mastery / latest_mastery: first and most recent mastery sample
+- count: number of samples
+- mean / m2: running mean and sum of squared deviations (Welford)
+
+The aggregate is folded forward with one atomic pipeline update per
+sample, so trend decisions never scan the learning history.
+
+Backfill from existing history:
+    python -m database.trends backfill
+"""
+
+import sys
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+
+def mastery_value(mastery) -> float | None:
+    """
+    History documents store the BKT result dict under "mastery";
+    older ones may hold the bare float.
+    """
+    if isinstance(mastery, dict):
+        return mastery.get("mastery")
+    return mastery
+
+
+def record_mastery(collection, student_id: str, skill_id: str, mastery: float) -> dict | None:
+    """
+    Fold a mastery sample into the pair's aggregate.
+    Returns the aggregate as it was before this sample (None if first).
+    """
+    return collection.find_one_and_update(
+        {"student_id": student_id, "skill_id": skill_id},
+        [
+            {"$set": {
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+                "initial_mastery": {"$ifNull": ["$initial_mastery", mastery]},
+                "latest_mastery": mastery,
+                "_delta": {"$subtract": [mastery, {"$ifNull": ["$mean", 0.0]}]},
+            }},
+            {"$set": {
+                "mean": {"$add": [
+                    {"$ifNull": ["$mean", 0.0]},
+                    {"$divide": ["$_delta", "$count"]},
+                ]},
+            }},
+            {"$set": {
+                "m2": {"$add": [
+                    {"$ifNull": ["$m2", 0.0]},
+                    {"$multiply": ["$_delta", {"$subtract": [mastery, "$mean"]}]},
+                ]},
+                "updated_at": "$$NOW",
+            }},
+            {"$project": {"_delta": 0}},
+        ],
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+
+def fold_mastery(aggregate: dict | None, mastery: float, now: datetime | None = None) -> dict:
+    """
+    The aggregate after one more sample: record_mastery's pipeline in
+    Python, for storage backends that fold in the application.
+    """
+    aggregate = aggregate or {}
+    count = aggregate.get("count", 0) + 1
+    mean = aggregate.get("mean", 0.0)
+    delta = mastery - mean
+    mean += delta / count
+
+    return {
+        **aggregate,
+        "count": count,
+        "initial_mastery": aggregate.get("initial_mastery", mastery),
+        "latest_mastery": mastery,
+        "mean": mean,
+        "m2": aggregate.get("m2", 0.0) + delta * (mastery - mean),
+        "updated_at": now or datetime.utcnow(),
+    }
+
+
+def get_trend(collection, student_id: str, skill_id: str) -> dict | None:
+    """
+    Current aggregate of a pair, or None if it has no samples.
+    """
+    return collection.find_one(
+        {"student_id": student_id, "skill_id": skill_id},
+        {"_id": 0},
+    )
+
+
+def learning_gain(aggregate: dict | None) -> float | None:
+    """
+    latest - initial mastery, or None with fewer than two samples.
+    """
+    if not aggregate or aggregate.get("count", 0) < 2:
+        return None
+    return aggregate["latest_mastery"] - aggregate["initial_mastery"]
+
+
+def backfill(history_collection, trends_collection) -> int:
+    """
+    Rebuild every aggregate from the learning history in one server-side
+    aggregation. Run with writers paused: samples recorded while it runs
+    may be overwritten. Returns the number of aggregates written.
+    """
+    trends_collection.create_index(
+        [("student_id", 1), ("skill_id", 1)], unique=True
+    )
+
+    history_collection.aggregate([
+        {"$match": {"mastery": {"$ne": None}}},
+        {"$sort": {"timestamp": 1}},
+        {"$project": {
+            "student_id": 1,
+            "skill_id": 1,
+            # Nested BKT result dict, or a bare float in older documents
+            "value": {"$ifNull": ["$mastery.mastery", "$mastery"]},
+        }},
+        {"$group": {
+            "_id": {"student_id": "$student_id", "skill_id": "$skill_id"},
+            "initial_mastery": {"$first": "$value"},
+            "latest_mastery": {"$last": "$value"},
+            "count": {"$sum": 1},
+            "mean": {"$avg": "$value"},
+            "std": {"$stdDevPop": "$value"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "student_id": "$_id.student_id",
+            "skill_id": "$_id.skill_id",
+            "initial_mastery": 1,
+            "latest_mastery": 1,
+            "count": 1,
+            "mean": 1,
+            "m2": {"$multiply": ["$std", "$std", "$count"]},
+            "updated_at": "$$NOW",
+        }},
+        {"$merge": {
+            "into": trends_collection.name,
+            "on": ["student_id", "skill_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ], allowDiskUse=True)
+
+    return trends_collection.count_documents({})
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python -m database.trends backfill")
+        sys.exit(1)
+
+    from database.db import learning_history_collection, learning_trends_collection
+
+    written = backfill(learning_history_collection, learning_trends_collection)
+    print(f"Backfilled {written} learning-trend aggregates")
@@ -0,0 +1,279 @@
+import threading
+
+from database.storage import RejectedWriteError
+from metrics import WRITE_BEHIND_DROPPED
+
+
+class WriteBehindWriter:
+    """
+    Write-behind buffer for BKT persistence.
+
+    The request path only enqueues documents; a background thread flushes
+    them to the storage backend in bulk:
+    - BKT state upserts are coalesced per (student_id, skill_id), so only
+      the latest state of a pair is written per flush. They are indexed by
+      student, so a page-in reads its pending states directly.
+    - Attempt documents are appended and written with bulk inserts.
+
+    A flush happens every `flush_interval` seconds, or as soon as either
+    buffer reaches `max_batch` entries, and writes at most `max_batch`
+    documents per storage call. `close()` drains whatever is left.
+
+    Writes that fail stay buffered for the next flush, but the buffer holds
+    at most `max_pending` documents: beyond that the oldest are dropped,
+    attempts before states, and counted in `dropped` and the
+    write_behind_dropped_total metric. After a failed flush
+    the thread waits a full `flush_interval` before trying again.
+    """
+
+    def __init__(
+        self,
+        storage,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 100_000
+    ):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # Pending writes, and states taken by a flush still in progress.
+        # States are kept as {student_id: {skill_id: doc}}.
+        self._states = {}
+        self._state_count = 0
+        self._attempts = []
+        self._inflight_states = {}
+        self.dropped = 0
+        self._overflowing = False
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the background flush thread.
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="bkt-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        """
+        Stop the flush thread and drain all pending writes.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    # -------------------------------------------------
+    # Request path
+    # -------------------------------------------------
+    def enqueue_state(self, state_doc: dict):
+        """
+        Buffer a BKT state upsert, replacing any pending one for the pair.
+        """
+        with self._lock:
+            self._put_state(state_doc)
+            self._trim()
+            full = self._state_count >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def enqueue_attempt(self, attempt_doc: dict):
+        """
+        Buffer an attempt insert.
+        """
+        with self._lock:
+            self._attempts.append(attempt_doc)
+            self._trim()
+            full = len(self._attempts) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def pending_states(self, student_id: str) -> dict:
+        """
+        Return {skill_id: mastery} for a student's states that are buffered
+        or being flushed, i.e. newer than what the storage holds.
+        """
+        with self._lock:
+            states = {
+                skill_id: doc["mastery"]
+                for skill_id, doc in self._inflight_states.get(student_id, {}).items()
+            }
+            for skill_id, doc in self._states.get(student_id, {}).items():
+                states[skill_id] = doc["mastery"]
+            return states
+
+    def pending(self) -> int:
+        """
+        Number of buffered writes not yet flushed.
+        """
+        with self._lock:
+            return self._state_count + len(self._attempts)
+
+    # -------------------------------------------------
+    # Buffer bookkeeping (callers hold _lock)
+    # -------------------------------------------------
+    def _put_state(self, doc: dict, keep_newer: bool = False):
+        skills = self._states.setdefault(doc["student_id"], {})
+        skill_id = doc["skill_id"]
+        if skill_id not in skills:
+            self._state_count += 1
+        elif keep_newer:
+            # A state enqueued meanwhile is newer and wins
+            return
+        skills[skill_id] = doc
+
+    def _pop_state(self, student_id: str, skill_id: str):
+        skills = self._states.get(student_id)
+        if skills is None or skill_id not in skills:
+            return None
+        doc = skills.pop(skill_id)
+        if not skills:
+            del self._states[student_id]
+        self._state_count -= 1
+        return doc
+
+    def _trim(self):
+        excess = self._state_count + len(self._attempts) - self.max_pending
+        if excess <= 0:
+            return
+
+        dropped_attempts = min(excess, len(self._attempts))
+        del self._attempts[:dropped_attempts]
+        excess -= dropped_attempts
+
+        # Students are kept in insertion order; drop the oldest first
+        dropped_states = 0
+        while excess > 0:
+            student_id = next(iter(self._states))
+            skill_id = next(iter(self._states[student_id]))
+            self._pop_state(student_id, skill_id)
+            excess -= 1
+            dropped_states += 1
+
+        self.dropped += dropped_attempts + dropped_states
+        WRITE_BEHIND_DROPPED.labels("attempt").inc(dropped_attempts)
+        WRITE_BEHIND_DROPPED.labels("bkt_state").inc(dropped_states)
+        if not self._overflowing:
+            # Reported once until a flush succeeds again
+            self._overflowing = True
+            print("Write-behind buffer full: dropping the oldest writes")
+
+    # -------------------------------------------------
+    # Flushing
+    # -------------------------------------------------
+    def flush(self) -> bool:
+        """
+        Write all buffered documents, `max_batch` per storage call.
+        On a failed call the documents not yet written are put back in the
+        buffer for the next flush, without trying the rest now.
+        Returns False if a write failed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                states, self._states = self._states, {}
+                self._state_count = 0
+                attempts, self._attempts = self._attempts, []
+                self._inflight_states = states
+
+            state_docs = [
+                doc for skills in states.values() for doc in skills.values()
+            ]
+            try:
+                unwritten = self._write_batches(
+                    self.storage.save_bkt_states, state_docs, "BKT state"
+                )
+                with self._lock:
+                    for doc in unwritten:
+                        self._put_state(doc, keep_newer=True)
+                    self._trim()
+            finally:
+                with self._lock:
+                    self._inflight_states = {}
+
+            failed = self._write_batches(
+                self.storage.insert_attempts, attempts, "Attempt"
+            )
+            if failed:
+                with self._lock:
+                    self._attempts = failed + self._attempts
+                    self._trim()
+
+            ok = not unwritten and not failed
+            if ok:
+                with self._lock:
+                    self._overflowing = False
+            return ok
+
+    def _write_batches(self, write, docs: list[dict], kind: str) -> list[dict]:
+        """
+        Write `docs` in chunks of `max_batch` and return the ones left
+        unwritten after the first failure. Rejected chunks are skipped,
+        since retrying would fail the same way.
+        """
+        for start in range(0, len(docs), self.max_batch):
+            batch = docs[start:start + self.max_batch]
+            try:
+                write(batch)
+            except RejectedWriteError as e:
+                print(f"{kind} flush rejected:", e)
+            except Exception as e:
+                print(f"{kind} flush failed:", e)
+                return docs[start:]
+        return []
+
+    def write_through(self, state_docs: list[dict], attempt_docs: list[dict]):
+        """
+        Write now, with one bulk call per kind, bypassing the buffer.
+        Buffered states of the same pairs that are not newer are dropped,
+        so a later flush cannot overwrite these. The states count as
+        pending while written, like a flush's. Writes that fail are put
+        back in the buffer before the error is raised, unless rejected.
+        """
+        with self._flush_lock:
+            with self._lock:
+                inflight = {}
+                for doc in state_docs:
+                    student_id, skill_id = doc["student_id"], doc["skill_id"]
+                    pending = self._states.get(student_id, {}).get(skill_id)
+                    if pending is not None and pending["updated_at"] <= doc["updated_at"]:
+                        self._pop_state(student_id, skill_id)
+                    inflight.setdefault(student_id, {})[skill_id] = doc
+                self._inflight_states = inflight
+
+            try:
+                if state_docs:
+                    self.storage.save_bkt_states(state_docs)
+                if attempt_docs:
+                    self.storage.insert_attempts(attempt_docs)
+            except RejectedWriteError:
+                raise
+            except Exception:
+                with self._lock:
+                    for doc in state_docs:
+                        self._put_state(doc, keep_newer=True)
+                    self._attempts = attempt_docs + self._attempts
+                    self._trim()
+                raise
+            finally:
+                with self._lock:
+                    self._inflight_states = {}
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self.flush():
+                # Back off instead of retrying on every full-buffer wakeup
+                self._stopping.wait(self.flush_interval)
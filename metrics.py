@@ -0,0 +1,426 @@
+"""
+In-process instrumentation: counters, gauges and latency histograms in
+the Prometheus text format, plus an opt-in sampling profiler.
+
+- Metrics live in REGISTRY and are rendered by GET /metrics. Recording a
+  sample is a dict lookup, a bisect and a few additions under a lock.
+- `timed(agent, operation)` records a function's (sync or async) latency
+  in agent_operation_duration_seconds.
+- MetricsMiddleware records per-route request latency and, for a
+  sampled fraction of requests, a cProfile capture of the work done on
+  the event loop; sync endpoints decorated with `profiled` are captured
+  in their worker thread too. With a sample rate of 0 (the default) the
+  profiler costs one comparison per request.
+"""
+
+import bisect
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -------------------------------------------------
+# Metric types
+# -------------------------------------------------
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, *values):
+        """
+        The child series for one combination of label values.
+        """
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            yield from child.samples(self.name, self.labelnames, values)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, values):
+        yield f"{name}{_label_text(labelnames, values)} {_number(self.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Read the value from `function()` at every scrape.
+        """
+        self.function = function
+
+    def samples(self, name, labelnames, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                print(f"Gauge {name} failed:", e)
+                return
+        yield f"{name}{_label_text(labelnames, values)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        cumulative = 0
+        for bound, count in zip([*self.buckets, float("inf")], counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            yield f"{name}_bucket{_label_text(labelnames, values, le)} {cumulative}"
+        yield f"{name}_sum{_label_text(labelnames, values)} {_number(total)}"
+        yield f"{name}_count{_label_text(labelnames, values)} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route and status.",
+    ["method", "route", "status"],
+)
+AGENT_LATENCY = Histogram(
+    "agent_operation_duration_seconds",
+    "Latency of agent operations.",
+    ["agent", "operation"],
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency by collection.",
+    ["collection", "command"],
+)
+MONGO_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "Failed MongoDB commands by collection.",
+    ["collection", "command"],
+)
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds",
+    "Upstream LLM call latency (to the first byte for streams).",
+    ["mode"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed or rejected upstream LLM calls.",
+    ["mode", "error"],
+)
+WRITE_BEHIND_DROPPED = Counter(
+    "write_behind_dropped_total",
+    "Buffered writes dropped because the write-behind buffer was full.",
+    ["kind"],
+)
+STATE_SIZE = Gauge(
+    "state_entries",
+    "Entries held in memory per component.",
+    ["component"],
+)
+
+
+def timed(agent: str, operation: str):
+    """
+    Decorator recording each call's latency under (agent, operation).
+    """
+    child = AGENT_LATENCY.labels(agent, operation)
+
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorate
+
+
+# -------------------------------------------------
+# Sampling profiler
+# -------------------------------------------------
+# The profiler of the request being handled, if it was sampled
+_SAMPLED = contextvars.ContextVar("profiled_request", default=None)
+
+
+class SamplingProfiler:
+    """
+    cProfile captures of a random `rate` fraction of requests, merged
+    into one pstats report.
+
+    Only one capture runs per thread at a time (cProfile hooks the whole
+    thread): a sampled request that arrives while another capture is
+    running on the event loop is captured only in its worker threads.
+    Captures on the event loop also see whatever other requests run
+    there meanwhile.
+    """
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = rate
+        self.captured = 0
+        self._stats = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def sample(self) -> bool:
+        return self.rate > 0 and random.random() < self.rate
+
+    @contextmanager
+    def capture(self):
+        if getattr(self._local, "active", False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        self._local.active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self.captured += 1
+
+    @contextmanager
+    def request(self):
+        """
+        Profile the current request if it is sampled.
+        """
+        if not self.sample():
+            yield
+            return
+
+        token = _SAMPLED.set(self)
+        try:
+            with self.capture():
+                yield
+        finally:
+            _SAMPLED.reset(token)
+
+    def report(self, sort: str = "cumulative", limit: int = 40) -> str:
+        with self._lock:
+            if self._stats is None:
+                return "No profiled requests yet.\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self.captured = 0
+
+    def snapshot(self) -> dict:
+        return {"rate": self.rate, "captured_requests": self.captured}
+
+
+def profiled(func):
+    """
+    For sync endpoints (run in the threadpool): profile the call in its
+    worker thread when the request was sampled.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _SAMPLED.get()
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.capture():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# -------------------------------------------------
+# ASGI middleware
+# -------------------------------------------------
+class MetricsMiddleware:
+    """
+    Records every HTTP request in HTTP_LATENCY under its route template
+    (unmatched paths share one series), from the first byte received to
+    the last byte sent, and hands requests to `profiler` for sampling.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler | None = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            if self.profiler is not None and self.profiler.rate > 0:
+                with self.profiler.request():
+                    await self.app(scope, receive, send_with_status)
+            else:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+from agents.answer_cache import AnswerCache, normalize_question
+
+# Case, whitespace and punctuation do not change the key
+print(normalize_question("  What is   Java? "), "|", normalize_question("what is java"))
+assert normalize_question("  What is   Java? ") == normalize_question("what is java")
+
+cache = AnswerCache(max_entries=2, ttl=60)
+upstream_calls = 0
+
+
+async def generate(question):
+    global upstream_calls
+    upstream_calls += 1
+    await asyncio.sleep(0.05)
+    return f"Answer to {question}"
+
+
+async def burst():
+    # 10 concurrent spellings of the same question
+    return await asyncio.gather(*(
+        cache.get_or_compute_async(q, lambda q=q: generate(q))
+        for q in ["What is Hadoop?", "what is hadoop", "WHAT IS HADOOP!"] * 3 + ["what is hadoop"]
+    ))
+
+
+answers = asyncio.run(burst())
+print("Upstream calls for 10 concurrent questions:", upstream_calls)
+assert upstream_calls == 1
+assert len(set(answers)) == 1
+
+# LRU eviction and counters
+cache.get_or_compute("What is Java?", lambda: "java")
+cache.get_or_compute("What is Python?", lambda: "python")
+cache.get_or_compute("what is java", lambda: "recomputed")
+stats = cache.snapshot()
+print("Stats:", stats)
+assert stats["coalesced"] == 9
+assert stats["misses"] == 3 and stats["hits"] == 1
+assert stats["evictions"] == 1 and stats["entries"] == 2
+
+# Expired entries are recomputed
+short = AnswerCache(ttl=0.01)
+short.get_or_compute("q", lambda: "first")
+time.sleep(0.02)
+assert short.get_or_compute("q", lambda: "second") == "second"
+assert short.snapshot()["expirations"] == 1
+
+
+# Persistent tier answers after the memory tier is lost
+class DictStore:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, answer, ttl):
+        self.data[key] = answer
+
+
+store = DictStore()
+AnswerCache(store=store).get_or_compute("What is Spark?", lambda: "spark")
+restarted = AnswerCache(store=store)
+assert restarted.get_or_compute("what is spark", lambda: "recomputed") == "spark"
+print("Persistent hits after restart:", restarted.snapshot()["persistent_hits"])
+
+# Sync and async callers share one flight, whichever of them leads
+mixed = AnswerCache()
+mixed_calls = 0
+started = threading.Event()
+
+
+def slow_sync():
+    global mixed_calls
+    mixed_calls += 1
+    started.set()
+    time.sleep(0.1)
+    return "from sync"
+
+
+async def sync_leads():
+    thread = threading.Thread(target=mixed.get_or_compute, args=("What is Kafka?", slow_sync))
+    thread.start()
+    await asyncio.to_thread(started.wait)
+    answer = await mixed.get_or_compute_async("what is kafka", lambda: generate("kafka"))
+    thread.join()
+    return answer
+
+
+assert asyncio.run(sync_leads()) == "from sync"
+
+
+async def async_leads():
+    async def slow_async():
+        global mixed_calls
+        mixed_calls += 1
+        started.set()
+        await asyncio.sleep(0.1)
+        return "from async"
+
+    started.clear()
+    leader = asyncio.create_task(mixed.get_or_compute_async("What is Flink?", slow_async))
+    await asyncio.to_thread(started.wait)
+    follower = asyncio.to_thread(mixed.get_or_compute, "what is flink", lambda: "recomputed")
+    return await asyncio.gather(leader, follower)
+
+
+assert asyncio.run(async_leads()) == ["from async", "from async"]
+print("Upstream calls for mixed sync/async callers:", mixed_calls)
+assert mixed_calls == 2 and mixed.snapshot()["coalesced"] == 2
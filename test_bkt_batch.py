@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+
+# Build a shuffled attempt stream with an explicit ordering column
+random.seed(7)
+students = [f"student_{i:03d}" for i in range(20)]
+skills = ["linear_equations", "fractions", "geometry"]
+
+attempts = []
+for t in range(500):
+    attempts.append((random.choice(students), random.choice(skills), random.random() < 0.6, t))
+random.shuffle(attempts)
+
+for dtype in (np.float64, np.float32):
+    # Scalar path: one update_skill call per attempt, in order
+    scalar = BKTEngine(dtype=dtype)
+    expected = {}
+    for student_id, skill_id, is_correct, t in sorted(attempts, key=lambda a: a[3]):
+        scalar.update_skill(student_id, skill_id, is_correct)
+        expected[t] = scalar.knowledge_state[(student_id, skill_id)]
+
+    # Batch path: columnar arrays in shuffled order
+    batch = BKTEngine(dtype=dtype)
+    student_ids, skill_ids, correct, order = zip(*attempts)
+    result = batch.update_batch(student_ids, skill_ids, correct, order=order)
+
+    mismatches = sum(1 for r, t in zip(result.tolist(), order) if r != expected[t])
+
+    print("\nStore dtype:", np.dtype(dtype).name)
+    print("Attempts replayed:", len(attempts))
+    print("Per-attempt mismatches:", mismatches)
+    print("Final states equal:", batch.knowledge_state == scalar.knowledge_state)
+
+    assert mismatches == 0
+    assert batch.knowledge_state == scalar.knowledge_state
@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+
+from agents.bkt_agent import BKTEngine
+
+# Switch threads as often as possible to surface lost updates
+sys.setswitchinterval(1e-6)
+
+n_threads = 8
+students_per_thread = 500
+attempts = [True, False, True]
+n_shared = 200
+shared_updates = 2  # per thread and shared pair; stays below BKT convergence
+
+# Few shards so threads contend on the same locks and array growth
+bkt = BKTEngine(n_shards=4)
+
+# Sequential reference values
+reference = BKTEngine()
+for is_correct in attempts:
+    reference.update_skill("reference", "fractions", is_correct)
+expected_own = reference.get_mastery("reference", "fractions")
+
+for _ in range(n_threads * shared_updates):
+    reference.update_skill("shared", "fractions", True)
+expected_shared = reference.get_mastery("shared", "fractions")
+
+barrier = threading.Barrier(n_threads)
+
+
+def worker(thread_id):
+    barrier.wait()
+    for i in range(students_per_thread):
+        student_id = f"student_{thread_id:02d}_{i:04d}"
+        if i < n_shared * shared_updates:
+            # Contended pairs updated by every thread
+            bkt.update_skill(f"shared_{i % n_shared:03d}", "fractions", True)
+        # New students force concurrent interning and array growth
+        for is_correct in attempts:
+            bkt.update_skill(student_id, "fractions", is_correct)
+
+
+threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+lost = [
+    (student_id, skill_id)
+    for (student_id, skill_id), mastery in bkt.knowledge_state.items()
+    if mastery != (expected_shared if student_id.startswith("shared_") else expected_own)
+]
+
+print("Threads:", n_threads, "| students per thread:", students_per_thread)
+print("Tracked pairs:", len(bkt.knowledge_state))
+print("Pairs with lost updates:", len(lost))
+
+assert len(bkt.knowledge_state) == n_threads * students_per_thread + n_shared
+assert not lost
+
+# States queued by on_change, under the shard lock, arrive in the order
+# they were applied: each one is a BKT step from the one before, and the
+# last one queued for a pair is its current state
+from database.memory_storage import MemoryStorage
+from database.models import bkt_state_document
+from database.write_behind import WriteBehindWriter
+
+writer = WriteBehindWriter(MemoryStorage(), max_batch=10 ** 9)
+sequences = {}
+
+
+def enqueue_state(student_id, skill_id, mastery):
+    # Yield mid-hook, so other threads run between update and enqueue
+    time.sleep(0)
+    writer.enqueue_state(bkt_state_document(student_id, skill_id, mastery))
+    sequences.setdefault(student_id, []).append(mastery)
+
+
+queued = BKTEngine(n_shards=4, on_change=enqueue_state)
+n_pairs = 20
+
+
+def contend(thread_id):
+    barrier.wait()
+    for i in range(500):
+        queued.update_skill(f"pair_{i % n_pairs:02d}", "fractions", (i + thread_id) % 3 != 0)
+
+
+threads = [threading.Thread(target=contend, args=(i,)) for i in range(n_threads)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+
+def is_bkt_step(previous, mastery):
+    return any(abs(float(reference.step(previous, c)) - mastery) < 1e-12 for c in (True, False))
+
+
+reordered = 0
+for student_id, sequence in sequences.items():
+    previous = queued.p_init
+    for mastery in sequence:
+        reordered += not is_bkt_step(previous, mastery)
+        previous = mastery
+    assert writer.pending_states(student_id) == {"fractions": queued.get_mastery(student_id, "fractions")}
+print("Queued states out of update order:", reordered)
+assert len(sequences) == n_pairs and not reordered
@@ -0,0 +1,47 @@
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+from agents.bkt_fit import fit_params, simulate
+
+true_params = {
+    "easy_skill": (0.6, 0.25, 0.25, 0.05),
+    "hard_skill": (0.1, 0.05, 0.10, 0.15),
+}
+student_ids, skill_ids, is_correct = simulate(true_params, n_students=3000, mean_length=6)
+
+params = fit_params(student_ids, skill_ids, is_correct, workers=2)
+
+for skill_id, fitted in params.items():
+    print(skill_id, fitted)
+    for name, value in zip(["p_init", "p_learn", "p_guess", "p_slip"], true_params[skill_id]):
+        assert abs(fitted[name] - value) < 0.05, (skill_id, name, fitted[name], value)
+
+# Skills below min_attempts keep the defaults
+assert fit_params(["s1", "s2"], ["rare", "rare"], [True, False]) == {}
+
+# The engine applies the fitted parameters per skill
+engine = BKTEngine(params=params)
+assert engine.initialize_skill("s1", "easy_skill")["mastery"] == params["easy_skill"]["p_init"]
+assert engine.initialize_skill("s1", "other_skill")["mastery"] == engine.p_init
+
+easy = engine.update_skill("s2", "easy_skill", True)["mastery"]
+hard = engine.update_skill("s2", "hard_skill", True)["mastery"]
+print("Mastery after one correct answer: easy", easy, "| hard", hard)
+assert easy > hard
+
+# Batch replay with per-skill parameters matches the per-call path
+rng = np.random.default_rng(0)
+n = 5000
+students = np.char.add("student_", rng.integers(0, 200, n).astype(str))
+skills = np.array(["easy_skill", "hard_skill", "other_skill"])[rng.integers(0, 3, n)]
+correct = rng.random(n) < 0.6
+
+loop_engine = BKTEngine(params=params)
+for s, k, c in zip(students.tolist(), skills.tolist(), correct.tolist()):
+    loop_engine.update_skill(s, k, c)
+
+batch_engine = BKTEngine(params=params)
+batch_engine.update_batch(students, skills, correct)
+
+print("Batch == per-call:", loop_engine.knowledge_state == batch_engine.knowledge_state)
+assert loop_engine.knowledge_state == batch_engine.knowledge_state
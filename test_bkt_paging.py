@@ -0,0 +1,36 @@
+from agents.bkt_agent import BKTEngine
+
+# Stand-in for the bkt_states collection: (student_id, skill_id) -> mastery
+persisted = {("student_001", "fractions"): 0.65}
+
+
+def loader(student_id):
+    return {
+        skill_id: mastery
+        for (sid, skill_id), mastery in persisted.items()
+        if sid == student_id
+    }
+
+
+# One shard so the LRU bound is exact
+bkt = BKTEngine(loader=loader, max_students=2, n_shards=1)
+
+# Warm start: persisted mastery is available before any new attempt
+print("Warm-started mastery:", bkt.get_mastery("student_001", "fractions"))
+assert bkt.get_mastery("student_001", "fractions") == 0.65
+
+update = bkt.update_skill("student_001", "fractions", True)
+persisted[("student_001", "fractions")] = bkt.get_mastery("student_001", "fractions")
+print("After attempt:", update["mastery"])
+
+# Touching two more students evicts the least recently used one
+bkt.update_skill("student_002", "fractions", False)
+bkt.update_skill("student_003", "fractions", True)
+print("Resident students:", list(bkt._resident[0]))
+print("Tracked pairs:", len(bkt.knowledge_state))
+assert "student_001" not in bkt._resident[0]
+assert len(bkt.knowledge_state) == 2
+
+# Paging the evicted student back in restores its latest state
+print("Re-paged mastery:", round(bkt.get_mastery("student_001", "fractions"), 4))
+assert bkt.get_mastery("student_001", "fractions") == persisted[("student_001", "fractions")]
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import tempfile
+
+# The app against the in-memory storage backend, offline LLM
+workdir = tempfile.mkdtemp()
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RL_SNAPSHOT_PATH"] = os.path.join(workdir, "rl_q_tables.npz")
+os.environ["BKT_PARAMS_PATH"] = os.path.join(workdir, "bkt_params.json")
+os.environ["STATE_DIR"] = os.path.join(workdir, "state")
+os.environ.pop("HF_API_KEY", None)
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from agents.bkt_agent import BKTEngine
+
+# Small chunks so one upload spans several bulk writes
+app_module.BULK_CHUNK_LINES = 4
+
+
+class CountingStorage:
+    """Counts the bulk calls that reach the storage."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.state_writes = 0
+        self.attempt_writes = 0
+
+    def save_bkt_states(self, docs):
+        self.state_writes += 1
+        self.storage.save_bkt_states(docs)
+
+    def insert_attempts(self, docs):
+        self.attempt_writes += 1
+        self.storage.insert_attempts(docs)
+
+
+counting = CountingStorage(app_module.storage)
+app_module.bkt_writer.storage = counting
+
+attempts = [
+    {"student_id": "student_001", "skill_id": "fractions", "is_correct": True},
+    {"student_id": "student_002", "skill_id": "fractions", "is_correct": False},
+    {"student_id": "student_001", "skill_id": "fractions", "is_correct": False},
+    {"student_id": "student_001", "skill_id": "decimals", "is_correct": True},
+    {"student_id": "student_001", "skill_id": "fractions", "is_correct": True},
+    {"student_id": "student_002", "skill_id": "fractions", "is_correct": True,
+     "timestamp": "2026-01-01T12:00:00+02:00"},
+]
+lines = [json.dumps(a) for a in attempts]
+# A blank line, malformed JSON and a missing field among the attempts
+lines[2:2] = ["", "{not json", json.dumps({"student_id": "student_003", "skill_id": "fractions"})]
+body = ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def stream_body():
+    # Uploaded in uneven pieces that split lines
+    for i in range(0, len(body), 7):
+        yield body[i:i + 7]
+
+
+with TestClient(app_module.app) as client:
+    response = client.post("/bkt/attempts/bulk", content=stream_body())
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+for event in events:
+    print(event)
+
+statuses, summary = events[:-1], events[-1]
+assert summary == {"done": True, "lines": 9, "ok": 6, "queued": 0, "error": 2}
+assert [s["line"] for s in statuses] == [1, 2, 4, 5, 6, 7, 8, 9]
+assert statuses[2]["status"] == "error" and "JSON" in statuses[2]["error"]
+assert statuses[3]["status"] == "error" and statuses[3]["error"].startswith("is_correct")
+
+# Same masteries as one /bkt/update per attempt, in order
+reference = BKTEngine()
+expected = [reference.update_skill(a["student_id"], a["skill_id"], a["is_correct"])["mastery"] for a in attempts]
+got = [s["mastery"] for s in statuses if s["status"] == "ok"]
+print("Masteries:", got)
+assert got == expected
+
+# 8 non-blank lines in chunks of 4: one state and one attempt write each
+print("Bulk writes:", counting.state_writes, counting.attempt_writes)
+assert counting.state_writes == counting.attempt_writes == 2
+
+storage = app_module.storage
+assert storage.load_bkt_states("student_001") == {
+    "fractions": reference.get_mastery("student_001", "fractions"),
+    "decimals": reference.get_mastery("student_001", "decimals"),
+}
+persisted = list(storage.iter_attempts())
+assert len(persisted) == 6
+assert [a[2] for a in persisted if a[:2] == ("student_001", "fractions")] == [True, False, True]
+
+# Oversized lines are reported and skipped without buffering them
+app_module.BULK_MAX_LINE_BYTES = 128
+long_line = json.dumps({"student_id": "x" * 200, "skill_id": "fractions", "is_correct": True})
+body = (long_line + "\n" + json.dumps(attempts[0])).encode("utf-8")
+with TestClient(app_module.app) as client:
+    events = [json.loads(line) for line in client.post("/bkt/attempts/bulk", content=body).text.splitlines()]
+print("Oversized:", events)
+assert events[0]["status"] == "error" and events[0]["line"] == 1
+assert events[1]["status"] == "ok" and events[1]["line"] == 2
+
+# While a bulk write is in flight, the new states are what a lookup sees,
+# even for students evicted meanwhile (paged in from the write-behind
+# writer, not from the older storage)
+class CheckingStorage(CountingStorage):
+    def save_bkt_states(self, docs):
+        for doc in docs:
+            self.seen.append(app_module.bkt_engine.get_mastery(doc["student_id"], doc["skill_id"]) == doc["mastery"])
+        super().save_bkt_states(docs)
+
+
+checking = CheckingStorage(storage)
+checking.seen = []
+app_module.bkt_writer.storage = checking
+app_module.bkt_engine.max_students = 1
+body = "\n".join(
+    json.dumps({"student_id": f"student_{i:03d}", "skill_id": "fractions", "is_correct": False})
+    for i in range(100, 140)
+).encode("utf-8")
+app_module.BULK_CHUNK_LINES = 40
+with TestClient(app_module.app) as client:
+    events = [json.loads(line) for line in client.post("/bkt/attempts/bulk", content=body).text.splitlines()]
+print("Seen during write:", sum(checking.seen), "of", len(checking.seen))
+assert events[-1]["ok"] == 40
+assert len(checking.seen) == 40 and all(checking.seen)
+
+
+# A failed bulk write leaves the states buffered, still visible to paging
+class FailingStorage(CountingStorage):
+    def save_bkt_states(self, docs):
+        raise ConnectionError("storage down")
+
+
+app_module.bkt_writer.storage = FailingStorage(storage)
+body = json.dumps({"student_id": "student_200", "skill_id": "fractions", "is_correct": True}).encode("utf-8")
+with TestClient(app_module.app) as client:
+    events = [json.loads(line) for line in client.post("/bkt/attempts/bulk", content=body).text.splitlines()]
+print("Failed write:", events)
+assert events[0]["status"] == "queued"
+pending = app_module.bkt_writer.pending_states("student_200")
+assert round(pending["fractions"], 4) == events[0]["mastery"]
+
+# Within a chunk, a pair's attempts are applied in timestamp order, and
+# the state written is that after the latest one
+app_module.bkt_writer.storage = storage
+app_module.BULK_CHUNK_LINES = 4
+late = {"student_id": "student_300", "skill_id": "fractions", "is_correct": False,
+        "timestamp": "2026-01-01T10:00:00"}
+early = {"student_id": "student_300", "skill_id": "fractions", "is_correct": True,
+         "timestamp": "2026-01-01T09:00:00"}
+body = (json.dumps(late) + "\n" + json.dumps(early)).encode("utf-8")
+with TestClient(app_module.app) as client:
+    events = [json.loads(line) for line in client.post("/bkt/attempts/bulk", content=body).text.splitlines()]
+print("Out of order:", events)
+reference = BKTEngine()
+after_early = reference.update_skill("student_300", "fractions", True)["mastery"]
+after_late = reference.update_skill("student_300", "fractions", False)["mastery"]
+assert [events[0]["mastery"], events[1]["mastery"]] == [after_late, after_early]
+assert storage.load_bkt_states("student_300") == {"fractions": reference.get_mastery("student_300", "fractions")}
+
+# Statuses are streamed as each chunk is processed: the first chunk's
+# are sent before the rest of the upload is read
+pieces = [
+    "".join(json.dumps({"student_id": f"student_4{i:02d}", "skill_id": "fractions", "is_correct": True}) + "\n"
+            for i in range(start, start + 4)).encode("utf-8")
+    for start in (0, 4)
+]
+scope = {
+    "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+    "method": "POST", "scheme": "http", "path": "/bkt/attempts/bulk", "raw_path": b"/bkt/attempts/bulk",
+    "root_path": "", "query_string": b"", "headers": [(b"content-type", b"application/x-ndjson")],
+    "client": ("testclient", 50000), "server": ("testserver", 80),
+}
+
+
+async def upload_in_two_pieces():
+    sent = []
+    sent_before_last_piece = []
+
+    async def receive():
+        if not pieces:
+            await asyncio.Event().wait()
+        if len(pieces) == 1:
+            sent_before_last_piece.extend(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+        body = pieces.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(pieces)}
+
+    async def send(message):
+        sent.append(message)
+
+    await app_module.app(scope, receive, send)
+    return sent, b"".join(sent_before_last_piece)
+
+
+with TestClient(app_module.app):
+    sent, early_bytes = asyncio.run(upload_in_two_pieces())
+early_events = [json.loads(line) for line in early_bytes.decode("utf-8").splitlines()]
+events = [json.loads(line) for m in sent if m["type"] == "http.response.body"
+          for line in m.get("body", b"").decode("utf-8").splitlines()]
+print("Sent before the last piece was read:", [e["line"] for e in early_events])
+assert [e["line"] for e in early_events] == [1, 2, 3, 4]
+assert events[-1] == {"done": True, "lines": 8, "ok": 8, "queued": 0, "error": 0}
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from agents.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from agents.student_query_agent import StudentQueryAgent, UNAVAILABLE_ANSWER
+from benchmarks.stub_llm_server import StubLLMServer
+
+server = StubLLMServer(delay=0.0, status=503).start()
+
+breaker = CircuitBreaker(failure_threshold=3, slow_call_seconds=0.2, reset_timeout=0.3)
+agent = StudentQueryAgent(api_key="test-key", api_url=server.url, breaker=breaker)
+
+# Failures answer "unavailable" until the circuit opens
+for _ in range(3):
+    assert agent.answer_question("student_001", "What is Java?")["answer"] == UNAVAILABLE_ANSWER
+print("State after 3 failures:", breaker.state)
+assert breaker.state == OPEN
+
+# While open, the rule-based fallback is served without calling upstream
+requests_before = server.requests
+start = time.perf_counter()
+answer = agent.answer_question("student_001", "What is Java?")["answer"]
+elapsed = time.perf_counter() - start
+print(f"Open-circuit answer in {elapsed * 1000:.1f} ms:", answer.split("\n")[0])
+assert answer == agent._fallback_answer("What is Java?")
+assert server.requests == requests_before
+
+# After the reset timeout one probe goes through and closes the circuit
+server.status = 200
+time.sleep(0.35)
+assert breaker.state == HALF_OPEN
+answer = asyncio.run(agent.answer_question_async("student_001", "What is Java?"))["answer"]
+print("Probe answer:", answer, "| state:", breaker.state)
+assert answer == "Stub answer to: What is Java?"
+assert breaker.state == CLOSED
+
+# Slow calls count as failures
+server.delay = 0.25
+for _ in range(3):
+    agent.answer_question("student_001", "What is Hadoop?")
+print("State after 3 slow calls:", breaker.state, breaker.snapshot())
+assert breaker.state == OPEN
+
+server.stop()
@@ -0,0 +1,51 @@
+import math
+from datetime import datetime, timedelta
+
+from database.curves import downsample_points, lttb
+
+start = datetime(2026, 1, 1)
+
+# A noisy learning curve: 1000 points, one a minute, with a dip and a spike
+points = [
+    {"timestamp": start + timedelta(minutes=i), "mastery": 0.2 + 0.6 * i / 999 + 0.05 * math.sin(i / 7)}
+    for i in range(1000)
+]
+points[400]["mastery"] = 0.0
+points[700]["mastery"] = 1.0
+
+
+def check(curve, max_points):
+    timestamps = [p["timestamp"] for p in curve]
+    assert len(curve) <= max_points
+    assert timestamps == sorted(timestamps)
+    assert all(p in points for p in curve)
+
+
+# LTTB: exactly max_points points, endpoints and extrema kept
+for max_points in (2, 3, 4, 10, 100, 999):
+    curve = lttb(points, max_points)
+    check(curve, max_points)
+    assert len(curve) == max_points
+    assert curve[0] is points[0] and curve[-1] is points[-1]
+    if max_points >= 10:
+        assert points[400] in curve and points[700] in curve
+print("LTTB sizes OK")
+
+assert lttb(points, 1000) == points
+assert lttb(points, 5000) == points
+assert lttb(points[:1], 2) == points[:1]
+
+# Bucket min/max: at most max_points points, extrema kept
+for max_points in (2, 3, 10, 100):
+    curve = downsample_points(points, max_points=max_points)
+    check(curve, max_points)
+    assert points[400] in curve and points[700] in curve
+print("Min/max sizes OK")
+
+# Fixed buckets, capped with LTTB
+curve = downsample_points(points, bucket_seconds=600)
+check(curve, 200)
+assert points[400] in curve and points[700] in curve
+capped = downsample_points(points, max_points=2, bucket_seconds=600)
+assert capped == [curve[0], curve[-1]]
+print("Buckets:", len(curve), "capped:", len(capped))
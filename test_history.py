@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# The app against the in-memory storage backend, offline LLM
+workdir = tempfile.mkdtemp()
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RL_SNAPSHOT_PATH"] = os.path.join(workdir, "rl_q_tables.npz")
+os.environ["BKT_PARAMS_PATH"] = os.path.join(workdir, "bkt_params.json")
+os.environ["STATE_DIR"] = os.path.join(workdir, "state")
+os.environ.pop("HF_API_KEY", None)
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from database.memory_storage import MemoryStorage
+from database.sqlite_storage import SQLiteStorage
+
+start = datetime(2026, 1, 1)
+
+# 50 records in runs of 5 that share a timestamp, inserted out of order,
+# plus another student's and another skill's
+records = []
+for i in range(50):
+    records.append({
+        "student_id": "student_001",
+        "skill_id": "fractions",
+        "question": f"Question {i}",
+        "answer": {"answer": "..."},
+        "is_correct": i % 2 == 0,
+        "mastery": {"mastery": i / 50},
+        "quiz_action": "MEDIUM",
+        "timestamp": start + timedelta(minutes=i // 5),
+    })
+others = [
+    {**records[0], "student_id": "student_002", "question": "Other student"},
+    {**records[0], "skill_id": "decimals", "question": "Other skill"},
+]
+
+
+def fetch_pages(client, limit, **params):
+    # Every page, following next_cursor
+    pages, cursor = [], None
+    while True:
+        query = {"student_id": "student_001", "skill_id": "fractions", "limit": limit, **params}
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/history", params=query)
+        assert response.status_code == 200
+        page = response.json()
+        assert page["count"] == len(page["history"]) <= limit
+        pages.append(page["history"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def check(storage):
+    print(f"--- {storage.name} ---")
+    app_module.storage = storage
+    for record in records[1::2] + records[::2] + others:
+        storage.insert_history(dict(record))
+
+    with TestClient(app_module.app) as client:
+        # Whole history as one page: time order, ties in a fixed order
+        whole = fetch_pages(client, 1000)[0]
+        questions = [r["question"] for r in whole]
+        timestamps = [r["timestamp"] for r in whole]
+        assert sorted(questions) == sorted(r["question"] for r in records)
+        assert timestamps == sorted(timestamps)
+        assert fetch_pages(client, 1000)[0] == whole
+
+        # Any page size, even one splitting a run of tied timestamps, gives
+        # the same records: no duplicates, no gaps
+        for limit in (1, 3, 5, 7, 50):
+            pages = fetch_pages(client, limit)
+            assert [r["question"] for page in pages for r in page] == questions
+            assert all(len(page) == limit for page in pages[:-1])
+        print("Pages of 7:", len(fetch_pages(client, 7)))
+
+        # Projection keeps the requested fields and the timestamp
+        page = fetch_pages(client, 1000, fields="quiz_action,mastery.mastery")[0]
+        assert set(page[0]) == {"quiz_action", "mastery", "timestamp"}
+
+        # NDJSON: the same records, from a cursor on
+        response = client.get("/history", params={
+            "student_id": "student_001", "skill_id": "fractions", "stream": "true"
+        })
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines == whole
+
+        first = client.get("/history", params={
+            "student_id": "student_001", "skill_id": "fractions", "limit": 12
+        }).json()
+        response = client.get("/history", params={
+            "student_id": "student_001", "skill_id": "fractions", "stream": "true",
+            "cursor": first["next_cursor"], "limit": 10
+        })
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["question"] for r in lines] == questions[12:22]
+
+        # Malformed cursor
+        response = client.get("/history", params={"student_id": "student_001", "cursor": "nope"})
+        assert response.status_code == 400
+
+
+app_storage = app_module.storage
+try:
+    check(MemoryStorage())
+    check(SQLiteStorage(":memory:"))
+finally:
+    app_module.storage = app_storage
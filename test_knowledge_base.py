@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+
+from agents.knowledge_base import INDEX_SUFFIX, KnowledgeBase
+from agents.student_query_agent import StudentQueryAgent
+
+kb = KnowledgeBase.from_file("agents/knowledge_base.json")
+
+print("Java:", kb.match("What is Java?"))
+print("Hadoop:", kb.match("how does HDFS store blocks"))
+print("Spark over Hadoop:", kb.match("Is Apache Spark faster than Hadoop MapReduce?"))
+
+assert kb.match("What is Java?")[0] == "Java"
+assert kb.match("how does HDFS store blocks")[0] == "Hadoop"
+assert kb.match("Explain machine learning")[0] == "Machine Learning"
+assert kb.match("Tell me something") is None
+assert kb.answer("Tell me something") == kb.default_answer
+
+# The agent's offline path answers from the knowledge base
+agent = StudentQueryAgent(api_key="", knowledge_base=kb)
+answer = agent.answer_question("student_001", "What is Hadoop?")["answer"]
+assert answer.startswith("Hadoop is an open-source Big Data framework")
+
+# The compiled index is written, reused, and rebuilt when the source changes
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "kb.json")
+    topics = [{"topic": "Rust", "keywords": ["borrow checker"], "answer": "Rust answer"}]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"default_answer": "?", "topics": topics}, f)
+
+    assert KnowledgeBase.load(path).answer("what is the borrow checker") == "Rust answer"
+    assert os.path.exists(path + INDEX_SUFFIX)
+    assert KnowledgeBase.load(path).answer("what is the borrow checker") == "Rust answer"
+
+    topics.append({"topic": "Go", "keywords": ["goroutine"], "answer": "Go answer"})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"default_answer": "?", "topics": topics}, f, indent=2)
+
+    reloaded = KnowledgeBase.load(path)
+    print("Rebuilt index topics:", reloaded.topics)
+    assert reloaded.answer("what is a goroutine") == "Go answer"
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import tempfile
+import time
+
+# The app against the in-memory storage backend, offline LLM
+workdir = tempfile.mkdtemp()
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RL_SNAPSHOT_PATH"] = os.path.join(workdir, "rl_q_tables.npz")
+os.environ["BKT_PARAMS_PATH"] = os.path.join(workdir, "bkt_params.json")
+os.environ["STATE_DIR"] = os.path.join(workdir, "state")
+os.environ.pop("HF_API_KEY", None)
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from agents.bkt_agent import BKTEngine
+
+# One resident student per shard, so other students evict alice
+app_module.bkt_engine.max_students = 1
+
+reference = BKTEngine()
+
+with TestClient(app_module.app) as client:
+    for is_correct in (True, True, True):
+        response = client.post("/learn", json={
+            "student_id": "alice",
+            "skill_id": "fractions",
+            "question": "What is a fraction?",
+            "is_correct": is_correct,
+        })
+        assert response.status_code == 200
+        reference.update_skill("alice", "fractions", is_correct)
+
+    expected = reference.get_mastery("alice", "fractions")
+    print("Mastery after /learn:", expected)
+
+    for i in range(200):
+        client.post("/bkt/update", json={"student_id": f"student_{i}", "skill_id": "fractions", "is_correct": True})
+    assert "alice" not in app_module.bkt_engine._resident[app_module.bkt_engine.knowledge_state.shard_index("alice")]
+
+    # Paged back in from the write-behind buffer or storage
+    mastery = client.get("/bkt/mastery", params={"student_id": "alice", "skill_id": "fractions"}).json()
+    print("Mastery after eviction:", mastery)
+    assert abs(mastery["mastery"] - expected) < 1e-4
+
+# The LLM answer and the assessment run concurrently: with each stubbed to
+# take DELAY seconds, a request takes about DELAY, not the sum
+DELAY = 0.5
+controller = app_module.controller
+handle_query, assess_response = controller.handle_student_query_async, controller.assess_response
+
+
+async def slow_query(student_id, question):
+    await asyncio.sleep(DELAY)
+    return {"student_id": student_id, "question": question, "answer": "stub"}
+
+
+def slow_assess(*args, **kwargs):
+    time.sleep(DELAY)
+    return assess_response(*args, **kwargs)
+
+
+async def failing_query(student_id, question):
+    await asyncio.sleep(0)
+    raise RuntimeError("LLM down")
+
+
+def failing_assess(*args, **kwargs):
+    raise RuntimeError("storage down")
+
+
+learn_request = {"student_id": "bob", "skill_id": "fractions", "question": "Why?", "is_correct": True}
+
+controller.handle_student_query_async, controller.assess_response = slow_query, slow_assess
+with TestClient(app_module.app) as client:
+    started = time.perf_counter()
+    response = client.post("/learn", json=learn_request)
+    elapsed = time.perf_counter() - started
+print("Two stages of %.1fs each took %.2fs" % (DELAY, elapsed), response.json()["timings"])
+assert response.status_code == 200
+assert response.json()["query"]["answer"] == "stub"
+assert DELAY <= elapsed < 1.5 * DELAY
+
+# A failure in either branch gives the usual error response, without
+# waiting on the other branch for long
+for query, assess in ((failing_query, slow_assess), (slow_query, failing_assess)):
+    controller.handle_student_query_async, controller.assess_response = query, assess
+    with TestClient(app_module.app, raise_server_exceptions=False) as client:
+        started = time.perf_counter()
+        response = client.post("/learn", json=learn_request)
+        elapsed = time.perf_counter() - started
+    print("Failed branch:", response.status_code, "after %.2fs" % elapsed)
+    assert response.status_code == 500
+    assert elapsed < 2 * DELAY
+
+controller.handle_student_query_async, controller.assess_response = handle_query, assess_response
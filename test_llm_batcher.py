@@ -0,0 +1,57 @@
+import asyncio
+
+from agents.llm_batcher import MicroBatcher
+from agents.student_query_agent import StudentQueryAgent, UNAVAILABLE_ANSWER
+from benchmarks.stub_llm_server import StubLLMServer
+
+server = StubLLMServer(delay=0.02).start()
+
+agent = StudentQueryAgent(
+    api_key="test-key", api_url=server.url, batch_size=8, batch_wait_ms=20
+)
+questions = [f"What is topic {i}?" for i in range(20)]
+
+
+async def ask_all(agent):
+    results = await asyncio.gather(*(
+        agent.answer_question_async("student_001", q) for q in questions
+    ))
+    await agent.aclose()
+    return results
+
+
+results = asyncio.run(ask_all(agent))
+
+print("Answers routed correctly:", all(
+    r["answer"] == f"Stub answer to: {q}" for r, q in zip(results, questions)
+))
+print("Upstream requests:", server.requests, "| inputs:", server.inputs)
+
+assert all(r["answer"] == f"Stub answer to: {q}" for r, q in zip(results, questions))
+assert server.requests == 3
+assert server.inputs == 20
+
+# A failed batch degrades every caller in it
+server.status = 503
+results = asyncio.run(ask_all(agent))
+print("Failed batch answers:", {r["answer"] for r in results})
+assert all(r["answer"] == UNAVAILABLE_ANSWER for r in results)
+
+server.stop()
+
+
+# A result count mismatch is an error, not a misrouted answer
+async def short_batch(items):
+    return items[:-1]
+
+
+async def submit_pair():
+    batcher = MicroBatcher(short_batch, max_batch_size=2)
+    return await asyncio.gather(
+        batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+    )
+
+
+outcomes = asyncio.run(submit_pair())
+print("Mismatched batch:", outcomes)
+assert all(isinstance(o, ValueError) for o in outcomes)
@@ -0,0 +1,101 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import (
+    AGENT_LATENCY,
+    HTTP_LATENCY,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsMiddleware,
+    Registry,
+    SamplingProfiler,
+    profiled,
+    timed,
+)
+
+# Exposition format: cumulative buckets, sum and count per label set
+registry = Registry()
+latency = Histogram("op_seconds", "Op latency.", ["op"], buckets=(0.01, 0.1), registry=registry)
+errors = Counter("op_errors_total", "Op errors.", ["op"], registry=registry)
+size = Gauge("op_entries", "Entries.", ["store"], registry=registry)
+
+for value in (0.005, 0.05, 0.5):
+    latency.labels("read").observe(value)
+errors.labels('we"ird').inc(2)
+size.labels("cache").set_function(lambda: 42)
+
+text = registry.render()
+print(text)
+assert '# TYPE op_seconds histogram' in text
+assert 'op_seconds_bucket{op="read",le="0.01"} 1' in text
+assert 'op_seconds_bucket{op="read",le="0.1"} 2' in text
+assert 'op_seconds_bucket{op="read",le="+Inf"} 3' in text
+assert 'op_seconds_count{op="read"} 3' in text
+assert 'op_errors_total{op="we\\"ird"} 2.0' in text
+assert 'op_entries{store="cache"} 42' in text
+
+
+# timed() records sync and async calls
+@timed("test", "sync_call")
+def sync_call():
+    return 1
+
+
+@timed("test", "async_call")
+async def async_call():
+    await asyncio.sleep(0.01)
+    return 2
+
+
+assert sync_call() == 1 and asyncio.run(async_call()) == 2
+assert sum(AGENT_LATENCY.labels("test", "sync_call").counts) == 1
+assert AGENT_LATENCY.labels("test", "async_call").sum >= 0.01
+
+# Middleware: per-route series, and profiles of sampled requests,
+# including sync endpoints' worker threads
+app = FastAPI()
+profiler = SamplingProfiler(rate=0.0)
+app.add_middleware(MetricsMiddleware, profiler=profiler)
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+@app.get("/items/{item_id}")
+@profiled
+def get_item(item_id: int):
+    return {"item_id": item_id, "work": busy_work()}
+
+
+client = TestClient(app)
+for i in range(3):
+    assert client.get(f"/items/{i}").json()["item_id"] == i
+assert client.get("/items/x").status_code == 422
+assert client.get("/missing").status_code == 404
+
+route_counts = {
+    values: sum(child.counts)
+    for values, child in HTTP_LATENCY._children.items()
+    if values[1] in ("/items/{item_id}", "unmatched")
+}
+print("Route series:", route_counts)
+assert route_counts[("GET", "/items/{item_id}", "200")] == 3
+assert route_counts[("GET", "/items/{item_id}", "422")] == 1
+assert route_counts[("GET", "unmatched", "404")] == 1
+
+# Disabled: nothing captured
+assert profiler.captured == 0
+
+profiler.rate = 1.0
+client.get("/items/7")
+report = profiler.report(limit=50)
+print("Captures:", profiler.snapshot())
+assert profiler.captured >= 1
+assert "busy_work" in report
+
+profiler.reset()
+assert profiler.snapshot()["captured_requests"] == 0
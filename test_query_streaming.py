@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from agents.answer_cache import AnswerCache
+from agents.student_query_agent import StudentQueryAgent, UNAVAILABLE_ANSWER
+from benchmarks.stub_llm_server import StubLLMServer
+
+server = StubLLMServer(delay=0.0, token_delay=0.05).start()
+
+cache = AnswerCache()
+agent = StudentQueryAgent(api_key="test-key", api_url=server.url, cache=cache)
+question = "What is a binary search tree?"
+
+
+async def collect(agent, question):
+    start = time.perf_counter()
+    events, arrivals = [], []
+    async for event in agent.stream_answer_async("student_001", question):
+        events.append(event)
+        arrivals.append(time.perf_counter() - start)
+    return events, arrivals
+
+
+events, arrivals = asyncio.run(collect(agent, question))
+tokens = [e["token"] for e in events if "token" in e]
+done = events[-1]
+
+print("Tokens:", tokens)
+print(f"First token after {arrivals[0] * 1000:.0f} ms, done after {arrivals[-1] * 1000:.0f} ms")
+
+# Tokens arrive one by one and add up to the full answer
+assert len(tokens) == len(f"Stub answer to: {question}".split())
+assert arrivals[0] < arrivals[-1] / 2
+assert done["done"] and done["answer"] == "".join(tokens) == f"Stub answer to: {question}"
+
+# The finished answer is cached and replayed as a single token
+requests_before = server.requests
+events, _ = asyncio.run(collect(agent, question))
+assert [e["token"] for e in events if "token" in e] == [done["answer"]]
+assert server.requests == requests_before
+
+# Answers in the persistent tier only are replayed too, without upstream
+
+
+class DictStore:
+    def __init__(self, answers):
+        self.answers = answers
+
+    def get(self, key):
+        return self.answers.get(key)
+
+    def set(self, key, answer, ttl):
+        self.answers[key] = answer
+
+
+stored = AnswerCache(store=DictStore({"what is a heap": "A tree-shaped priority queue."}))
+stored_agent = StudentQueryAgent(api_key="test-key", api_url=server.url, cache=stored)
+events, _ = asyncio.run(collect(stored_agent, "What is a heap?"))
+assert [e["token"] for e in events if "token" in e] == ["A tree-shaped priority queue."]
+assert server.requests == requests_before
+assert stored.stats["persistent_hits"] == 1 and stored.get("What is a heap?") is not None
+
+# An upstream error streams the unavailable message
+server.status = 503
+events, _ = asyncio.run(collect(agent, "Another question?"))
+print("Error stream:", events)
+assert events[-1]["answer"] == UNAVAILABLE_ANSWER
+assert cache.get("Another question?") is None
+
+server.stop()
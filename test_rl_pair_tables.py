@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import numpy as np
+
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+
+agent = AdaptiveQuizAgent()
+agent.epsilon = 0.0
+
+# Two students on the same skill learn different policies
+for _ in range(5):
+    agent.update_policy("student_a", 0.2, 0.5, 0.3, skill_id="java")
+    agent.update_policy("student_b", 0.2, 0.1, -0.1, skill_id="java")
+
+print("student_a:", agent.select_action("student_a", 0.2, skill_id="java"))
+print("student_b LOW row:", agent.pair_q["student_b", "java"][0])
+assert agent.pair_q["student_a", "java"][0].max() > 0
+assert agent.pair_q["student_b", "java"][0].max() <= 0
+
+# Pairs without their own table act on the shared prior
+print("Prior:", agent.q_table)
+assert agent.select_action("student_c", 0.2, skill_id="java")["action"] == \
+    agent.select_action("student_c", 0.2)["action"]
+
+# Batch updates match the scalar path exactly
+rng = np.random.default_rng(0)
+n = 2_000
+students = [f"student_{i}" for i in rng.integers(0, 50, n)]
+skills = [f"skill_{i}" for i in rng.integers(0, 5, n)]
+before = rng.random(n)
+after = np.clip(before + rng.normal(0, 0.1, n), 0, 1)
+rewards = after - before
+
+scalar = AdaptiveQuizAgent()
+for s, k, b, a, r in zip(students, skills, before.tolist(), after.tolist(), rewards.tolist()):
+    scalar.update_policy(s, b, a, r, skill_id=k)
+
+batch = AdaptiveQuizAgent()
+batch.update_policy_batch(students, before, after, rewards, skill_ids=skills)
+
+identical = np.array_equal(scalar.prior, batch.prior) and all(
+    np.array_equal(scalar.pair_q[key], batch.pair_q[key]) for key in scalar.pair_q
+)
+print("Batch == scalar:", identical, "| pairs:", len(batch.pair_q))
+assert identical and len(batch.pair_q) == len(scalar.pair_q)
+
+decisions = batch.select_action_batch(students[:5], before[:5], skill_ids=skills[:5])
+print("Batch decisions:", decisions["action"])
+assert len(decisions["action"]) == 5
+
+# Q-values take 36 bytes per pair in float32
+per_pair = batch.pair_q.values[0, 0].nbytes
+print("Bytes per (student, skill) table:", per_pair)
+assert per_pair == 36
+
+# Snapshots round-trip
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "q_tables.npz")
+    batch.snapshot(path)
+    restored = AdaptiveQuizAgent()
+    assert restored.load_snapshot(path)
+    assert np.array_equal(restored.prior, batch.prior)
+    assert len(restored.pair_q) == len(batch.pair_q)
+    assert all(np.array_equal(restored.pair_q[key], batch.pair_q[key]) for key in batch.pair_q)
+    print("Snapshot restored:", len(restored.pair_q), "pairs")
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.rl_trainer import SimulatedTrainer, history_transitions, replay
+
+# Simulated students: the policy converges to level-matched difficulty
+trainer = SimulatedTrainer(n_students=2000, steps=10, seed=0)
+report = trainer.train(30)
+
+print("Student-episodes/s:", report["student_episodes_per_second"])
+print("Curve (first, last):", report["curve"][0], report["curve"][-1])
+print("Policy:", report["policy"])
+
+assert report["policy"]["LOW"] == "EASY"
+assert report["policy"]["MEDIUM"] == "MEDIUM"
+assert report["curve"][-1]["q_change"] < report["curve"][0]["q_change"]
+
+# The trained table exports to a snapshot the app can serve
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "q_tables.npz")
+    trainer.agent.snapshot(path)
+    served = AdaptiveQuizAgent()
+    served.epsilon = 0.0
+    served.load_snapshot(path)
+    assert served.select_action("student_001", 0.1)["action"] == "EASY"
+
+# Logged history replays with the actions that were actually served
+docs = [
+    {"student_id": "s1", "skill_id": "java", "mastery": {"mastery": 0.20}, "quiz_action": "HARD"},
+    {"student_id": "s1", "skill_id": "java", "mastery": {"mastery": 0.35}, "quiz_action": "MEDIUM"},
+    {"student_id": "s1", "skill_id": "java", "mastery": None, "quiz_action": None},
+    {"student_id": "s1", "skill_id": "java", "mastery": 0.50, "quiz_action": None},
+    {"student_id": "s2", "skill_id": "java", "mastery": {"mastery": 0.60}, "quiz_action": "EASY"},
+]
+transitions = history_transitions(docs)
+print("Transitions:", transitions)
+assert transitions["actions"] == ["HARD", "MEDIUM"]
+assert transitions["mastery_after"] == [0.35, 0.50]
+
+agent = AdaptiveQuizAgent()
+replay(agent, transitions)
+table = agent.pair_q["s1", "java"]
+print("Replayed s1/java table:", table.tolist())
+# LOW -> HARD and MEDIUM -> MEDIUM were credited, not the max-Q guess
+assert table[0, 2] > 0 and table[0, 0] == 0
+assert table[1, 1] > 0
@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.shared_state import SharedRegion, SharedStateFullError
+from agents.state_log import StateLog
+
+# Slow learning, so that every number of updates gives another value
+SLOW = {"fractions": {"p_init": 0.2, "p_learn": 0.0, "p_guess": 0.5, "p_slip": 0.499}}
+ALPHA = 0.001
+
+# A worker process: hammers one pair shared by all workers, plus pairs
+# of its own
+WORKER = f"""
+import sys
+
+from agents.bkt_agent import BKTEngine
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.shared_state import SharedRegion
+
+directory, worker, n = sys.argv[1], sys.argv[2], int(sys.argv[3])
+region = SharedRegion(directory, students=1000, skills=8)
+bkt = BKTEngine(shared=region, params={SLOW!r})
+quiz = AdaptiveQuizAgent(shared=region)
+quiz.alpha = {ALPHA!r}
+for i in range(n):
+    bkt.update_skill("student_shared", "fractions", True)
+    bkt.update_skill(f"student_{{worker}}_{{i % 50}}", f"skill_{{i % 5}}", i % 3 == 0)
+    quiz.update_policy("student_shared", 0.2, 0.5, 0.3, skill_id="fractions", action="HARD")
+"""
+
+N_WORKERS, N_UPDATES = 3, 300
+root = os.path.dirname(os.path.abspath(__file__))
+
+with tempfile.TemporaryDirectory() as tmp:
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER, tmp, str(w), str(N_UPDATES)],
+            cwd=root,
+            env={**os.environ, "PYTHONPATH": root},
+        )
+        for w in range(N_WORKERS)
+    ]
+    assert all(worker.wait() == 0 for worker in workers)
+
+    # Another process (this one) sees every worker's writes
+    region = SharedRegion(tmp, students=1000, skills=8)
+    assert not region.created
+    bkt = BKTEngine(shared=region)
+    quiz = AdaptiveQuizAgent(shared=region)
+
+    # The same update applied N times in any interleaving gives one
+    # result: a lost update would show
+    reference_bkt = BKTEngine(params=SLOW)
+    reference_quiz = AdaptiveQuizAgent()
+    reference_quiz.alpha = ALPHA
+    for _ in range(N_WORKERS * N_UPDATES):
+        reference_bkt.update_skill("student_shared", "fractions", True)
+        reference_quiz.update_policy("student_shared", 0.2, 0.5, 0.3, skill_id="fractions", action="HARD")
+
+    shared_mastery = bkt.get_mastery("student_shared", "fractions")
+    print("Shared pair mastery:", shared_mastery)
+    assert shared_mastery == reference_bkt.get_mastery("student_shared", "fractions")
+    assert np.array_equal(quiz.pair_q["student_shared", "fractions"], reference_quiz.pair_q["student_shared", "fractions"])
+    assert np.array_equal(quiz.prior, reference_quiz.prior)
+
+    # Each worker's own pairs, updated by that worker alone
+    for w in range(N_WORKERS):
+        own = BKTEngine()
+        for i in range(N_UPDATES):
+            own.update_skill(f"student_{w}_{i % 50}", f"skill_{i % 5}", i % 3 == 0)
+        assert all(bkt.get_mastery(*key) == own.get_mastery(*key) for key in own.knowledge_state)
+
+    print("BKT pairs:", len(bkt.knowledge_state), "| Q-tables:", len(quiz.pair_q))
+    assert len(bkt.knowledge_state) == 1 + N_WORKERS * 50
+    assert len(quiz.pair_q) == 1
+    # Sizes are counted by the writers, not by scanning the arrays
+    assert all(len(shard) == shard._scan_size() for shard in bkt.knowledge_state.shards)
+    assert sorted(quiz.pair_q.skill_ids) == ["fractions"]
+
+    # Snapshots outlive the region: two processes' StateLogs over one
+    # directory write one snapshot between them, and a new region (e.g.
+    # after a reboot cleared tmpfs) is recovered from it
+    state_dir = os.path.join(tmp, "state")
+    logs = [StateLog(state_dir, checkpoint_interval=60, shared=True) for _ in range(2)]
+    for log in logs:
+        log.register(bkt)
+        log.register(quiz)
+    assert logs[0].checkpoint(min_age=30) is not None
+    assert logs[1].checkpoint(min_age=30) is None
+    for log in logs:
+        log.close()
+    assert len(os.listdir(state_dir)) == 3  # snapshot, empty segment, lock file
+
+    fresh = SharedRegion(os.path.join(tmp, "rebooted"), students=1000, skills=8)
+    recovered_bkt = BKTEngine(shared=fresh)
+    recovered_quiz = AdaptiveQuizAgent(shared=fresh)
+    log = StateLog(state_dir, shared=True)
+    log.register(recovered_bkt)
+    log.register(recovered_quiz)
+    assert fresh.created and log.recover() == 0
+    assert all(recovered_bkt.get_mastery(*key) == bkt.get_mastery(*key) for key in bkt.knowledge_state)
+    assert len(recovered_bkt.knowledge_state) == len(bkt.knowledge_state)
+    assert np.array_equal(recovered_quiz.pair_q["student_shared", "fractions"], quiz.pair_q["student_shared", "fractions"])
+    assert np.array_equal(recovered_quiz.prior, quiz.prior)
+    print("Recovered from snapshot:", len(recovered_bkt.knowledge_state), "BKT pairs")
+
+    # Capacity is fixed
+    small = SharedRegion(os.path.join(tmp, "small"), students=2, skills=2).pair_store("tiny")
+    small["a", "x"] = 0.1
+    small["b", "x"] = 0.2
+    try:
+        small["c", "x"] = 0.3
+        raise AssertionError("expected SharedStateFullError")
+    except SharedStateFullError as e:
+        print("Full:", e)
+    assert dict(small.items()) == {("a", "x"): 0.1, ("b", "x"): 0.2}
+    small["a", "y"] = 0.4
+    assert len(small) == 3
+    assert small.drop_student("a") == 2 and len(small) == 1
+    del small["b", "x"]
+    assert len(small) == 0 == small._scan_size()
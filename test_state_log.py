@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+import numpy as np
+
+from agents.bkt_agent import BKTEngine
+from agents.rl_quiz_agent import AdaptiveQuizAgent
+from agents.state_log import StateLog
+
+
+def open_state(directory, n_shards=16):
+    log = StateLog(directory)
+    bkt = BKTEngine(log=log, n_shards=n_shards)
+    quiz = AdaptiveQuizAgent(log=log)
+    log.register(bkt)
+    log.register(quiz)
+    return log, bkt, quiz
+
+
+def same_state(bkt_a, quiz_a, bkt_b, quiz_b) -> bool:
+    return (
+        dict(bkt_a.knowledge_state.items()) == dict(bkt_b.knowledge_state.items())
+        and np.array_equal(quiz_a.prior, quiz_b.prior)
+        and set(quiz_a.pair_q) == set(quiz_b.pair_q)
+        and all(np.array_equal(quiz_a.pair_q[key], quiz_b.pair_q[key]) for key in quiz_a.pair_q)
+    )
+
+
+rng = np.random.default_rng(0)
+
+
+def activity(bkt, quiz, n):
+    students = [f"student_{i}" for i in rng.integers(0, 40, n)]
+    skills = [f"skill_{i}" for i in rng.integers(0, 5, n)]
+    correct = rng.random(n) < 0.6
+    before = rng.random(n)
+    after = np.clip(before + rng.normal(0, 0.1, n), 0, 1)
+
+    bkt.initialize_skill(students[0], "skill_new")
+    for s, k, c in zip(students[:n // 2], skills, correct.tolist()):
+        bkt.update_skill(s, k, c)
+    bkt.update_batch(students[n // 2:], skills[n // 2:], correct[n // 2:])
+
+    for s, k, b, a in zip(students[:n // 2], skills, before.tolist(), after.tolist()):
+        quiz.update_policy(s, b, a, a - b, skill_id=k, action="HARD")
+    quiz.update_policy("student_0", 0.2, 0.5, 0.3)
+    quiz.update_policy_batch(students[n // 2:], before[n // 2:], after[n // 2:], (after - before)[n // 2:], skill_ids=skills[n // 2:])
+    quiz.update_policy_batch(students[:10], before[:10], after[:10], (after - before)[:10])
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    log, bkt, quiz = open_state(tmp)
+    assert log.recover() == 0
+
+    activity(bkt, quiz, 400)
+    log.checkpoint()
+    activity(bkt, quiz, 100)
+    since = log.pending
+    print("Records since the checkpoint:", since)
+
+    # Crash: no close(), and the last write was torn
+    with open(os.path.join(tmp, f"events-{log.segment:08d}.log"), "a") as f:
+        f.write('["bkt","student_1","skill_0",tr')
+
+    log2, bkt2, quiz2 = open_state(tmp)
+    replayed = log2.recover()
+    print("Replayed:", replayed)
+    assert replayed == since
+    assert same_state(bkt, quiz, bkt2, quiz2)
+
+    # The snapshot is mapped, not read
+    assert isinstance(quiz2.pair_q.values, np.memmap)
+    assert any(isinstance(shard.values, np.memmap) for shard in bkt2.knowledge_state.shards)
+
+    # Keeps working from the recovered state; close() checkpoints
+    bkt.update_skill("student_1", "skill_0", True)
+    bkt2.update_skill("student_1", "skill_0", True)
+    quiz.update_policy("student_1", 0.2, 0.4, 0.2, skill_id="skill_0")
+    quiz2.update_policy("student_1", 0.2, 0.4, 0.2, skill_id="skill_0")
+    log2.close()
+
+    log3, bkt3, quiz3 = open_state(tmp, n_shards=4)
+    assert log3.recover() == 0
+    assert same_state(bkt, quiz, bkt3, quiz3)
+
+    files = sorted(os.listdir(tmp))
+    print("After checkpoints:", files)
+    assert len([f for f in files if f.startswith("snapshot-")]) == 1
+    print("Recovered after close, with another shard count")
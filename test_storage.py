@@ -0,0 +1,169 @@
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from database.memory_storage import MemoryStorage
+from database.models import attempt_document, bkt_state_document
+from database import sqlite_storage
+from database.sqlite_storage import SQLiteStorage
+from database.storage import create_storage
+from database.trends import learning_gain
+
+start = datetime(2026, 1, 1)
+workdir = tempfile.mkdtemp()
+
+
+def history_doc(student_id, skill_id, minute, mastery):
+    return {
+        "student_id": student_id,
+        "skill_id": skill_id,
+        "question": f"Question {minute}",
+        "answer": {"answer": "..."},
+        "is_correct": True,
+        "mastery": {"mastery": mastery},
+        "quiz_action": "MEDIUM",
+        "timestamp": start + timedelta(minutes=minute),
+    }
+
+
+def check(storage):
+    print(f"--- {storage.name} ---")
+
+    # History: inserted out of order, read back in time order, paged by cursor
+    for minute in [3, 0, 4, 1, 2]:
+        storage.insert_history(history_doc("student_001", "fractions", minute, 0.2 + 0.1 * minute))
+    storage.insert_history(history_doc("student_001", "decimals", 5, 0.5))
+    storage.insert_history(history_doc("student_002", "fractions", 0, 0.9))
+
+    page = storage.history_page("student_001", skill_id="fractions", limit=2)
+    print("First page:", [r["question"] for r in page["history"]])
+    assert [r["question"] for r in page["history"]] == ["Question 0", "Question 1"]
+    assert "_id" not in page["history"][0]
+
+    cursor = page["next_cursor"]
+    storage.parse_cursor(cursor)
+    rest = storage.history_page("student_001", skill_id="fractions", after=cursor, limit=10)
+    assert [r["question"] for r in rest["history"]] == ["Question 2", "Question 3", "Question 4"]
+    assert rest["next_cursor"] is None
+    assert rest["history"][0]["timestamp"] == start + timedelta(minutes=2)
+
+    # Projection keeps the requested fields and the sort key
+    page = storage.history_page("student_001", fields=["quiz_action", "answer.answer"], limit=10)
+    print("Projected:", page["history"][0])
+    assert len(page["history"]) == 6
+    assert set(page["history"][0]) == {"quiz_action", "answer", "timestamp"}
+
+    lines = list(storage.iter_history_ndjson("student_001", after=cursor))
+    assert len(lines) == 4 and lines[0].endswith("\n")
+
+    try:
+        storage.parse_cursor("not-a-cursor")
+        raise AssertionError("malformed cursor accepted")
+    except ValueError:
+        pass
+
+    # Curves: raw points, then downsampled
+    curve = storage.mastery_curve("student_001", "fractions")
+    print("Curve:", [round(p["mastery"], 2) for p in curve])
+    assert [round(p["mastery"], 2) for p in curve] == [0.2, 0.3, 0.4, 0.5, 0.6]
+    assert len(storage.mastery_curve("student_001", "fractions", max_points=3, method="lttb")) == 3
+    assert len(storage.mastery_curve("student_001", "fractions", bucket_seconds=120)) == 5
+    window = storage.mastery_curve(
+        "student_001", "fractions",
+        start=start + timedelta(minutes=1), end=start + timedelta(minutes=3)
+    )
+    assert len(window) == 3
+    # The same window with timezone-aware bounds (UTC+02:00)
+    plus_two = timezone(timedelta(hours=2))
+    window = storage.mastery_curve(
+        "student_001", "fractions",
+        start=datetime(2026, 1, 1, 2, 1, tzinfo=plus_two),
+        end=datetime(2026, 1, 1, 2, 3, tzinfo=plus_two)
+    )
+    assert len(window) == 3
+
+    transitions = list(storage.iter_mastery_history())
+    assert [(d["student_id"], d["skill_id"]) for d in transitions][:2] == [
+        ("student_001", "decimals"), ("student_001", "fractions")
+    ]
+    assert len(transitions) == 7
+
+    # BKT state upserts and attempts
+    storage.save_bkt_states([
+        bkt_state_document("student_001", "fractions", 0.4),
+        bkt_state_document("student_001", "decimals", 0.3),
+    ])
+    storage.save_bkt_states([bkt_state_document("student_001", "fractions", 0.7)])
+    states = storage.load_bkt_states("student_001")
+    print("BKT states:", states)
+    assert states == {"fractions": 0.7, "decimals": 0.3}
+    assert storage.load_bkt_states("student_999") == {}
+
+    storage.insert_attempts([
+        attempt_document("student_002", "fractions", True),
+        attempt_document("student_001", "fractions", False),
+        attempt_document("student_001", "fractions", True),
+    ])
+    attempts = list(storage.iter_attempts())
+    assert attempts == [
+        ("student_001", "fractions", False),
+        ("student_001", "fractions", True),
+        ("student_002", "fractions", True),
+    ]
+
+    # Trends: the aggregate before each sample is returned
+    assert storage.record_mastery("student_001", "fractions", 0.2) is None
+    previous = storage.record_mastery("student_001", "fractions", 0.5)
+    assert previous["count"] == 1
+    storage.record_mastery("student_001", "fractions", 0.8)
+    trend = storage.get_trend("student_001", "fractions")
+    print("Trend:", {k: trend[k] for k in ("count", "mean", "m2")})
+    assert trend["count"] == 3
+    assert abs(trend["mean"] - 0.5) < 1e-9
+    assert abs(trend["m2"] - 0.18) < 1e-9
+    assert abs(learning_gain(trend) - 0.6) < 1e-9
+    assert storage.get_trend("student_001", "decimals") is None
+
+
+check(MemoryStorage())
+check(SQLiteStorage(":memory:"))
+
+path = os.path.join(workdir, "learning.db")
+sqlite = create_storage("sqlite", path=path)
+check(sqlite)
+
+# Answer cache tier, honouring the TTL
+store = sqlite.answer_store()
+store.set("what is java", "A language", ttl=60)
+store.set("what is hadoop", "A framework", ttl=-1)
+assert store.get("what is java") == "A language"
+assert store.get("what is hadoop") is None
+sqlite.close()
+
+# Everything survives a reopen of the file
+reopened = SQLiteStorage(path)
+print("Reopened BKT states:", reopened.load_bkt_states("student_001"))
+assert reopened.load_bkt_states("student_001") == {"fractions": 0.7, "decimals": 0.3}
+assert reopened.get_trend("student_001", "fractions")["count"] == 3
+assert reopened.answer_store().get("what is java") == "A language"
+reopened.close()
+
+# SQLite iterators read in keyset chunks: chunk boundaries inside runs of
+# the same student, skill and timestamp lose or repeat nothing
+sqlite_storage.CHUNK_SIZE = 3
+chunked = SQLiteStorage(":memory:")
+chunked.insert_attempts([
+    {"student_id": f"student_{i % 3}", "skill_id": f"skill_{i % 2}", "is_correct": i % 5 == 0,
+     "timestamp": start + timedelta(minutes=i // 4)}
+    for i in range(40)
+])
+for i in range(20):
+    chunked.insert_history(history_doc(f"student_{i % 2}", "fractions", i // 3, i / 20))
+attempts = list(chunked.iter_attempts())
+transitions = list(chunked.iter_mastery_history())
+sqlite_storage.CHUNK_SIZE = 500
+assert attempts == list(chunked.iter_attempts())
+assert transitions == list(chunked.iter_mastery_history())
+print("Chunked:", len(attempts), "attempts,", len(transitions), "transitions")
+assert len(attempts) == 40 and len(transitions) == 20
+assert [t["mastery"]["mastery"] for t in transitions[:10]] == [i / 20 for i in range(0, 20, 2)]
@@ -0,0 +1,46 @@
+import asyncio
+
+from agents.student_query_agent import StudentQueryAgent, UNAVAILABLE_ANSWER
+from benchmarks.stub_llm_server import StubLLMServer
+
+server = StubLLMServer(delay=0.05).start()
+
+agent = StudentQueryAgent(api_key="test-key", api_url=server.url, max_concurrency=4)
+questions = [f"What is topic {i}?" for i in range(20)]
+
+
+async def ask_all():
+    results = await asyncio.gather(*(
+        agent.answer_question_async("student_001", q) for q in questions
+    ))
+    await agent.aclose()
+    return results
+
+
+results = asyncio.run(ask_all())
+
+print("Answers routed correctly:", all(
+    r["answer"] == f"Stub answer to: {q}" for r, q in zip(results, questions)
+))
+print("Upstream requests:", server.requests)
+print("Max in flight:", server.max_in_flight, "| connections opened:", server.connections)
+
+assert all(r["answer"] == f"Stub answer to: {q}" for r, q in zip(results, questions))
+assert server.max_in_flight <= 4
+assert server.connections <= 4
+
+# Sync path reuses its keep-alive session
+connections_before = server.connections
+for q in questions[:3]:
+    assert agent.answer_question("student_001", q)["answer"] == f"Stub answer to: {q}"
+print("Sync connections opened:", server.connections - connections_before)
+assert server.connections - connections_before == 1
+
+# A slow upstream hits the timeout and degrades to the unavailable message
+server.delay = 0.5
+slow_agent = StudentQueryAgent(api_key="test-key", api_url=server.url, timeout=0.1)
+result = asyncio.run(slow_agent.answer_question_async("student_001", "Slow question?"))
+print("Timed-out answer:", result["answer"])
+assert result["answer"] == UNAVAILABLE_ANSWER
+
+server.stop()
@@ -0,0 +1,69 @@
+import os
+import uuid
+
+import numpy as np
+
+from database.memory_storage import MemoryStorage
+from database.sqlite_storage import SQLiteStorage
+from database.trends import fold_mastery
+
+rng = np.random.default_rng(7)
+samples = rng.uniform(0.0, 1.0, 500).tolist()
+
+
+def check_against_recompute(aggregate, values):
+    # Welford's running values match a full pass over the samples
+    assert aggregate["count"] == len(values)
+    assert aggregate["initial_mastery"] == values[0]
+    assert aggregate["latest_mastery"] == values[-1]
+    assert abs(aggregate["mean"] - np.mean(values)) < 1e-12
+    assert abs(aggregate["m2"] / aggregate["count"] - np.var(values)) < 1e-12
+
+
+# Folded in the application, one sample at a time
+aggregate = None
+for i, mastery in enumerate(samples):
+    aggregate = fold_mastery(aggregate, mastery)
+    if i in (0, 1, 10, 499):
+        check_against_recompute(aggregate, samples[:i + 1])
+print("Welford after 500 samples:", {k: round(aggregate[k], 6) for k in ("count", "mean", "m2")})
+
+# Through the storage backends, with the aggregate before each sample returned
+for storage in (MemoryStorage(), SQLiteStorage(":memory:")):
+    for i, mastery in enumerate(samples):
+        previous = storage.record_mastery("student_001", "fractions", mastery)
+        if i == 0:
+            assert previous is None
+        else:
+            assert previous["count"] == i
+    check_against_recompute(storage.get_trend("student_001", "fractions"), samples)
+    print(storage.name, "trend OK")
+
+# Backfill runs server-side in MongoDB: only checked with one configured
+mongo_uri = os.getenv("MONGO_URI")
+if not mongo_uri:
+    print("MONGO_URI not set, backfill not checked")
+else:
+    from pymongo import MongoClient
+
+    from database.trends import backfill, get_trend, record_mastery
+
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    db = client[f"test_trends_{uuid.uuid4().hex[:8]}"]
+    try:
+        db.learning_history.insert_many([
+            {"student_id": "student_001", "skill_id": "fractions", "mastery": {"mastery": m}, "timestamp": i}
+            for i, m in enumerate(samples)
+        ])
+        for mastery in samples:
+            record_mastery(db.learning_trends, "student_002", "fractions", mastery)
+
+        # Twice: the second run replaces the aggregate instead of adding to it
+        assert backfill(db.learning_history, db.learning_trends) == 2
+        assert backfill(db.learning_history, db.learning_trends) == 2
+        backfilled = get_trend(db.learning_trends, "student_001", "fractions")
+        check_against_recompute(backfilled, samples)
+        check_against_recompute(get_trend(db.learning_trends, "student_002", "fractions"), samples)
+        print("Backfill OK:", backfilled["count"])
+    finally:
+        client.drop_database(db.name)
@@ -0,0 +1,97 @@
+import time
+
+from database.models import attempt_document, bkt_state_document
+from database.write_behind import WriteBehindWriter
+
+
+class RecordingStorage:
+    """Storage stand-in that records the bulk calls it receives."""
+
+    def __init__(self):
+        self.bulk_writes = []
+        self.inserts = []
+
+    def save_bkt_states(self, docs):
+        self.bulk_writes.append(list(docs))
+
+    def insert_attempts(self, docs):
+        self.inserts.append(list(docs))
+
+
+storage = RecordingStorage()
+writer = WriteBehindWriter(storage, max_batch=50, flush_interval=60)
+writer.start()
+
+# Repeated upserts for one pair are coalesced into a single write
+for mastery in (0.3, 0.5, 0.7):
+    writer.enqueue_state(bkt_state_document("student_001", "fractions", mastery))
+    writer.enqueue_attempt(attempt_document("student_001", "fractions", True))
+
+print("Pending before close:", writer.pending())
+assert storage.bulk_writes == [] and storage.inserts == []
+
+writer.close()
+print("State bulk writes:", [len(batch) for batch in storage.bulk_writes])
+print("Attempt inserts:", [len(batch) for batch in storage.inserts])
+assert [len(batch) for batch in storage.bulk_writes] == [1]
+assert storage.bulk_writes[0][0]["mastery"] == 0.7
+assert [len(batch) for batch in storage.inserts] == [3]
+
+# Reaching max_batch wakes the flush thread without waiting for the interval
+storage.inserts.clear()
+writer.start()
+for i in range(50):
+    writer.enqueue_attempt(attempt_document(f"student_{i:03d}", "fractions", False))
+
+deadline = time.time() + 5
+while not storage.inserts and time.time() < deadline:
+    time.sleep(0.01)
+
+writer.close()
+print("Size-triggered flush:", [len(batch) for batch in storage.inserts])
+assert sum(len(batch) for batch in storage.inserts) == 50
+
+# A storage outage keeps at most max_pending documents buffered, dropping
+# the oldest attempts first, and a retry stops at the first failed batch
+class FailingStorage(RecordingStorage):
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+        self.calls = 0
+
+    def save_bkt_states(self, docs):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("storage down")
+        super().save_bkt_states(docs)
+
+    def insert_attempts(self, docs):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("storage down")
+        super().insert_attempts(docs)
+
+
+storage = FailingStorage()
+writer = WriteBehindWriter(storage, max_batch=10, flush_interval=60, max_pending=40)
+for i in range(30):
+    writer.enqueue_state(bkt_state_document(f"student_{i % 3}", f"skill_{i}", 0.5))
+for i in range(30):
+    writer.enqueue_attempt(attempt_document("student_0", f"skill_{i}", True))
+
+assert not writer.flush()
+print("Calls per failed flush:", storage.calls, "pending:", writer.pending(), "dropped:", writer.dropped)
+assert storage.calls == 2
+assert writer.pending() == 40 and writer.dropped == 20
+
+# Pending states are looked up per student, and survive the failed flush
+pending = writer.pending_states("student_1")
+assert len(pending) == 10 and all(skill.startswith("skill_") for skill in pending)
+assert writer.pending_states("student_404") == {}
+
+storage.failing = False
+assert writer.flush()
+print("Recovered writes:", [len(b) for b in storage.bulk_writes], [len(b) for b in storage.inserts])
+assert sum(len(b) for b in storage.bulk_writes) == 30
+assert [a["skill_id"] for b in storage.inserts for a in b] == [f"skill_{i}" for i in range(20, 30)]
+assert writer.pending() == 0 and writer.pending_states("student_1") == {}